@@ -0,0 +1,151 @@
+"""
+Crash recovery of measurements (see mcap_recover) in the background, while the controller is already serving requests.
+
+Measurements are recovered in a process pool (one measurement per task, at most one worker per CPU). Only the
+measurements existing when recovery starts are checked: a measurement started afterward is never touched.
+Progress is shown as a busy job on the WebGUI.
+
+Finished measurements (meta data complete, no unfinalized mcap or spill files) are stored in a recovery index and are
+not scanned again on the next start.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, Future, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from vif.logger.logger import LoggerMixin
+from vif.data_interface.connection_manager import ConnectionManager
+from vif.jobs.job_entry import BusyJob
+
+from job_server import JobServer
+from mcap_recover import recover_measurement
+
+
+def _init_worker(log_level: int):
+    # spawned workers do not inherit the logging configuration
+    LoggerMixin.configure_logger(level=log_level)
+
+
+class BackgroundRecovery(LoggerMixin):
+    # the recovery index is written at most once per interval (and when recovery is done)
+    INDEX_SAVE_INTERVAL_S = 5.0
+
+    def __init__(self, *args, data_dir: Path, index_file: Path, job_server: JobServer, cm: ConnectionManager,
+                 db_id: str, max_workers: Optional[int] = None, **kwargs):
+        """
+        :param data_dir: directory containing the measurement directories
+        :param index_file: json file listing the names of finished measurements
+        :param max_workers: size of the process pool (default: number of CPUs)
+        """
+        super().__init__(*args, **kwargs)
+        self._data_dir = data_dir
+        self._index_file = index_file
+        self._job_server = job_server
+        self._busy_job = BusyJob(cm, db_id).set_name('Recovery')
+        self._max_workers = max_workers if max_workers is not None else (os.cpu_count() or 1)
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        Lists the measurements to check and starts recovery in the background.
+        """
+        try:
+            finished = self._load_index()
+            existing = {d.name for d in self._data_dir.iterdir() if d.is_dir()}
+        except Exception as e:
+            self.logger.error(f'EX start ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+            return
+        # forget deleted measurements
+        finished &= existing
+        pending = sorted(existing - finished)
+        self.logger.info('recovery: %d measurements to check, %d finished', len(pending), len(finished))
+        if len(pending) == 0:
+            self._save_index(finished)
+            return
+
+        self._thread = threading.Thread(target=self._run, args=(pending, finished), name='background_recovery')
+        self._thread.start()
+
+    def stop(self):
+        """
+        Cancels pending measurements and waits for the running ones (mcap recover cannot be interrupted).
+        """
+        self._stop_event.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self, pending: List[str], finished: Set[str]):
+        time_start = time.time()
+        num_workers = min(self._max_workers, len(pending))
+        num_done = 0
+        num_failed = 0
+        last_save = time.monotonic()
+        self._update_job(num_done, len(pending))
+
+        # spawn: the controller process runs threads and zmq sockets which must not be forked
+        executor = ProcessPoolExecutor(max_workers=num_workers, mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=_init_worker, initargs=(logging.getLogger().level,))
+        try:
+            futures: Dict[Future, str] = {executor.submit(recover_measurement, self._data_dir / name): name
+                                          for name in pending}
+            for future in as_completed(futures):
+                if self._stop_event.is_set():
+                    break
+                num_done += 1
+                try:
+                    if future.result():
+                        finished.add(futures[future])
+                    else:
+                        num_failed += 1
+                except Exception as e:
+                    num_failed += 1
+                    self.logger.error(f'EX recovery {futures[future]} ({type(e).__name__}): {e}')
+                self._update_job(num_done, len(pending))
+
+                if time.monotonic() - last_save > self.INDEX_SAVE_INTERVAL_S:
+                    self._save_index(finished)
+                    last_save = time.monotonic()
+        except Exception as e:
+            self.logger.error(f'EX _run ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self._save_index(finished)
+            self._busy_job.set_done()
+            self._job_server.update()
+
+        self.logger.info('recovery: checked %d of %d measurements in %.1f s (%d not finished)',
+                         num_done, len(pending), time.time() - time_start, num_failed)
+
+    def _update_job(self, num_done: int, num_total: int):
+        self._busy_job.set_description(f'{num_done} / {num_total} measurements checked')
+        if self._busy_job.get_id() == -1:
+            self._job_server.add(self._busy_job)
+        self._job_server.update()
+
+    def _load_index(self) -> Set[str]:
+        if not self._index_file.is_file():
+            return set()
+        try:
+            with self._index_file.open('r') as f:
+                return set(json.load(f)['finished'])
+        except Exception as e:
+            self.logger.error(f'loading recovery index failed ({type(e).__name__}): {e}')
+            return set()
+
+    def _save_index(self, finished: Set[str]):
+        try:
+            # write a temporary file and replace: the index is never left incomplete
+            tmp_file = self._index_file.with_suffix('.tmp')
+            with tmp_file.open('w') as f:
+                json.dump({'finished': sorted(finished)}, f, indent=2)
+            tmp_file.replace(self._index_file)
+        except Exception as e:
+            self.logger.error(f'saving recovery index failed ({type(e).__name__}): {e}')
@@ -6,15 +6,14 @@ Also manages GUI messages with the help of the JobServer class.
 import json
 import logging
 import os
-import queue
 import signal
 import socket
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from functools import partial
 from io import IOBase
 import traceback
+from collections import OrderedDict
 from pathlib import Path
 from datetime import datetime, timezone
 from typing import Dict, Tuple, Callable, List, Optional
@@ -26,8 +25,8 @@ from vif.logger.logger import LoggerMixin, log_reentrant
 from vif.file_helpers.creation import create_directory
 from vif.file_helpers.filename import get_valid_filename
 from vif.data_interface.connection_manager import ConnectionManager, Key
-from vif.asyncio_helpers.asyncio_helpers import tick_generator
 from vif.jobs.job_entry import StateJob, EventJob, LogJob
+from vif.scheduler.timer_queue import TimerQueue, TimerHandle
 from vif.zmq.helpers import create_bind
 from vif.data_interface.network_messages import (Reply, MeasurementState, ModuleRegistryQuery,
                                                  ModuleRegistryReply, Module, SystemControlQuery, SystemControlReply,
@@ -39,7 +38,7 @@ from vif.plot_juggler.plot_juggler_writer import PlotJugglerWriter
 
 from meta_handler import MetaHandler
 from job_server import JobServer
-from mcap_recover import recover_unfinalized_mcaps, fix_unfinished_measurements_meta
+from background_recovery import BackgroundRecovery
 
 
 @environ.config(prefix='')
@@ -62,6 +61,9 @@ class Messages:
 
 
 class Controller(LoggerMixin):
+    # presence heartbeats of a removed module are ignored for this time (see _cb_sub_presence)
+    PRESENCE_TOMBSTONE_S = 2.0
+
     def __init__(self, cfg: ControllerEnv, shutdown_ev: threading.Event):
         super().__init__()
 
@@ -112,7 +114,7 @@ class Controller(LoggerMixin):
         self._cm: ConnectionManager = ConnectionManager(router_hostname=cfg.DB_ROUTER,
                                                         db_id=self._db_id, node_name='c',
                                                         shutdown_event=shutdown_ev,
-                                                        max_parallel_req=5,  # diminishing returns for more than ~3
+                                                        max_parallel_req=1,  # requests are multiplexed, no limit
                                                         # TODO how many? create dynamically with num. modules .. or s/t
                                                         max_parallel_queryables=10)
         self._cm.set_external_databeams(list(self._db_id_hostnames.keys()), list(self._db_id_hostnames.values()))
@@ -126,12 +128,16 @@ class Controller(LoggerMixin):
         self._register_lock: threading.Lock = threading.Lock()
         # module registry: name: module
         self._module_registry: Dict[str, Module] = {}
-        self._module_ts: Dict[str, float] = {}
+        # name: last seen (time.monotonic()), ordered by last seen (oldest first: expired modules are at the front)
+        self._module_ts: OrderedDict[str, float] = OrderedDict()
+        # name: time of removal (time.monotonic()): presence heartbeats are not ordered with the REMOVE request, a
+        # heartbeat published before the removal must not register the module again
+        self._module_removed_ts: Dict[str, float] = {}
         self._registry_watchdog: threading.Thread = threading.Thread(target=self._registry_timed_watchdog_worker,
                                                                      name='registry_watchdog')
 
-        self._async_cmd_queue: queue.Queue[Tuple[float, Callable[[], None]]] = queue.Queue()
-        self._async_cmd_thread = threading.Thread(target=self._async_cmd_worker, name='async_cmd_thread')
+        # deferred commands (see _add_async_cmd)
+        self._async_cmds: TimerQueue = TimerQueue(name='async_cmd_thread', logger_name='async_cmd_worker')
 
         self.meta_handler: MetaHandler = MetaHandler(config_dir=self._config_dir, hostname=self._hostname,
                                                      db_id=self._db_id, deploy_version=self._deploy_version)
@@ -145,6 +151,11 @@ class Controller(LoggerMixin):
         # create plot juggler writer
         self._plot_juggler_writer: PlotJugglerWriter = PlotJugglerWriter(self._data_dir)
 
+        self._recovery: BackgroundRecovery = BackgroundRecovery(data_dir=self._data_dir,
+                                                                index_file=self._config_dir / 'recovery_index.json',
+                                                                job_server=self._job_server, cm=self._cm,
+                                                                db_id=self._db_id)
+
     def log_gui(self, message: str, log_severity=logging.DEBUG) -> None:
         """
         Uses the JobServer to show a message on the WebGUI.
@@ -162,20 +173,23 @@ class Controller(LoggerMixin):
         Starts up the controller by setting up publishers for capturing/sampling and by
         registering callbacks for all receivable queries.
         """
-        self.logger.info('searching data directory for unfinished measurements')
-        recover_unfinalized_mcaps(self._data_dir)
-        fix_unfinished_measurements_meta(self._data_dir)
-
         self.logger.info('starting controller')
         try:
             self._job_server.start()
 
+            # recover unfinished measurements in the background (progress is shown as job)
+            self.logger.info('searching data directory for unfinished measurements')
+            self._recovery.start()
+
             # register all broadcasts / publishers
             for topic in self._pub_topics.values():
                 self._cm.declare_publisher(topic)
 
             self._registry_watchdog.start()
-            self._async_cmd_thread.start()
+            self._async_cmds.start()
+
+            # module presence heartbeats (see ModuleInterface.controller_watchdog)
+            self._cm.subscribe(Key(self._db_id, 'c', 'presence'), self._cb_sub_presence)
 
             # register all incoming queryables
             for key, cb in [(Key(self._db_id, 'c', 'module_registry'), self._cb_qry_module_registry),
@@ -211,9 +225,11 @@ class Controller(LoggerMixin):
             self.logger.debug('watchdog joined')
 
         # stop async cmd thread
-        if self._async_cmd_thread.is_alive():
-            self._async_cmd_thread.join()
-            self.logger.debug('async_cmd_thread joined')
+        self._async_cmds.stop()
+        self.logger.debug('async_cmd_thread joined')
+
+        # stop recovery of unfinished measurements
+        self._recovery.stop()
 
         # stop running measurement (if running)
         if self._state.state == MeasurementStateType.CAPTURING:
@@ -240,38 +256,37 @@ class Controller(LoggerMixin):
 
     def _registry_timed_watchdog_worker(self):
         """
-        Checks for every module if it sent a heartbeat in a certain time interval. If not,
-        it removes the module from its registry.
+        Removes modules from the registry which did not send a heartbeat within the timeout. Only the modules at the
+        front of the last-seen order are checked.
         """
         logger = logging.getLogger('registry_timed_watchdog')
         logger.info('thread started')
 
-        heartbeat_interval_s = 2.5
-        g = tick_generator(heartbeat_interval_s, drop_missed=True, time_source=time.time)
+        heartbeat_timeout_s = 2.5
+        check_interval_s = 0.5
 
         while not self._shutdown_event.is_set():
             #logger.debug("Check for inactive registered modules.")
 
             with self._register_lock:
                 # get current time
-                now = time.time()
+                now = time.monotonic()
 
                 # true if any module has been removed
                 any_module_removed = False
 
-                # remove modules based on last receive register time
-                for module, ts in self._module_ts.items():
-                    dt = now - ts
-
-                    if dt > heartbeat_interval_s:
-                        # remove module from registry
-                        logger.info('Removing %s from registry due to timeout', module)
-                        self._module_registry.pop(module)
-                        any_module_removed = True
+                # remove modules based on last heartbeat / register time (oldest first)
+                while len(self._module_ts) > 0:
+                    module, ts = next(iter(self._module_ts.items()))
+                    if now - ts <= heartbeat_timeout_s:
+                        break
+                    # remove module from registry
+                    logger.info('Removing %s from registry due to timeout', module)
+                    self._module_ts.popitem(last=False)
+                    self._module_registry.pop(module, None)
+                    any_module_removed = True
 
                 if any_module_removed:
-                    self._module_ts = {k: v for k, v in self._module_ts.items() if k in self._module_registry.keys()}
-
                     # inform REST-API that modules changed
                     event_job = EventJob(self._cm, self._db_id)
                     event_job.set_modules_changed(True).set_done()
@@ -279,45 +294,11 @@ class Controller(LoggerMixin):
                     self._job_server.update()
 
             # wait for timeout or killed thread
-            self._shutdown_event.wait(timeout=next(g))
-
-    def _add_async_cmd(self, cmd: Callable[[], None], timeout_s: float = 0):
-        # add command to async cmd queue with defined deadline in the future
-        self._async_cmd_queue.put((time.time() + timeout_s, cmd))
+            self._shutdown_event.wait(timeout=check_interval_s)
 
-    def _async_cmd_worker(self):
-        logger = logging.getLogger('async_cmd_worker')
-        logger.info('thread started')
-
-        cmds: List[Tuple[float, Callable[[], None]]] = []
-        next_deadline = float("inf")
-
-        while not self._shutdown_event.is_set():
-            try:
-                # limit wait time to max. 200ms and min. 10ms
-                wait_time = max(min(next_deadline - time.time(), 0.2), 0.01)
-                try:
-                    deadline, cmd = self._async_cmd_queue.get(timeout=wait_time)
-                    # add new command and sort list by deadline
-                    cmds.append((deadline, cmd))
-                    cmds.sort(key=lambda tup: tup[0], reverse=True)
-                except queue.Empty:
-                    if len(cmds) == 0:
-                        continue
-
-                now = time.time()
-                # iterate over reversed list and execute / pop commands with earliest deadline first
-                for index, c in reversed(list(enumerate(cmds))):
-                    deadline, cmd = c
-                    if deadline <= now:
-                        cmd()
-                        cmds.pop(index)
-                        next_deadline = float("inf")
-                    else:
-                        if deadline < next_deadline:
-                            next_deadline = deadline
-            except Exception as e:
-                logger.error(f'EX ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+    def _add_async_cmd(self, cmd: Callable[[], None], timeout_s: float = 0) -> TimerHandle:
+        # execute command on the async cmd thread after the timeout (the handle allows to cancel it)
+        return self._async_cmds.call_later(timeout_s, cmd)
 
     def _async_module_start_cmd(self, module_name):
         logger = logging.getLogger('_async_module_start_cmd')
@@ -348,6 +329,46 @@ class Controller(LoggerMixin):
         self._job_server.add(event_job)
         self._job_server.update()
 
+    def _register_module(self, module: Module, logger: logging.Logger) -> bool:
+        """
+        Registers a new module or refreshes the last-seen time of a known one (call with _register_lock held).
+        :return: True if the module was already registered
+        """
+        known = self._module_registry.get(module.name)
+        self._module_ts[module.name] = time.monotonic()
+        self._module_ts.move_to_end(module.name)
+        if known is not None and known.type == module.type:
+            return True
+
+        if known is None:
+            logger.info('Registering new module: %s (%s)', module.name, module.type)
+        else:
+            logger.info('Module %s changed type: %s -> %s', module.name, known.type, module.type)
+        self._module_registry[module.name] = module
+        self._add_async_cmd(self._async_module_list_changed, 0.01)
+        if known is None:
+            # on startup: check controller state and start sampling / capturing immediately
+            self._add_async_cmd(partial(self._async_module_start_cmd, module.name), 0.1)
+        return known is not None
+
+    def _cb_sub_presence(self, key: str, data: bytes):
+        """
+        Heartbeat of a module (REGISTER message published every second). Unknown modules are registered on first
+        sight, e.g. after a restart of the controller. Heartbeats of a module removed within the last
+        PRESENCE_TOMBSTONE_S are ignored (a registration request registers it again immediately).
+        """
+        try:
+            message = ModuleRegistryQuery.deserialize(data)
+            with self._register_lock:
+                removed_ts = self._module_removed_ts.get(message.module.name)
+                if removed_ts is not None:
+                    if time.monotonic() - removed_ts < self.PRESENCE_TOMBSTONE_S:
+                        return
+                    del self._module_removed_ts[message.module.name]
+                self._register_module(message.module, logging.getLogger('_cb_sub_presence'))
+        except Exception as e:
+            self.logger.error(f'_cb_sub_presence ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+
     def _cb_qry_module_registry(self, data: bytes) -> str | bytes:
         """
         Uses the ModuleRegistryQuery to perform following tasks upon query:
@@ -365,21 +386,10 @@ class Controller(LoggerMixin):
 
             with self._register_lock:
                 if message.cmd == ModuleRegistryQueryCmd.REGISTER:
-                    already_registered = message.module.name in self._module_registry
+                    self._module_removed_ts.pop(message.module.name, None)
+                    already_registered = self._register_module(message.module, logger)
 
                     if not already_registered:
-                        logger.info('rx: %s', message.serialize())
-                        logger.info('Registering new module: %s', message.module.name)
-
-                    # register (new) module
-                    self._module_registry[message.module.name] = message.module
-                    self._module_ts[message.module.name] = time.time()
-
-                    if not already_registered:
-                        self._add_async_cmd(self._async_module_list_changed, 0.01)
-                        # on startup: check controller state and start sampling / capturing immediately
-                        self._add_async_cmd(partial(self._async_module_start_cmd, message.module.name), 0.1)
-
                         # reply to module (error=False if module is newly registered)
                         return ModuleRegistryReply(status=Status(error=False)).serialize()
                     else:
@@ -391,9 +401,10 @@ class Controller(LoggerMixin):
 
                 elif message.cmd == ModuleRegistryQueryCmd.REMOVE:
                     logger.info('removing %s', message.module.name)
+                    self._module_removed_ts[message.module.name] = time.monotonic()
                     try:
                         self._module_registry.pop(message.module.name)
-                        self._module_ts.pop(message.module.name)
+                        self._module_ts.pop(message.module.name, None)
                         self._add_async_cmd(self._async_module_list_changed, 0.01)
                     except KeyError:
                         logger.warning(f'trying to remove unknown module {message.module.name}')
@@ -796,22 +807,16 @@ class Controller(LoggerMixin):
         if len(all_modules) == 0:
             return responses, all_modules
 
-        # send queries to each module
+        # send queries to all modules at once, one deadline for all replies
         logger.debug('cmd "%s" to %d modules', cmd, len(all_modules))
         t_start = time.time()
-        with ThreadPoolExecutor(max_workers=len(all_modules)) as executor:
-            future_to_module = {
-                executor.submit(self._cm.request, Key(self._db_id, f'm/{m}', cmd), payload, timeout):
-                    m for m in all_modules
-            }
-            for future in as_completed(future_to_module):
-                try:
-                    response = future.result()
-                    if response is not None and len(response) > 0:  # None --> timeout, b'' not supported
-                        responses[future_to_module[future]] = reply_cls.deserialize(response).get_dict()
-                except Exception as e:
-                    logger.warning(f'error from module "{future_to_module[future]}": ({type(e).__name__}): {e}\n'
-                                   f'{traceback.format_exc()}')
+        requests = {m: (Key(self._db_id, f'm/{m}', cmd), payload) for m in all_modules}
+        for m, response in self._cm.scatter_gather(requests, timeout):
+            try:
+                if response is not None and len(response) > 0:  # None --> timeout, b'' not supported
+                    responses[m] = reply_cls.deserialize(response).get_dict()
+            except Exception as e:
+                logger.warning(f'error from module "{m}": ({type(e).__name__}): {e}\n{traceback.format_exc()}')
 
         logger.debug('cmd "%s" took %.3fs - responses: %s', cmd, (time.time() - t_start), str(responses))
         # check if all registered modules answered
@@ -1,10 +1,17 @@
 """
 A background thread which collects jobs in a list and publishes them.
 Used mainly for GUI tasks
+
+The job list is versioned: every message on "job_list" contains only the jobs changed since the previous version
+    {"version": v, "snapshot": false, "jobs": [job dicts]}
+Jobs marked as done are published once and removed afterward. The complete list is requested with "job_snapshot"
+    {"version": v, "snapshot": true, "jobs": [job dicts]}
+Deltas with a version <= v are already contained in a snapshot, a gap in the versions requires a new snapshot.
 """
 
 import threading
 import json
+import time
 from typing import List, Dict, Optional
 
 from vif.logger.logger import LoggerMixin
@@ -13,6 +20,11 @@ from vif.data_interface.connection_manager import ConnectionManager, Key
 
 
 class JobServer(LoggerMixin):
+    # the time job is refreshed (and published) at this interval
+    PUBLISH_INTERVAL_S = 1.0
+    # bursts of update() calls within this interval are coalesced into one message
+    MIN_PUBLISH_INTERVAL_S = 0.1
+
     def __init__(self, *args, cm: ConnectionManager, db_id: str, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -23,11 +35,15 @@ class JobServer(LoggerMixin):
         self._jobs: List[JobEntry] = []
         self._jobs_lock: threading.Lock = threading.Lock()
         self._update_event: threading.Event = threading.Event()
+        # published state: job id -> last published job json (done jobs are removed after publishing)
+        self._published: Dict[int, str] = {}
+        self._version: int = 0
+        self._published_lock: threading.Lock = threading.Lock()
         self._time_job: TimeJob = TimeJob(cm, db_id)
         self._queryables: List[str] = []
         self._publishers: List[int] = []
         self.pub_job_list_topic: Key = Key(self._db_id, 'c', 'job_list')
-        self._kill: bool = False
+        self._kill_event: threading.Event = threading.Event()
         self._run_thread: Optional[threading.Thread] = threading.Thread(target=self._run, name='job_server_run')
 
     def start(self):
@@ -35,13 +51,14 @@ class JobServer(LoggerMixin):
         Starts the background thread and declares the necessary connection endpoints.
         """
         for key, cb in [(Key(self._db_id, 'c', 'job_submit'), self._cb_job_submit),
-                        (Key(self._db_id, 'c', 'job_update'), self._cb_job_update)
+                        (Key(self._db_id, 'c', 'job_update'), self._cb_job_update),
+                        (Key(self._db_id, 'c', 'job_snapshot'), self._cb_job_snapshot),
                         ]:
             self._queryables.append(self._cm.declare_queryable(key, cb))
 
         self._publishers.append(self._cm.declare_publisher(self.pub_job_list_topic))
 
-        self._kill = False
+        self._kill_event.clear()
         assert self._run_thread is not None, 'JobServer cannot be re-started'
         self._run_thread.start()
 
@@ -52,7 +69,7 @@ class JobServer(LoggerMixin):
         Stops the JobServer.
         """
         self.logger.debug("Stopping Job Server.")
-        self._kill = True
+        self._kill_event.set()
         self._update_event.set()
         if self._run_thread is not None and self._run_thread.is_alive():
             self._run_thread.join()
@@ -124,36 +141,61 @@ class JobServer(LoggerMixin):
 
         return json.dumps({'id': job_id})
 
+    def _cb_job_snapshot(self, data: bytes) -> str | bytes:
+        """
+        Returns all published (not done) jobs and the current version.
+        """
+        with self._published_lock:
+            return self._message(self._version, True, list(self._published.values()))
+
+    @staticmethod
+    def _message(version: int, snapshot: bool, jobs: List[str]) -> str:
+        # jobs are already serialized: join them instead of parsing and serializing again
+        return f'{{"version": {version}, "snapshot": {json.dumps(snapshot)}, "jobs": [{", ".join(jobs)}]}}'
+
     def _run(self) -> None:
         """
         The background thread method, which handles the controlled publishing of the jobs.
         """
         self.logger.debug('thread started')
-        while not self._kill:
-            # update slow if there are no jobs, otherwise increase update rate
-            sleep_time = 1.0 if len(self._jobs) > 0 else 1.0
-
-            # wait for event or sleep time
-            self._update_event.wait(timeout=sleep_time)
+        next_tick = time.monotonic()
+        while not self._kill_event.is_set():
+            # wait for event or the next refresh of the time job
+            self._update_event.wait(timeout=max(0., next_tick - time.monotonic()))
             self._update_event.clear()
 
             # kill if flag is set
-            if self._kill:
+            if self._kill_event.is_set():
                 break
 
-            self._time_job.update_time()
-
-            # create json dict with top level entry
-            job_json: Dict[str, List[Dict]] = {'jobs': []}
+            now = time.monotonic()
+            if now >= next_tick:
+                self._time_job.update_time()
+                next_tick = max(next_tick + self.PUBLISH_INTERVAL_S, now)
 
+            # serialize jobs and keep the ones changed since the last message (_published is only written here)
+            changed: Dict[int, str] = {}
+            done_ids: List[int] = []
             with self._jobs_lock:
-                # append job dicts to json
                 for job in self._jobs:
-                    job_json['jobs'].append(job.get_dict())
+                    job_json = json.dumps(job.get_dict())
+                    if self._published.get(job.get_id()) != job_json:
+                        changed[job.get_id()] = job_json
+                    if job.is_done():
+                        done_ids.append(job.get_id())
 
                 # get rid of jobs that are marked as done, for next iteration
                 self._jobs = [job for job in self._jobs if not job.is_done()]
 
-            # publish current jobs
-            # self.logger.debug("JOBS: " + json.dumps(job_json))
-            self._cm.publish(self.pub_job_list_topic, json.dumps(job_json))
+            if len(changed) > 0:
+                with self._published_lock:
+                    self._published.update(changed)
+                    for job_id in done_ids:
+                        self._published.pop(job_id, None)
+                    self._version += 1
+                    # publish under the lock: a snapshot never has a higher version than the published deltas
+                    message = self._message(self._version, False, list(changed.values()))
+                    self._cm.publish(self.pub_job_list_topic, message)
+
+            # coalesce bursts of updates
+            self._kill_event.wait(timeout=self.MIN_PUBLISH_INTERVAL_S)
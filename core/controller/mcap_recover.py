@@ -7,7 +7,7 @@ from datetime import datetime, timezone
 from pathlib import Path
 import json
 import re
-from typing import Union
+from typing import List, Union
 
 backup_dir_name = 'bak_recovery'
 
@@ -42,6 +42,54 @@ def get_mcap_end_timestamp(mcap_file: Union[str, Path], mcap_cli_path: str = '/u
         return None
 
 
+def fix_measurement_meta(measurement_dir: Path, mcap_cli_path: str = '/usr/local/bin/mcap') -> bool:
+    """
+    Sets stop time and duration in meta.json of an unfinished measurement from the last mcap timestamp.
+    :return: True if the meta data is complete (stop time set)
+    """
+    logger = logging.getLogger('mcap_recover')
+    try:
+        with (measurement_dir / "meta.json").open('r') as f:
+            meta = json.load(f)
+    except Exception as e:
+        logger.error(f'failed to read meta.json in {measurement_dir} ({type(e).__name__}): {e}')
+        return False
+
+    if len(meta['stop_time_utc']):
+        return True  # everything is fine - we have a stop time
+
+    logger.info(f'found unfinished measurement: {measurement_dir}')
+
+    try:
+        # find last timestamp in mcap files of measurement
+        end_ts_list = [get_mcap_end_timestamp(mcap_file, mcap_cli_path)
+                       for mcap_file in measurement_dir.glob('**/*.mcap')]
+        if not any(end_ts_list):
+            raise ValueError('no mcap timestamps available')
+        latest_ts = max(t for t in end_ts_list if t is not None)
+
+        # calculate duration of measurement
+        duration = str(datetime.fromtimestamp(latest_ts, tz=timezone.utc) -
+                       datetime.fromisoformat(meta['start_time_utc']))
+
+        stop_time = datetime.fromtimestamp(latest_ts, tz=timezone.utc).isoformat(timespec='microseconds')
+        meta['stop_time_utc'] = stop_time
+        meta['duration'] = duration
+
+        # update meta-data (stop_time_utc, duration)
+        with (measurement_dir / "meta.json").open('w') as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+        logger.info(f'fixed unfinished measurement: {measurement_dir}')
+        return True
+    except RuntimeError as e:
+        logger.error(f'fix_unfinished_measurements {type(e).__name__}: {e}')
+    except Exception as e:
+        logger.error(f'fix_unfinished_measurements ({measurement_dir}) failed ({type(e).__name__}): {e}\n'
+                     f'{traceback.format_exc()}')
+    return False
+
+
 def fix_unfinished_measurements_meta(_data_dir: Union[str, Path], mcap_cli_path: str = '/usr/local/bin/mcap'):
     _data_dir = Path(_data_dir)
     logger = logging.getLogger('mcap_recover')
@@ -49,92 +97,72 @@ def fix_unfinished_measurements_meta(_data_dir: Union[str, Path], mcap_cli_path:
         # find unfinished measurements
         for measurement_dir in _data_dir.iterdir():
             if measurement_dir.is_dir() and (measurement_dir / "meta.json").is_file():
-                try:
-                    with (measurement_dir / "meta.json").open('r') as f:
-                        meta = json.load(f)
-                except Exception as e:
-                    logger.error(f'failed to read meta.json in {measurement_dir} ({type(e).__name__}): {e}')
-                    continue
-
-                if len(meta['stop_time_utc']):
-                    continue  # everything is fine - we have a stop time
-
-                logger.info(f'found unfinished measurement: {measurement_dir}')
-
-                try:
-                    # find last timestamp in mcap files of measurement
-                    end_ts_list = [get_mcap_end_timestamp(mcap_file, mcap_cli_path)
-                                   for mcap_file in measurement_dir.glob('**/*.mcap')]
-                    if not any(end_ts_list):
-                        raise ValueError('no mcap timestamps available')
-                    latest_ts = max(t for t in end_ts_list if t is not None)
-
-                    # calculate duration of measurement
-                    duration = str(datetime.fromtimestamp(latest_ts, tz=timezone.utc) -
-                                   datetime.fromisoformat(meta['start_time_utc']))
-
-                    stop_time = datetime.fromtimestamp(latest_ts, tz=timezone.utc).isoformat(timespec='microseconds')
-                    meta['stop_time_utc'] = stop_time
-                    meta['duration'] = duration
-
-                    # update meta-data (stop_time_utc, duration)
-                    with (measurement_dir / "meta.json").open('w') as f:
-                        json.dump(meta, f, indent=2, ensure_ascii=False)
-
-                    logger.info(f'fixed unfinished measurement: {measurement_dir}')
-                except RuntimeError as e:
-                    logger.error(f'fix_unfinished_measurements {type(e).__name__}: {e}')
-                except Exception as e:
-                    logger.error(f'fix_unfinished_measurements ({measurement_dir}) failed ({type(e).__name__}): {e}\n'
-                                 f'{traceback.format_exc()}')
+                fix_measurement_meta(measurement_dir, mcap_cli_path)
 
     except Exception as e:
         logger.error(f'fix_unfinished_measurements failed ({type(e).__name__}): {e}\n{traceback.format_exc()}')
 
 
+def recover_mcap_file(mcap_file: Path, mcap_cli_path: str = '/usr/local/bin/mcap') -> bool:
+    """
+    Recovers an unfinalized "*.partN.mcap" file to "*.mcap" and moves the original to the backup dir.
+    :return: True if the file was handled (recovered, already recovered or empty)
+    """
+    logger = logging.getLogger('mcap_recover')
+    logger.info(f'found unfinished mcap file: {mcap_file}')
+    # check if there is a mcap file, named like mcap_file.name but without ".part0123456789" (regex)
+    correct_file_name = mcap_file.parent / Path(re.sub(r'\.part[0-9]+\.mcap', '.mcap', mcap_file.name))
+    if correct_file_name.is_file():
+        logger.warning(f'recovered file already exists: {correct_file_name.name}')
+        return True
+
+    if mcap_file.stat().st_size == 0:
+        # if file is empty, still move to backup-dir (avoid repeated recovery attempts)
+        logger.warning(f'mcap file is empty: {mcap_file.name}')
+    else:
+        # run mcap recover
+        check_mcap_binary(mcap_cli_path)
+        time_start = time.time()
+        cmd = [mcap_cli_path, "--strict-message-order", "recover", mcap_file.absolute(),
+               "-o", correct_file_name.absolute()]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        for line in process.stdout:
+            logger.info(f'MCAP-CLI>> {line.decode("utf-8").strip()}')
+        process.stdout.close()
+        process.wait()
+        if process.returncode != 0:
+            logger.error(f'mcap recover failed after {time.time() - time_start:.2f} seconds')
+            if correct_file_name.is_file():
+                correct_file_name.unlink()
+            return False
+        logger.info(f'mcap recover took {time.time() - time_start:.2f} seconds. '
+                    f'corrected file name: {correct_file_name.name}')
+
+    # make sure backup dir exists
+    if not (mcap_file.parent / backup_dir_name).is_dir():
+        (mcap_file.parent / backup_dir_name).mkdir(parents=True)
+    # move mcap file to backup-dir
+    mcap_file.rename(mcap_file.parent / backup_dir_name / mcap_file.name)
+    return True
+
+
+def find_unfinalized_mcaps(directory: Path) -> List[Path]:
+    # mcap files named "*.part0123456789.mcap" which are not a backup of a previously recovered file
+    return [mcap_file for mcap_file in directory.glob('**/*.mcap')
+            if re.search(r'.*\.part[0-9]+\.mcap', mcap_file.name) and mcap_file.parent.name != backup_dir_name]
+
+
+def find_spill_files(directory: Path) -> List[Path]:
+    # segments of the capture spill log (see vif.data_interface.spill_wal) left behind by a crash
+    return [wal_file for wal_file in directory.glob('**/*.wal') if re.search(r'.*\.spill\.[0-9]+\.wal', wal_file.name)]
+
+
 def recover_unfinalized_mcaps(_data_dir: Union[str, Path], mcap_cli_path: str = '/usr/local/bin/mcap'):
     _data_dir = Path(_data_dir)
     logger = logging.getLogger('mcap_recover')
     try:
-        # find unfinalized mcap files
-        for mcap_file in _data_dir.glob('**/*.mcap'):
-            # check if mcap file contains in name: "*.part0123456789.mcap" (regex)
-            # AND make sure it's not a backup of a previously recovered file
-            if re.search(r'.*\.part[0-9]+\.mcap', mcap_file.name) and mcap_file.parent.name != backup_dir_name:
-                logger.info(f'found unfinished mcap file: {mcap_file}')
-                # check if there is a mcap file, named like mcap_file.name but without ".part0123456789" (regex)
-                correct_file_name = mcap_file.parent / Path(re.sub(r'\.part[0-9]+\.mcap', '.mcap', mcap_file.name))
-                if correct_file_name.is_file():
-                    logger.warning(f'recovered file already exists: {correct_file_name.name}')
-                    continue
-
-                if mcap_file.stat().st_size == 0:
-                    # if file is empty, still move to backup-dir (avoid repeated recovery attempts)
-                    logger.warning(f'mcap file is empty: {mcap_file.name}')
-                else:
-                    # run mcap recover
-                    check_mcap_binary(mcap_cli_path)
-                    time_start = time.time()
-                    cmd = [mcap_cli_path, "--strict-message-order", "recover", mcap_file.absolute(),
-                           "-o", correct_file_name.absolute()]
-                    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                    for line in process.stdout:
-                        logger.info(f'MCAP-CLI>> {line.decode("utf-8").strip()}')
-                    process.stdout.close()
-                    process.wait()
-                    if process.returncode != 0:
-                        logger.error(f'mcap recover failed after {time.time() - time_start:.2f} seconds')
-                        if correct_file_name.is_file():
-                            correct_file_name.unlink()
-                        continue
-                    logger.info(f'mcap recover took {time.time() - time_start:.2f} seconds. '
-                                f'corrected file name: {correct_file_name.name}')
-
-                # make sure backup dir exists
-                if not (mcap_file.parent / backup_dir_name).is_dir():
-                    (mcap_file.parent / backup_dir_name).mkdir(parents=True)
-                # move mcap file to backup-dir
-                mcap_file.rename(mcap_file.parent / backup_dir_name / mcap_file.name)
+        for mcap_file in find_unfinalized_mcaps(_data_dir):
+            recover_mcap_file(mcap_file, mcap_cli_path)
 
     except RuntimeError as e:
         logger.error(f'fix_unfinilazied_mcaps {type(e).__name__}: {e}')
@@ -142,6 +170,33 @@ def recover_unfinalized_mcaps(_data_dir: Union[str, Path], mcap_cli_path: str =
         logger.error(f'fix_unfinilazied_mcaps failed ({type(e).__name__}): {e}\n{traceback.format_exc()}')
 
 
+def recover_measurement(measurement_dir: Union[str, Path], mcap_cli_path: str = '/usr/local/bin/mcap') -> bool:
+    """
+    Recovers the unfinalized mcap files of one measurement and fixes its meta data (runs in a worker process).
+    Spilled capture data which was not written before a crash is not recovered: the measurement stays unfinished.
+    :return: True if the measurement is finished: meta data complete, no unfinalized mcap files and no spill files left
+    """
+    measurement_dir = Path(measurement_dir)
+    logger = logging.getLogger('mcap_recover')
+    try:
+        recovered = all([recover_mcap_file(mcap_file, mcap_cli_path)
+                         for mcap_file in find_unfinalized_mcaps(measurement_dir)])
+        spill_files = find_spill_files(measurement_dir)
+        if len(spill_files) > 0:
+            logger.warning(f'{measurement_dir.name}: {len(spill_files)} spill files with unwritten capture data: '
+                           f'{", ".join(str(f.relative_to(measurement_dir)) for f in spill_files)}')
+            recovered = False
+        if not (measurement_dir / "meta.json").is_file():
+            return False
+        return fix_measurement_meta(measurement_dir, mcap_cli_path) and recovered
+    except RuntimeError as e:
+        logger.error(f'recover_measurement {type(e).__name__}: {e}')
+    except Exception as e:
+        logger.error(f'recover_measurement ({measurement_dir}) failed ({type(e).__name__}): {e}\n'
+                     f'{traceback.format_exc()}')
+    return False
+
+
 if __name__ == '__main__':
     logging.basicConfig(format='%(asctime)s %(levelname)-7s | %(message)s', level=logging.DEBUG)
 
@@ -6,12 +6,14 @@ Also is able to start/stop sampling/capturing, and send system commands.
 
 import threading
 import json
-from typing import Optional
+import traceback
+from typing import Optional, Dict
 
 from vif.data_interface.helpers import wait_for_controller
 
 from vif.logger.logger import LoggerMixin
 from vif.data_interface.connection_manager import ConnectionManager, Key
+from vif.data_interface.subscription_delivery import DeliveryPolicy
 from vif.websockets.websocket_api import WebSocketAPI
 from vif.data_interface.network_messages import (MeasurementState, ModuleRegistryQuery, ModuleDataConfig,
                                                  ModuleRegistryReply, Module,
@@ -40,13 +42,22 @@ class ControllerAPI(LoggerMixin):
         self.cm = ConnectionManager(router_hostname=db_router, db_id=self._databeam_id, node_name='r',
                                     shutdown_event=shutdown_ev, max_parallel_req=5)
 
+        # mirror of the versioned job list of the controller (see JobServer), sent to new websocket clients
+        self._jobs_lock = threading.Lock()
+        self._jobs: Dict[int, Dict] = {}
+        self._jobs_version: Optional[int] = None
+
     def start(self):
         # wait for connection to controller
         wait_for_controller(logger=self.logger, shutdown_ev=self.shutdown_ev, cm=self.cm, db_id=self._databeam_id)
 
+        # dedicated thread: _cb_jobs may wait for a job snapshot, other subscriptions are not delayed (messages stay
+        # in order, a dropped delta is a version gap answered by a snapshot)
         for key, cb in [(Key(self._databeam_id, 'c', 'job_list'), self._cb_jobs),
                         ]:
-            self.cm.subscribe(key, cb)
+            self.cm.subscribe(key, cb, DeliveryPolicy(mode='thread'))
+
+        self._websocket_api.add_connect_callback(self._on_ws_client_connected)
 
     def shutdown(self):
         self.logger.info("Shutdown initiated")
@@ -55,8 +66,57 @@ class ControllerAPI(LoggerMixin):
         self.logger.info("Shutdown complete")
 
     def _cb_jobs(self, key, data: bytes):
-        json_str = data.decode('utf-8')
-        self._websocket_api.broadcast_json_str("job", json_str)
+        """
+        Applies a job list delta to the mirror and forwards it to the websocket clients. Deltas already contained in
+        the mirror are dropped, the first delta or a gap in the versions is answered by a snapshot. Version 1 is the
+        first delta of a (restarted) controller and always replaces the mirror.
+        """
+        try:
+            delta = json.loads(data)
+            version = delta['version']
+            with self._jobs_lock:
+                restart = version == 1 and self._jobs_version is not None and self._jobs_version >= 1
+                if self._jobs_version is not None and not restart:
+                    if version <= self._jobs_version:
+                        return
+                    if version == self._jobs_version + 1:
+                        self._apply_jobs(delta)
+                        self._websocket_api.broadcast_json_str("job", data.decode('utf-8'))
+                        return
+
+            # request outside the lock: new websocket clients are not blocked while waiting for the controller (runs on
+            # the delivery thread of the subscription, see start)
+            reply = self.cm.request(Key(self._databeam_id, 'c', 'job_snapshot'))
+            if reply is None:
+                self.logger.warning('job snapshot: no reply from controller')
+                return
+            snapshot = json.loads(reply)
+            with self._jobs_lock:
+                if not restart and self._jobs_version is not None and snapshot['version'] <= self._jobs_version:
+                    return
+                self._jobs.clear()
+                self._apply_jobs(snapshot)
+                # the snapshot contains the delta, except done jobs (published once, e.g. log and event jobs)
+                snapshot['jobs'].extend(job for job in delta['jobs'] if job['done'])
+                self._websocket_api.broadcast_json_str("job", json.dumps(snapshot))
+        except Exception as e:
+            self.logger.error(f'EX _cb_jobs ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+
+    def _apply_jobs(self, message: Dict):
+        # call with _jobs_lock held
+        for job in message['jobs']:
+            if job['done']:
+                self._jobs.pop(job['id'], None)
+            else:
+                self._jobs[job['id']] = job
+        self._jobs_version = message['version']
+
+    def _on_ws_client_connected(self, client_id: int):
+        with self._jobs_lock:
+            if self._jobs_version is None:
+                return
+            snapshot = {'version': self._jobs_version, 'snapshot': True, 'jobs': list(self._jobs.values())}
+            self._websocket_api.broadcast_json_str("job", json.dumps(snapshot), client_ids=[client_id])
 
     def _handle_reply_exception(self, ex: Exception, reply: Optional[bytes], func_name: str, target: str):
         if reply is None or type(ex).__name__ == 'StopIteration':
@@ -103,10 +163,13 @@ class ControllerAPI(LoggerMixin):
             return self._handle_reply_exception(e, reply, "get_data_config_dict", module)
 
     def set_data_config_dict(self, module, data_config):
-        message = ModuleDataConfigQuery(cmd=ModuleDataConfigCmd.SET,
-                                        module_data_config=ModuleDataConfig(**data_config))
         reply = None
         try:
+            # start from the current config: the UI only sends the fields it displays
+            current = self.get_data_config_dict(module)
+            config = {**ModuleDataConfig().get_dict(), **current.get('config', {}), **data_config}
+            message = ModuleDataConfigQuery(cmd=ModuleDataConfigCmd.SET,
+                                            module_data_config=ModuleDataConfig.from_dict(config))
             reply = self.cm.request(Key(self._databeam_id, f'm/{module}', 'data_config'), message.serialize())
             value: ModuleDataConfigReply = ModuleDataConfigReply.deserialize(reply)
             return value.get_dict()
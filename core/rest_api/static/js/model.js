@@ -29,8 +29,10 @@ class Model {
     this.config_layout = localStorage.getItem("config_layout")
     if(this.config_layout == null) this.config_layout = "wrap"
 
-    //jobs
+    //jobs (versioned: snapshots replace the list, deltas contain changed jobs only)
     this.jobs = []
+    this.jobs_map = new Map()
+    this.jobs_version = undefined
     this.busy_jobs = []
     this.databeam_time_ns = 0
     this.databeam_time_str = "00:00:00"
@@ -215,9 +217,17 @@ class Model {
 
   setJobs(json)
   {
-    //clear jobs
-    this.jobs = []
-    this.busy_jobs = []
+    if(json.snapshot)
+    {
+      //snapshot: replace all jobs
+      this.jobs_map = new Map()
+    }
+    else if(this.jobs_version == undefined || json.version <= this.jobs_version)
+    {
+      //delta received before the first snapshot or already contained in it
+      return
+    }
+    this.jobs_version = json.version
 
     let state_job_changed = false
     let log_jobs = []
@@ -249,10 +259,6 @@ class Model {
         this.capture_running = this.state_job.data.capture
         this.sampling_running = this.state_job.data.sampling
       }
-      else if(json.jobs[i].type == "busy")
-      {
-        this.busy_jobs.push(new BusyJob(json.jobs[i]))
-      }
       else if(json.jobs[i].type == "event")
       {
         this.setEventModulesChanged(json.jobs[i].data.modules_changed)
@@ -264,10 +270,22 @@ class Model {
         //console.log(json.jobs[i].data)
         log_jobs.push(json.jobs[i].data)
       }
-      else
+      else if(json.jobs[i].type != "busy")
       {
         console.error("Model: Unknown Job Received.")
       }
+
+      //done jobs are only sent once
+      if(json.jobs[i].done) this.jobs_map.delete(json.jobs[i].id)
+      else this.jobs_map.set(json.jobs[i].id, json.jobs[i])
+    }
+
+    //rebuild job lists from all current jobs
+    this.jobs = Array.from(this.jobs_map.values())
+    this.busy_jobs = []
+    for(let i = 0; i < this.jobs.length; i++)
+    {
+      if(this.jobs[i].type == "busy") this.busy_jobs.push(new BusyJob(this.jobs[i]))
     }
 
     //jobs changed, run callback
@@ -1,6 +1,9 @@
+import json
 import logging
 import signal
 import threading
+import time
+from typing import Dict, List
 
 import zmq
 import environ
@@ -13,6 +16,99 @@ class BrokerEnv:
     LOGLEVEL = environ.var(help='logging level', default='DEBUG')
     DB_ROUTER_SUB_PORT = environ.var(help='DataBeam router SUB port', default='5557')
     DB_ROUTER_PUB_PORT = environ.var(help='DataBeam router PUB port', default='5558')
+    DB_ID = environ.var(help='DataBeam ID (statistics topic: <DB_ID>/c/router_stats)', default='')
+    PROXY_STATS = environ.bool_var(help='capture per-topic statistics (disabled: zero-copy forwarding only)',
+                                   default=False)
+    PROXY_STATS_INTERVAL_S = environ.var(help='statistics publish interval', default='1', converter=float)
+    PROXY_STATS_PREFIX_LEVELS = environ.var(help='topic levels aggregated (3: <db_id>/m/<module>)', default='3',
+                                            converter=int)
+
+
+CAPTURE_ADDR = 'inproc://proxy_capture'
+
+
+class ProxyStats(LoggerMixin, threading.Thread):
+    def __init__(self, cfg: BrokerEnv, shutdown_event: threading.Event):
+        """
+        Receives a copy of all forwarded messages from the capture socket of the proxy, aggregates messages/s and
+        bytes/s per topic prefix and publishes a summary on <DB_ID>/c/router_stats every PROXY_STATS_INTERVAL_S:
+            {"interval_s": 1.0, "msgs_s": .., "bytes_s": .., "subscriptions": n,
+             "topics": {prefix: {"msgs_s": .., "bytes_s": ..}}}
+        The capture socket is a PUB: if this thread falls behind, captured copies are dropped (not forwarded
+        messages) and the rates are a lower bound. Drops of slow subscribers are not visible to the proxy (XPUB
+        drops silently per subscriber), they are counted by the subscribers (ConnectionManager.get_subscriber_stats).
+        """
+        threading.Thread.__init__(self, name='proxy_stats', daemon=True)
+        LoggerMixin.__init__(self)
+        self.cfg = cfg
+        self.shutdown_event = shutdown_event
+        self._topic = f'{cfg.DB_ID}/c/router_stats' if len(cfg.DB_ID) > 0 else 'c/router_stats'
+        # topic -> prefix (topics repeat: split once)
+        self._prefixes: Dict[bytes, str] = {}
+
+    def _prefix(self, topic: bytes) -> str:
+        prefix = self._prefixes.get(topic)
+        if prefix is None:
+            if len(self._prefixes) > 100000:
+                self._prefixes.clear()
+            prefix = '/'.join(topic.decode(errors='replace').split('/')[:self.cfg.PROXY_STATS_PREFIX_LEVELS])
+            self._prefixes[topic] = prefix
+        return prefix
+
+    def run(self):
+        capture = zmq.Context.instance().socket(zmq.SUB)
+        capture.setsockopt(zmq.LINGER, 0)
+        capture.setsockopt(zmq.RCVHWM, 100000)
+        capture.subscribe(b'')
+        capture.connect(CAPTURE_ADDR)
+
+        # publish summaries through the proxy like any other publisher
+        pub = zmq.Context.instance().socket(zmq.PUB)
+        pub.setsockopt(zmq.LINGER, 0)
+        pub.connect(f'tcp://localhost:{self.cfg.DB_ROUTER_SUB_PORT}')
+
+        # prefix -> [messages, bytes] of the current interval
+        counts: Dict[str, List[int]] = {}
+        subscriptions = 0
+        interval = self.cfg.PROXY_STATS_INTERVAL_S
+        t_publish = time.monotonic() + interval
+        try:
+            while not self.shutdown_event.is_set():
+                if capture.poll(max(0, int((t_publish - time.monotonic()) * 1000))):
+                    for _ in range(1000):
+                        try:
+                            frames = capture.recv_multipart(copy=False, flags=zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        first = frames[0].bytes
+                        if len(frames) == 1 and len(first) > 0 and first[0] in (0, 1):
+                            # (un)subscription from a subscriber (XPUB -> XSUB direction)
+                            subscriptions += 1 if first[0] == 1 else -1
+                            continue
+                        entry = counts.get(self._prefix(first))
+                        if entry is None:
+                            entry = counts[self._prefix(first)] = [0, 0]
+                        entry[0] += 1
+                        entry[1] += sum(len(frame) for frame in frames)
+
+                now = time.monotonic()
+                if now >= t_publish:
+                    elapsed = interval + now - t_publish
+                    t_publish = now + interval
+                    summary = {'interval_s': round(elapsed, 3),
+                               'msgs_s': round(sum(c[0] for c in counts.values()) / elapsed, 1),
+                               'bytes_s': round(sum(c[1] for c in counts.values()) / elapsed, 1),
+                               'subscriptions': subscriptions,
+                               'topics': {prefix: {'msgs_s': round(c[0] / elapsed, 1),
+                                                   'bytes_s': round(c[1] / elapsed, 1)}
+                                          for prefix, c in sorted(counts.items(), key=lambda i: -i[1][1])}}
+                    counts = {}
+                    pub.send_multipart([self._topic.encode(), json.dumps(summary).encode()])
+        except Exception as e:
+            self.logger.error(f'EX: {type(e).__name__}: {e}')
+
+        capture.close()
+        pub.close()
 
 
 if __name__ == '__main__':
@@ -45,6 +141,17 @@ if __name__ == '__main__':
 
     logger_main.info("bound")
 
+    capture_sock = None
+    stats_shutdown_ev = threading.Event()
+    if env_cfg.PROXY_STATS:
+        # copies of all messages go to the statistics thread (without capture socket: plain zero-copy proxy)
+        capture_sock = zmq.Context.instance().socket(zmq.PUB)
+        capture_sock.setsockopt(zmq.LINGER, 0)
+        capture_sock.setsockopt(zmq.SNDHWM, 100000)
+        capture_sock.bind(CAPTURE_ADDR)
+        ProxyStats(env_cfg, stats_shutdown_ev).start()
+        logger_main.info('statistics enabled')
+
     def handle_term_signal(signum, frame):
         log_reentrant(f'signal {signum} called -> shutdown!')
         raise KeyboardInterrupt
@@ -53,12 +160,13 @@ if __name__ == '__main__':
     signal.signal(signal.SIGTERM, handle_term_signal)
 
     try:
-        proxy = zmq.proxy(sock_sub, sock_pub)
+        proxy = zmq.proxy(sock_sub, sock_pub, capture_sock)
         # we never get here ...
     except KeyboardInterrupt:
         logger_main.info('shutting down')
     except Exception as e:
         logger_main.error(f'EX: {type(e).__name__}: {e}')
+    stats_shutdown_ev.set()
 
     num_threads_left = threading.active_count() - 1
     logger_main.debug(f'done - threads left: {num_threads_left}')
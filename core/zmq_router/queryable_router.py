@@ -1,7 +1,12 @@
+import bisect
+import json
 import logging
 import signal
 import threading
+import time
 from contextlib import suppress
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
 
 import zmq
 import environ
@@ -14,26 +19,138 @@ class BrokerEnv:
     LOGLEVEL = environ.var(help='logging level', default='DEBUG')
     DB_ROUTER_FRONTEND_PORT = environ.var(help='DataBeam router queryable frontend port', default='5555')
     DB_ROUTER_BACKEND_PORT = environ.var(help='DataBeam router queryable backend port', default='5556')
+    ROUTER_LOG_SAMPLE_EVERY = environ.var(help='log every n-th message (DEBUG only)', default='1000', converter=int)
+    ROUTER_STATS_INTERVAL_S = environ.var(help='statistics log interval (0: disabled)', default='60', converter=float)
+
+
+# upper bounds of the latency histogram buckets (the last bucket counts everything above)
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# requests without reply are counted as unanswered after this time
+PENDING_TIMEOUT_S = 30.
+# messages handled per socket before the other socket is polled again
+BATCH_SIZE = 256
+# [identity, identity, uuid, topic, payload]: shorter messages are dropped
+MESSAGE_FRAMES = 5
+
+
+@dataclass
+class IdentityStats:
+    requests_out: int = 0  # sent as client (frontend)
+    requests_in: int = 0  # received as queryable (backend)
+    responses: int = 0  # replies sent as queryable
+    unanswered: int = 0
+    unroutable: int = 0  # messages to this identity dropped: not connected or queue full
+    latency_counts: List[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS_MS) + 1))
+
+    def add_latency(self, latency_ms: float):
+        self.latency_counts[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def latency_percentile_ms(self, percentile: float) -> float | None:
+        """ upper bound of the bucket containing the percentile (inf for the last bucket) """
+        total = sum(self.latency_counts)
+        if total == 0:
+            return None
+        count = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS_MS + (float('inf'),), self.latency_counts):
+            count += bucket_count
+            if count >= total * percentile / 100:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> Dict:
+        return {'requests_out': self.requests_out, 'requests_in': self.requests_in, 'responses': self.responses,
+                'unanswered': self.unanswered, 'unroutable': self.unroutable,
+                'latency_ms': {'buckets': LATENCY_BUCKETS_MS, 'counts': self.latency_counts,
+                               'p50': self.latency_percentile_ms(50), 'p99': self.latency_percentile_ms(99)}}
+
+
+class RouterStats:
+    def __init__(self):
+        self.t_start = time.monotonic()
+        self.messages_frontend = 0
+        self.messages_backend = 0
+        self.malformed = 0  # messages dropped: fewer than MESSAGE_FRAMES frames
+        self.identities: Dict[str, IdentityStats] = {}
+        # (client identity, uuid) -> (time received, target identity)
+        self.pending: Dict[Tuple[bytes, bytes], Tuple[float, bytes]] = {}
+
+    def identity(self, ident: bytes) -> IdentityStats:
+        stats = self.identities.get(ident)
+        if stats is None:
+            stats = self.identities[ident] = IdentityStats()
+        return stats
+
+    def request(self, t: float, client: bytes, target: bytes, req_uuid: bytes):
+        self.identity(client).requests_out += 1
+        self.identity(target).requests_in += 1
+        self.pending[(client, req_uuid)] = (t, target)
+
+    def reply(self, t: float, target: bytes, client: bytes, req_uuid: bytes):
+        target_stats = self.identity(target)
+        target_stats.responses += 1
+        sent = self.pending.pop((client, req_uuid), None)
+        if sent is not None:
+            target_stats.add_latency((t - sent[0]) * 1000)
+
+    def expire_pending(self, t: float):
+        expired = [key for key, (t_sent, _) in self.pending.items() if t - t_sent > PENDING_TIMEOUT_S]
+        for key in expired:
+            self.identity(self.pending.pop(key)[1]).unanswered += 1
+
+    def to_dict(self) -> Dict:
+        return {'uptime_s': round(time.monotonic() - self.t_start, 1),
+                'messages': {'frontend': self.messages_frontend, 'backend': self.messages_backend,
+                             'malformed': self.malformed},
+                'pending': len(self.pending),
+                'identities': {ident.decode(errors='replace'): stats.to_dict()
+                               for ident, stats in sorted(self.identities.items())}}
 
 
 class QueryableRouter(LoggerMixin, threading.Thread):
     def __init__(self, cfg: BrokerEnv, shutdown_event: threading.Event):
+        """
+        Routes requests from clients (frontend) to queryables (backend) and replies back.
+
+        Frames are forwarded without copying payloads, in batches of up to BATCH_SIZE messages per socket. Counts per
+        identity and reply latencies are kept in RouterStats: logged every ROUTER_STATS_INTERVAL_S and returned as
+        JSON for a request to the queryable "<db_id>/router" with topic "stats" (answered by the router itself).
+        Both ROUTER sockets carry requests and replies, so they stay in this one thread (sockets are not thread-safe).
+        """
         threading.Thread.__init__(self)
         LoggerMixin.__init__(self)
         self.cfg = cfg
         self.shutdown_event = shutdown_event
+        self.stats = RouterStats()
+
+    def _log_sampled(self, side: str, count: int, frames: List[zmq.Frame]):
+        if count % self.cfg.ROUTER_LOG_SAMPLE_EVERY == 0:
+            self.logger.debug(f'rx {side} #{count}: {frames[3].bytes.decode(errors="replace")} '
+                              f'from {frames[0].bytes.decode(errors="replace")} - {[f.bytes for f in frames[:4]]}')
+
+    def _send(self, sock: zmq.Socket, frames: List, target: bytes) -> bool:
+        try:
+            sock.send_multipart(frames, copy=False, flags=zmq.NOBLOCK)
+            return True
+        except zmq.ZMQError as e:
+            # ROUTER_MANDATORY: identity not connected (EHOSTUNREACH) or its queue is full (EAGAIN)
+            self.stats.identity(target).unroutable += 1
+            if e.errno != zmq.EAGAIN and e.errno != zmq.EHOSTUNREACH:
+                raise
+            return False
 
     def run(self):
         frontend = zmq.Context().socket(zmq.ROUTER)
         frontend.setsockopt(zmq.LINGER, 0)
         frontend.setsockopt(zmq.RCVHWM, 100000)
         frontend.setsockopt(zmq.SNDHWM, 100000)
+        frontend.setsockopt(zmq.ROUTER_MANDATORY, 1)
         frontend.bind(f"tcp://*:{self.cfg.DB_ROUTER_FRONTEND_PORT}")
 
         backend = zmq.Context().socket(zmq.ROUTER)
         backend.setsockopt(zmq.LINGER, 0)
         backend.setsockopt(zmq.RCVHWM, 100000)
         backend.setsockopt(zmq.SNDHWM, 100000)
+        backend.setsockopt(zmq.ROUTER_MANDATORY, 1)
         backend.bind(f"tcp://*:{self.cfg.DB_ROUTER_BACKEND_PORT}")
 
         self.logger.info("bound")
@@ -42,23 +159,65 @@ class QueryableRouter(LoggerMixin, threading.Thread):
         poller.register(frontend, zmq.POLLIN)
         poller.register(backend, zmq.POLLIN)
 
+        stats = self.stats
+        t_stats = t_expire = time.monotonic()
         try:
-            loglevel = self.logger.getEffectiveLevel()
+            log_sampled = self.logger.getEffectiveLevel() <= logging.DEBUG and self.cfg.ROUTER_LOG_SAMPLE_EVERY > 0
 
             while not self.shutdown_event.is_set():
                 socks = dict(poller.poll(100))
+                t = time.monotonic()  # one timestamp per batch
+
                 if socks.get(frontend) == zmq.POLLIN:
-                    x = frontend.recv_multipart()
-                    if loglevel <= logging.DEBUG:
-                        self.logger.debug(f"rx FRONTend: {x[3].decode()} from {x[0].decode()} - {x}")
-                    x[0], x[1] = x[1], x[0]
-                    backend.send_multipart(x)
+                    for _ in range(BATCH_SIZE):
+                        try:
+                            # [client, target, uuid, topic, payload]
+                            x = frontend.recv_multipart(copy=False, flags=zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        stats.messages_frontend += 1
+                        if len(x) < MESSAGE_FRAMES:
+                            stats.malformed += 1
+                            continue
+                        if log_sampled:
+                            self._log_sampled('FRONTend', stats.messages_frontend, x)
+                        client, target = x[0].bytes, x[1].bytes
+                        if target.endswith(b'/router') and x[3].bytes == b'stats':
+                            # answered by the router: [client, target, uuid, topic, payload]
+                            self._send(frontend, [client, target, x[2], x[3], json.dumps(stats.to_dict()).encode()],
+                                       client)
+                            continue
+                        req_uuid = x[2].bytes
+                        x[0], x[1] = x[1], x[0]
+                        if self._send(backend, x, target):
+                            stats.request(t, client, target, req_uuid)
+                        else:
+                            stats.identity(client).requests_out += 1
+
                 if socks.get(backend) == zmq.POLLIN:
-                    x = backend.recv_multipart()
-                    if loglevel <= logging.DEBUG:
-                        self.logger.debug(f"rx BACKend: {x[3].decode()} from {x[0].decode()} - {x}")
-                    x[0], x[1] = x[1], x[0]
-                    frontend.send_multipart(x)
+                    for _ in range(BATCH_SIZE):
+                        try:
+                            # [target, client, uuid, topic, payload]
+                            x = backend.recv_multipart(copy=False, flags=zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        stats.messages_backend += 1
+                        if len(x) < MESSAGE_FRAMES:
+                            stats.malformed += 1
+                            continue
+                        if log_sampled:
+                            self._log_sampled('BACKend', stats.messages_backend, x)
+                        target, client = x[0].bytes, x[1].bytes
+                        stats.reply(t, target, client, x[2].bytes)
+                        x[0], x[1] = x[1], x[0]
+                        self._send(frontend, x, client)
+
+                if t - t_expire >= PENDING_TIMEOUT_S:
+                    t_expire = t
+                    stats.expire_pending(t)
+                if self.cfg.ROUTER_STATS_INTERVAL_S > 0 and t - t_stats >= self.cfg.ROUTER_STATS_INTERVAL_S:
+                    t_stats = t
+                    self.logger.info(f'stats: {json.dumps(stats.to_dict())}')
         except Exception as e:
             self.logger.error(f'EX: {type(e).__name__}: {e}')
 
@@ -2,6 +2,7 @@
 Math processor for live data
 """
 import logging
+import threading
 import traceback
 from typing import Dict, Union, List, Optional
 import time
@@ -17,6 +18,7 @@ import environ
 from vif.data_interface.module_interface import main
 from vif.data_interface.io_module import IOModule
 from vif.data_interface.network_messages import Status
+from vif.data_interface.subscription_delivery import DeliveryPolicy
 
 from io_modules.math_processor.config import MathProcessorConfig
 
@@ -121,6 +123,8 @@ class MathProcessor(IOModule):
 
         self.math_expr: Dict[str, MathExpr] = {}
         self.constants: Dict[str, float] = {}
+        # each subscription delivers on its own thread: variable updates and evaluation must not interleave
+        self._data_lock = threading.Lock()
 
     def command_validate_config(self, config) -> Status:
         # verify constants
@@ -227,8 +231,12 @@ class MathProcessor(IOModule):
             self.logger.info('subscribing to modules: %s (%s), sub_all: %s', modules, dbids, sub_all)
             self.logger.info('variables_to_mod_channel: %s', self.variables_to_mod_channel)
 
+            # evaluate on dedicated threads (one per subscription, serialized by _data_lock): calculations do not delay
+            # other subscriptions of this process
+            delivery = DeliveryPolicy(mode='thread', queue_size=10000)
             self.module_interface.live_data_receiver.request_live_data(modules=modules, sub_all=sub_all,
-                                                                       data_callback=self._data_received, db_ids=dbids)
+                                                                       data_callback=self._data_received, db_ids=dbids,
+                                                                       delivery=delivery)
             math_expr = {}
             for c in config['calculation']:
                 res, calc = c.split('=')
@@ -255,6 +263,10 @@ class MathProcessor(IOModule):
         }]
 
     def _data_received(self, db_id: str, module: str, data: Dict) -> None:
+        with self._data_lock:
+            self._evaluate(module, data)
+
+    def _evaluate(self, module: str, data: Dict) -> None:
         try:
             # check if any internal variable is updated
             new_values = {}
@@ -11,6 +11,7 @@ from werkzeug.serving import make_server
 from vif.data_interface.config_handler import ConfigHandler
 
 from vif.data_interface.live_data_receiver import LiveDataReceiver
+from vif.data_interface.subscription_delivery import DeliveryPolicy
 #from vif.websockets.websocket_api import WebSocketAPI
 from vif.websockets.asyncwebsocket_api import AsyncWebSocketAPI
 from vif.data_interface.connection_manager import ConnectionManager, Key
@@ -77,7 +78,9 @@ class Server:
         modules = request.json['modules']
         live_sources = request.json['live_sources']
         self.logger.info("Requested modules: " + str(modules))
-        self._live_data_receiver.request_live_data(modules, [x == "All" for x in live_sources], self._live_data_cb)
+        # websocket broadcasts run on a dedicated thread (drops the oldest samples if the clients can't keep up)
+        self._live_data_receiver.request_live_data(modules, [x == "All" for x in live_sources], self._live_data_cb,
+                                                   delivery=DeliveryPolicy(mode='thread', queue_size=1000))
         return jsonify(modules)
 
     def shutdown(self):
@@ -0,0 +1,101 @@
+import threading
+from typing import Any, List, Optional
+
+from vif.logger.logger import LoggerMixin
+from vif.data_interface.overload_queue import OverloadQueue
+
+
+class BatchQueue(LoggerMixin):
+    def __init__(self, *args, sink: OverloadQueue, batch_size: int = 500,
+                 flush_interval_s: float = 0.01, **kwargs):
+        """
+        Producer side of a micro-batching transport to a child process.
+
+        Items are collected in a list and moved through the multiprocessing queue as one list, either when
+        batch_size items are pending or after flush_interval_s. This replaces one pickle/pipe-write/lock
+        round-trip per item with one per batch. The consumer receives lists of items from the queue of sink.
+
+        :param sink: queue to the consumer process (maxsize counts batches), applies the overload policy
+        :param batch_size: number of items which triggers an immediate send
+        :param flush_interval_s: maximum time an item waits in a partially filled batch
+        """
+        super().__init__(*args, **kwargs)
+        self._sink: OverloadQueue = sink
+        self._batch_size: int = batch_size
+        self._flush_interval_s: float = flush_interval_s
+
+        self._lock = threading.Lock()
+        self._pending: List[Any] = []
+        # set by the producer when the first item is added to an empty batch
+        self._pending_ev = threading.Event()
+        self._shutdown_ev = threading.Event()
+        self._flush_thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._flush_thread is not None:
+            return
+        self._shutdown_ev.clear()
+        self._flush_thread = threading.Thread(target=self._flush_worker, name='batch_queue_flush')
+        self._flush_thread.start()
+
+    def close(self):
+        self._shutdown_ev.set()
+        if self._flush_thread is not None:
+            self._flush_thread.join()
+            self._flush_thread = None
+
+    def put(self, item: Any) -> bool:
+        """
+        Add an item to the current batch. Sends the batch if it is full.
+        :return: False if a batch had to be dropped (see OverloadQueue)
+        """
+        with self._lock:
+            self._pending.append(item)
+            if len(self._pending) == 1:
+                self._pending_ev.set()
+            if len(self._pending) < self._batch_size:
+                return True
+            return self._send_locked()
+
+    def put_block(self, item: Any, count: int) -> bool:
+        """
+        Send the pending items, then item as one queue entry (keeps the order of items).
+        :param count: number of samples contained in item
+        :return: False if item was dropped (see OverloadQueue)
+        """
+        with self._lock:
+            self._send_locked()
+            return self._sink.put(item, count=count)
+
+    def flush(self) -> bool:
+        """
+        Send the partially filled batch (if any).
+        :return: False if the batch had to be dropped (see OverloadQueue)
+        """
+        with self._lock:
+            return self._send_locked()
+
+    def clear(self):
+        with self._lock:
+            self._pending = []
+            self._pending_ev.clear()
+
+    def _send_locked(self) -> bool:
+        # sending under lock keeps batches in order between producer threads and flush thread.
+        # put only appends to the feeder-thread buffer, pickling is done by the feeder thread.
+        # with OverloadPolicy.BLOCK a full queue blocks all producers: this is the intended backpressure.
+        self._pending_ev.clear()
+        if len(self._pending) == 0:
+            return True
+        batch = self._pending
+        self._pending = []
+        return self._sink.put(batch, count=len(batch))
+
+    def _flush_worker(self):
+        while not self._shutdown_ev.is_set():
+            # sleep until a batch is started, then give it flush_interval_s to fill up
+            if not self._pending_ev.wait(timeout=0.2):
+                continue
+            self._shutdown_ev.wait(self._flush_interval_s)
+            self.flush()
+        self.flush()
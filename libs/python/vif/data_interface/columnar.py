@@ -0,0 +1,118 @@
+"""
+Columnar binary MCAP message format for numeric schemas.
+
+One message holds a batch of samples of one channel:
+    uint32 count | int64 ts[count] | column_0[count] | column_1[count] | ...
+All values are little-endian. Columns follow the order of the channel layout, which is stored as JSON list of
+[field_name, numpy_dtype] in the channel metadata under the key "layout". Field names are the channel names of the
+samples (schema property names passed through DataBroker.replace_name_chars).
+"""
+
+import re
+import sys
+import json
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+COLUMNAR_MESSAGE_ENCODING = 'databeam-columnar'
+COLUMNAR_METADATA_NAME = 'databeam_columnar'
+
+# json-schema type: (numpy dtype string, array typecode, fill value for missing entries)
+_COLUMN_TYPES = {
+    'number': ('<f8', 'd', float('nan')),
+    'integer': ('<i8', 'q', 0),
+    'boolean': ('|b1', 'B', False),
+}
+
+# characters replaced in channel names (same as DataBroker.replace_name_chars)
+_NAME_CHARS_RE = re.compile(r'[^a-zA-Z0-9_-]')
+
+
+def channel_name(name: str) -> str:
+    return _NAME_CHARS_RE.sub('_', name)
+
+
+def _coerce(value, typecode: str, fill):
+    """ convert a value not matching the column type (e.g. float for an integer column), fill if not possible """
+    try:
+        if typecode == 'd':
+            return float(value)
+        if typecode == 'B':
+            return bool(value)
+        value = round(float(value))
+        return value if -2 ** 63 <= value < 2 ** 63 else fill
+    except (TypeError, ValueError, OverflowError):
+        return fill
+
+
+def columnar_layout(schema: Dict) -> Optional[List[Tuple[str, str]]]:
+    """
+    Derive the column layout from a module schema (see IOModule.command_get_schemas).
+    :return: list of (channel name, numpy dtype), or None if the schema contains non-numeric fields or names which
+             are equal after replacing characters
+    """
+    properties = schema.get('properties', {})
+    if len(properties) == 0:
+        return None
+    layout = []
+    for name, prop in properties.items():
+        if prop.get('type') not in _COLUMN_TYPES:
+            return None
+        layout.append((channel_name(name), _COLUMN_TYPES[prop['type']][0]))
+    if len({name for name, _ in layout}) != len(layout):
+        return None
+    return layout
+
+
+def columnar_channel_metadata(layout: List[Tuple[str, str]]) -> Dict[str, str]:
+    return {'layout': json.dumps(layout)}
+
+
+class ColumnarBatch:
+    def __init__(self, schema: Dict, topic: str = ''):
+        """
+        Collects samples of one numeric schema and packs them into one columnar message.
+        """
+        self.topic: str = topic
+        properties = schema['properties']
+        types = [_COLUMN_TYPES[prop['type']] for prop in properties.values()]
+        # samples use the channel names
+        self.fields: List[str] = [channel_name(name) for name in properties.keys()]
+        self._typecodes: List[str] = [t[1] for t in types]
+        self._fill: List = [t[2] for t in types]
+        self._ts = array('q')
+        self._columns: List[array] = [array(t) for t in self._typecodes]
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def first_ts(self) -> int:
+        return self._ts[0]
+
+    def add(self, time_ns: int, data: Dict):
+        """
+        Append one sample. Missing fields and None are stored as NaN (number) or 0 / False.
+        Values not matching the column type are converted (integer columns are rounded), or stored like missing ones.
+        """
+        for column, field, fill in zip(self._columns, self.fields, self._fill):
+            value = data.get(field)
+            if value is None:
+                column.append(fill)
+                continue
+            try:
+                column.append(value)
+            except (TypeError, OverflowError):
+                column.append(_coerce(value, column.typecode, fill))
+        self._ts.append(time_ns)
+
+    def to_bytes(self) -> bytes:
+        parts = [self._ts] + self._columns
+        if sys.byteorder != 'little':
+            parts = [array(p.typecode, p) for p in parts]
+            for p in parts:
+                p.byteswap()
+        return len(self._ts).to_bytes(4, 'little') + b''.join(p.tobytes() for p in parts)
+
+    def clear(self):
+        self._ts = array('q')
+        self._columns = [array(t) for t in self._typecodes]
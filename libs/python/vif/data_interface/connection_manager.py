@@ -5,5 +5,6 @@ if _import_cm_lib == 'ZENOH':
     from vif.data_interface.connection_manager_zenoh import *
 elif _import_cm_lib == 'ZMQ':
     from vif.data_interface.connection_manager_zmq import *
+    from vif.data_interface.connection_manager_zmq_async import AsyncConnectionManager, AsyncSubscription
 else:
     raise ImportError(f'Unknown connection manager library: {_import_cm_lib}')
@@ -10,6 +10,7 @@ from functools import partial
 import os
 
 from vif.logger.logger import LoggerMixin
+from vif.data_interface.subscription_delivery import DeliveryPolicy
 
 import zenoh
 
@@ -137,7 +138,8 @@ class ConnectionManager(LoggerMixin):
     def _sub_cb(sample: zenoh.Sample, _cm_key, _cm_cb, *args, **kwargs):
         _cm_cb(_cm_key, *args, data=bytes(sample.payload) if sample.payload is not None else None, **kwargs)
 
-    def subscribe(self, key, cb: Callable[[str, bytes], None]) -> int:
+    def subscribe(self, key, cb: Callable[[str, bytes], None], delivery: Optional[DeliveryPolicy] = None) -> int:
+        # delivery: not supported, zenoh invokes callbacks on its own threads
         assert self.initialized, 'connection manager not initialized'
         self.logger.debug('registering subscriber %s', key)
         sub = self._zs.declare_subscriber(key, partial(self._sub_cb, _cm_key=key, _cm_cb=cb))
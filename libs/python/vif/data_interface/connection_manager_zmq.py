@@ -1,26 +1,31 @@
+import heapq
 import logging
 import queue
 import threading
 import time
 import traceback
 import uuid
-from collections import defaultdict
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 import random
-from typing import Dict, Tuple, Callable, Optional, List
+from typing import Dict, Tuple, Callable, Optional, List, Hashable, Iterator, TypeVar
 import os
 
 import zmq
 import environ
 
 from vif.logger.logger import LoggerMixin
-from vif.zmq.helpers import create_connect, create_bind, flush_queue_sync
+from vif.zmq.helpers import create_connect, create_bind
+from vif.data_interface.subscription_delivery import DeliveryPolicy, SubscriberDelivery, create_subscriber_delivery
 
 
 class ConnectionException(Exception):
     pass
 
 
+T = TypeVar('T', bound=Hashable)
+
+
 @dataclass
 class Key:
     db_id: str
@@ -89,29 +94,29 @@ class BrokerEnv:
 
 
 @dataclass
-class PubSocket:
-    lock: threading.Lock
-    socket: zmq.Socket
-    declarations: List[int]
+class PendingRequest:
+    future: Future
+    key: Key
+    deadline: float  # time.monotonic()
 
 
 @dataclass
-class SubCallback:
-    sub_id: int
-    callback: Callable[[str, bytes], None]
-
-
-@dataclass
-class SubCommand:
-    subscribe: bool
-    topic: str
+class PubSocket:
+    lock: threading.Lock
+    socket: zmq.Socket
+    # declaration id -> topic
+    declarations: Dict[int, str]
+    # topic -> number of declarations
+    topics: Dict[str, int]
 
 
 class RouterConnection(LoggerMixin):
     def __init__(self, *args, db_id: str, router_hostname: str, node_name: str = '', max_parallel_req: int = 1,
-                 max_parallel_queryables: int = 1, **kwargs):
+                 max_parallel_queryables: int = 1, subscriber_pool_workers: int = 4, **kwargs):
         """
         Handle connection to single ZMQ router
+        :param max_parallel_req: 0 disables requests (requests share one socket, the number in flight is not limited)
+        :param subscriber_pool_workers: threads of the pool shared by subscriptions with delivery mode "pool"
         """
         super().__init__(*args, logger_name=f'RouterConnection {db_id}', **kwargs)
 
@@ -125,37 +130,56 @@ class RouterConnection(LoggerMixin):
         self._ports = environ.to_config(BrokerEnv)
         self._shutdown_ev = threading.Event()
 
-        # sockets
-        if len(self._node_name) > 0 and max_parallel_req > 0:
-            ident_key = Key(self._db_id, self._node_name, topic='-')
-            self._query_req_socks = queue.Queue()
-            for i in range(max_parallel_req):
-                self.logger.debug('creating query request socket id: %s%d', ident_key.ident, i)
-                self._query_req_socks.put(create_connect(f'tcp://{self._router_hostname}:'
-                                                         f'{self._ports.DB_ROUTER_FRONTEND_PORT}',
-                                                         zmq, zmq.DEALER, identity=f'{ident_key.ident}{i}'.encode(),
-                                                         timeout_ms=200))
+        # requests: all requests are multiplexed on the DEALER socket of the request worker thread, which matches
+        # replies to the pending futures by UUID. Requests reach the worker through an inproc PUSH/PULL pair
+        # (PULL is only used by the worker, PUSH while holding _req_control_lock)
+        self._requests_enabled = len(self._node_name) > 0 and max_parallel_req > 0
+        self._pending_lock = threading.Lock()
+        self._pending: Dict[bytes, PendingRequest] = {}
+        self._req_control_lock = threading.Lock()
+        if self._requests_enabled:
+            req_control_addr = f'inproc://req_control_{uuid.uuid4().hex}'
+            self._req_control_rx = create_bind(req_control_addr, zmq, zmq.PULL)
+            self._req_control_rx.setsockopt(zmq.RCVHWM, 10000)
+            self._req_control_tx = create_connect(req_control_addr, zmq, zmq.PUSH)
+            self._req_control_tx.setsockopt(zmq.SNDHWM, 10000)
         else:
             self.logger.debug('node_name not specified: disabled queryables and queries')
             # external routers do not support queries
-            self._query_req_socks = None
 
-        # one PUB socket per topic added by "declare_publisher"
-        self._pub_sockets_lock = threading.Lock()
-        # key (topic): lock, pub-socket, list of declaration-uuids
-        self._pub_sockets: Dict[str, PubSocket] = {}
+        # one PUB socket shared by all topics added by "declare_publisher" (created on first declaration)
+        self._pub_socket_lock = threading.Lock()
+        self._pub_socket: Optional[PubSocket] = None
 
+        # copy-on-write subscription table: the worker thread reads it without locking,
+        # subscribe / unsubscribe replace it (and never modify it) while holding the lock
         self._subscribers_lock = threading.Lock()
-        # key (topic): list of uuids (int) and callbacks
-        self._subscribers: Dict[str, List[SubCallback]] = defaultdict(list)
-        # queue to task the worker thread to un-/subscribe to topics
-        self._topic_transfer_q: queue.SimpleQueue[SubCommand] = queue.SimpleQueue()
+        # key (topic): tuple of deliveries (uuid, callback and delivery policy)
+        self._subscribers: Dict[str, Tuple[SubscriberDelivery, ...]] = {}
+        # uuid -> key (topic)
+        self._subscriber_topics: Dict[int, str] = {}
+        # control socket pair to task the worker thread to un-/subscribe to topics (polled with the SUB socket).
+        # PULL is bound here and only used by the worker, PUSH is used while holding _subscribers_lock
+        sub_control_addr = f'inproc://sub_control_{uuid.uuid4().hex}'
+        self._sub_control_rx = create_bind(sub_control_addr, zmq, zmq.PULL)
+        self._sub_control_tx = create_connect(sub_control_addr, zmq, zmq.PUSH)
+        # shared by subscriptions with delivery mode "pool" (created on first use)
+        self._subscriber_pool_workers = subscriber_pool_workers
+        self._subscriber_pool: Optional[ThreadPoolExecutor] = None
 
         self._queryables_lock = threading.Lock()
         # dict-key = topic --> callback
         self._queryables: Dict[str, Callable[[bytes], str | bytes]] = {}
+        # replies of the queryable worker threads (unique per connection: several managers may run in one process)
+        self._query_worker_addr = f'inproc://query_worker_{uuid.uuid4().hex}'
 
         # worker threads
+        if self._requests_enabled:
+            self._request_thread = threading.Thread(target=self._request_worker, name='request_worker')
+            self._request_thread.start()
+        else:
+            self._request_thread = None
+
         self._subscribe_thread = threading.Thread(target=self._subscribe_worker, name='subscribe_worker')
         self._subscribe_thread.start()
 
@@ -173,21 +197,35 @@ class RouterConnection(LoggerMixin):
         if self._queryable_thread is not None:
             self._queryable_thread.join()
         self._subscribe_thread.join()
-        with self._pub_sockets_lock:
-            for key, pub_sock_info in self._pub_sockets.items():
-                self.logger.warning('closing abandoned publisher socket %s', key)
-                with pub_sock_info.lock:
-                    pub_sock_info.socket.close()
-            self._pub_sockets.clear()
-        if self._query_req_socks is not None:
-            while not self._query_req_socks.empty():
-                sock = self._query_req_socks.get()
-                sock.close()
+        self._sub_control_tx.close()
+        with self._subscribers_lock:
+            deliveries = [sub for subs in self._subscribers.values() for sub in subs]
+            self._subscribers = {}
+            self._subscriber_topics.clear()
+        for sub in deliveries:
+            sub.close()
+        if self._subscriber_pool is not None:
+            self._subscriber_pool.shutdown()
+        with self._pub_socket_lock:
+            if self._pub_socket is not None:
+                for topic in self._pub_socket.topics:
+                    self.logger.warning('closing abandoned publisher %s', topic)
+                with self._pub_socket.lock:
+                    self._pub_socket.socket.close()
+                self._pub_socket = None
+        if self._request_thread is not None:
+            self._request_thread.join()
+            with self._req_control_lock:
+                self._req_control_tx.close()
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+            for req in pending.values():
+                self._resolve(req.future, exception=ConnectionException(f'request {req.key} - connection closed'))
 
     def _queryable_worker_thread(self, wid: int, shutdown_ev: threading.Event, process_queue: queue.Queue) -> None:
         logger = logging.getLogger(f'_queryable_worker_thread_{wid}')
         try:
-            reply_sock = create_connect('inproc://query_worker', zmq, zmq.PUSH, timeout_ms=1000)
+            reply_sock = create_connect(self._query_worker_addr, zmq, zmq.PUSH, timeout_ms=1000)
         except Exception as e:
             logger.error(f'EX creation ({type(e).__name__}): {e}\n{traceback.format_exc()}')
             return
@@ -235,7 +273,7 @@ class RouterConnection(LoggerMixin):
         sock.setsockopt(zmq.SNDHWM, 10000)
 
         # collect replies from queryable workers (which process callbacks)
-        sock_worker_rx = create_bind('inproc://query_worker', zmq, zmq.PULL, timeout_ms=100)
+        sock_worker_rx = create_bind(self._query_worker_addr, zmq, zmq.PULL, timeout_ms=100)
         self._shutdown_ev.wait(0.1)  # PUSH-PULL pattern requires bind-before-connect
 
         # start queryable worker threads
@@ -295,132 +333,246 @@ class RouterConnection(LoggerMixin):
         with self._queryables_lock:
             self._queryables.pop(topic)
 
-    def request(self, key: Key, data: bytes | str | None = None, timeout=1.0) -> Optional[bytes]:
-        sock = self._query_req_socks.get()
+    # messages received from each socket of the request worker before the other one is checked again
+    REQUEST_WORKER_BATCH = 100
+
+    @staticmethod
+    def _resolve(future: Future, result: Optional[bytes] = None, exception: Optional[BaseException] = None) -> None:
         try:
-            # drain socket to avoid getting "late" answers
-            flush_queue_sync(sock)
-
-            if isinstance(data, str):
-                data = data.encode()
-            elif data is None:
-                data = b''
-
-            req = QueryableEnvelope(ident=key.ident, uuid=random.randbytes(8), topic=key.topic, payload=data)
-            # self.logger.debug('requesting %s - %s', key, req)
-            sock.send_multipart(req.to_multipart())
-            rx = None
-            t_start = time.time()
-            while (time.time() - t_start) < timeout:
-                try:
-                    rx = QueryableEnvelope.from_multipart(sock.recv_multipart())
-                except zmq.Again:
-                    continue  # timeout: nothing received, wait longer
-                if rx.uuid == req.uuid:
-                    break  # received correct answer
-                else:
-                    self.logger.warning(f'request received wrong UUID: {rx.uuid.hex()} vs. {req.uuid.hex()} '
-                                        f'for key {key}')
-                    rx = None
-                    continue
-            if rx is not None:
-                # self.logger.debug('Reply received from %s - %s', rx.ident, rx)
-                self._query_req_socks.put(sock)
-                return rx.payload
+            if exception is not None:
+                future.set_exception(exception)
             else:
-                self.logger.error(f'request {key} - timeout (limit: {timeout} s)')
+                future.set_result(result)
+        except InvalidStateError:
+            pass  # cancelled by the caller
+
+    def _request_worker(self) -> None:
+        logger = logging.getLogger('ZMQ-req worker')
+        ident_key = Key(self._db_id, self._node_name, topic='-')
+        # single multiplexed request socket (identity suffix "0" as before with one socket per parallel request)
+        sock = create_connect(f'tcp://{self._router_hostname}:{self._ports.DB_ROUTER_FRONTEND_PORT}', zmq,
+                              zmq.DEALER, identity=f'{ident_key.ident}0'.encode())
+        sock.setsockopt(zmq.RCVHWM, 10000)
+        sock.setsockopt(zmq.SNDHWM, 10000)
+
+        poller = zmq.Poller()
+        poller.register(sock, zmq.POLLIN)
+        poller.register(self._req_control_rx, zmq.POLLIN)
+        # (deadline, uuid) of sent requests
+        deadlines: List[Tuple[float, bytes]] = []
+
+        while not self._shutdown_ev.is_set():
+            try:
+                timeout_ms = 100
+                if len(deadlines) > 0:
+                    timeout_ms = min(timeout_ms, max(0, int((deadlines[0][0] - time.monotonic()) * 1000) + 1))
+                socks = dict(poller.poll(timeout=timeout_ms))
+
+                if socks.get(self._req_control_rx) == zmq.POLLIN:
+                    # forward new requests to the router
+                    for _ in range(self.REQUEST_WORKER_BATCH):
+                        try:
+                            req_msg = self._req_control_rx.recv_multipart(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        req_uuid = req_msg[1]
+                        with self._pending_lock:
+                            req = self._pending.get(req_uuid)
+                        if req is None:
+                            continue  # cancelled / timed out before sending
+                        try:
+                            sock.send_multipart(req_msg, zmq.NOBLOCK)
+                        except zmq.Again:
+                            with self._pending_lock:
+                                self._pending.pop(req_uuid, None)
+                            self._resolve(req.future, exception=ConnectionException(
+                                f'request {req.key} - send queue full'))
+                            continue
+                        heapq.heappush(deadlines, (req.deadline, req_uuid))
+
+                if socks.get(sock) == zmq.POLLIN:
+                    # match replies to pending requests
+                    for _ in range(self.REQUEST_WORKER_BATCH):
+                        try:
+                            rx = QueryableEnvelope.from_multipart(sock.recv_multipart(zmq.NOBLOCK))
+                        except zmq.Again:
+                            break
+                        with self._pending_lock:
+                            req = self._pending.pop(rx.uuid, None)
+                        if req is None:
+                            logger.warning(f'discarding late reply {rx.uuid.hex()} from {rx.ident}/{rx.topic}')
+                            continue
+                        self._resolve(req.future, rx.payload)
+
+                # expire requests without reply (replies already resolved are skipped)
+                now = time.monotonic()
+                while len(deadlines) > 0 and deadlines[0][0] <= now:
+                    _, req_uuid = heapq.heappop(deadlines)
+                    with self._pending_lock:
+                        req = self._pending.pop(req_uuid, None)
+                    if req is not None:
+                        self._resolve(req.future, exception=TimeoutError(f'request {req.key} - timeout'))
+            except Exception as e:
+                logger.error(f'EX ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+
+        sock.close()
+        self._req_control_rx.close()
+
+    def request_async(self, key: Key, data: bytes | str | None = None, timeout=1.0) -> Future:
+        """
+        Send a request without waiting for the reply. Any number of requests may be in flight.
+        The future is resolved by the request worker thread (callbacks added to it run there): result is the reply
+        payload (bytes), exception TimeoutError if no reply arrived within timeout or ConnectionException.
+        In asyncio code use: await asyncio.wrap_future(future)
+        """
+        if not self._requests_enabled:
+            raise ConnectionException(f'requests not supported on connection {self._db_id}')
+        if isinstance(data, str):
+            data = data.encode()
+        elif data is None:
+            data = b''
+
+        future = Future()
+        req = QueryableEnvelope(ident=key.ident, uuid=random.randbytes(8), topic=key.topic, payload=data)
+        # self.logger.debug('requesting %s - %s', key, req)
+        with self._pending_lock:
+            self._pending[req.uuid] = PendingRequest(future, key, time.monotonic() + timeout)
+        with self._req_control_lock:
+            if self._shutdown_ev.is_set():
+                with self._pending_lock:
+                    self._pending.pop(req.uuid, None)
+                raise ConnectionException(f'request {key} - connection closed')
+            # blocks while the request worker is 10000 requests behind
+            self._req_control_tx.send_multipart(req.to_multipart())
+        return future
+
+    def request(self, key: Key, data: bytes | str | None = None, timeout=1.0) -> Optional[bytes]:
+        try:
+            # the request worker enforces the timeout, the margin only guards against a stuck worker
+            return self.request_async(key, data, timeout).result(timeout=timeout + 1.0)
+        except TimeoutError:
+            self.logger.error(f'request {key} - timeout (limit: {timeout} s)')
         except Exception as e:
             self.logger.error(f'EX request ({type(e).__name__}): {e}\n{traceback.format_exc()}')
-
-        self._query_req_socks.put(sock)
         return None
 
+    # messages received from the SUB socket before control commands are checked again
+    SUBSCRIBE_WORKER_BATCH = 100
+
     def _subscribe_worker(self) -> None:
         logger = logging.getLogger('ZMQ-sub worker')
-        sock = create_connect(f'tcp://{self._router_hostname}:{self._ports.DB_ROUTER_PUB_PORT}', zmq, zmq.SUB,
-                              timeout_ms=100)
+        sock = create_connect(f'tcp://{self._router_hostname}:{self._ports.DB_ROUTER_PUB_PORT}', zmq, zmq.SUB)
         sock.setsockopt(zmq.RCVHWM, 10000)
         sock.setsockopt(zmq.SNDHWM, 10000)
 
+        # wake up on received messages and on un-/subscribe commands
+        poller = zmq.Poller()
+        poller.register(sock, zmq.POLLIN)
+        poller.register(self._sub_control_rx, zmq.POLLIN)
+
         while not self._shutdown_ev.is_set():
             try:
-                # subscribe to new topics
-                if not self._topic_transfer_q.empty():
-                    sub_command = self._topic_transfer_q.get_nowait()
-                    if sub_command.subscribe:
-                        sock.subscribe(sub_command.topic)
-                    else:
-                        sock.unsubscribe(sub_command.topic)
-                    continue
+                socks = dict(poller.poll(timeout=100))
+                if socks.get(self._sub_control_rx) == zmq.POLLIN:
+                    # un-/subscribe before receiving more traffic
+                    while True:
+                        try:
+                            command, topic = self._sub_control_rx.recv_multipart(zmq.NOBLOCK)
+                        except zmq.Again:
+                            break
+                        if command == b'1':
+                            sock.subscribe(topic)
+                        else:
+                            sock.unsubscribe(topic)
 
-                topic_bytes, rx_msg = sock.recv_multipart()  # 100ms timeout
-                topic = topic_bytes.decode()
-                # logger.debug('rx: %s', rx_msg)
-                with self._subscribers_lock:
+                if socks.get(sock) != zmq.POLLIN:
+                    continue
+                for _ in range(self.SUBSCRIBE_WORKER_BATCH):
+                    try:
+                        topic_bytes, rx_msg = sock.recv_multipart(zmq.NOBLOCK)
+                    except zmq.Again:
+                        break
+                    received = time.monotonic()
+                    topic = topic_bytes.decode()
+                    # logger.debug('rx: %s', rx_msg)
+                    # single read of the current table: changes while the callbacks run apply to the next message
                     sub_callbacks = self._subscribers.get(topic)
                     if sub_callbacks is None:
                         continue
-                    cb_list = [cb.callback for cb in sub_callbacks]
-                # execute callbacks outside of lock
-                for cb in cb_list:
-                    cb(topic, rx_msg)
-            except zmq.Again:
-                continue  # timeout: nothing received
+                    # inline callbacks run here, queued deliveries only enqueue (see subscription_delivery)
+                    for sub in sub_callbacks:
+                        sub.put(topic, rx_msg, received)
             except Exception as e:
                 logger.error(f'EX ({type(e).__name__}): {e}\n{traceback.format_exc()}')
 
         sock.close()
+        self._sub_control_rx.close()
+
+    def _get_subscriber_pool(self) -> ThreadPoolExecutor:
+        assert self._subscribers_lock.locked(), 'subscribers not locked!'
+        if self._subscriber_pool is None:
+            self._subscriber_pool = ThreadPoolExecutor(max_workers=self._subscriber_pool_workers,
+                                                       thread_name_prefix='sub_pool')
+        return self._subscriber_pool
 
-    def subscribe(self, key: Key, cb: Callable[[str, bytes], None]) -> int:
+    def subscribe(self, key: Key, cb: Callable[[str, bytes], None], delivery: Optional[DeliveryPolicy] = None) -> int:
+        topic = str(key)
         with self._subscribers_lock:
             sub_id = uuid.uuid4().int
-            self._subscribers[str(key)].append(SubCallback(sub_id, cb))
-
-        self._topic_transfer_q.put(SubCommand(subscribe=True, topic=str(key)))
+            sub_callbacks = self._subscribers.get(topic, ())
+            sub = create_subscriber_delivery(sub_id, topic, cb, delivery, self._get_subscriber_pool)
+            self._subscribers = {**self._subscribers, topic: sub_callbacks + (sub,)}
+            self._subscriber_topics[sub_id] = topic
+            if len(sub_callbacks) == 0:
+                # first callback for this topic
+                self._sub_control_tx.send_multipart([b'1', topic.encode()])
         return sub_id
 
     def unsubscribe(self, sub_id: int) -> None:
         try:
             with self._subscribers_lock:
-                remove_key = None
-                remove_index = None
-                # find key for sub_id
-                for key, sub_list in self._subscribers.items():
-                    # find ID of callback in list
-                    for idx, cb in enumerate(sub_list):
-                        if cb.sub_id == sub_id:
-                            remove_key = key
-                            remove_index = idx
-                            break
-                    if remove_key is not None:
-                        break
-
-                if remove_key is None or remove_index is None:
+                remove_key = self._subscriber_topics.pop(sub_id, None)
+                if remove_key is None:
                     self.logger.debug('unsubscribe: cannot find subscriber id %d', sub_id)
                     return
 
                 self.logger.debug('unsubscribe from %s with id %d', remove_key, sub_id)
-                self._subscribers[remove_key].pop(remove_index)
-
-                if len(self._subscribers[remove_key]) == 0:
+                removed = next(sub for sub in self._subscribers[remove_key] if sub.sub_id == sub_id)
+                sub_callbacks = tuple(sub for sub in self._subscribers[remove_key] if sub.sub_id != sub_id)
+                subscribers = dict(self._subscribers)
+                if len(sub_callbacks) == 0:
                     # no callbacks left, unsubscribe and remove topic key
-                    self._topic_transfer_q.put(SubCommand(subscribe=False, topic=remove_key))
-                    self._subscribers.pop(remove_key)
+                    self._sub_control_tx.send_multipart([b'0', remove_key.encode()])
+                    subscribers.pop(remove_key)
+                else:
+                    subscribers[remove_key] = sub_callbacks
+                self._subscribers = subscribers
+            # outside the lock: waits for a running callback of a dedicated delivery thread
+            removed.close()
         except Exception as e:
             self.logger.error(f'EX unsubscribe ({type(e).__name__}): {e}\n{traceback.format_exc()}')
 
+    def get_subscriber_stats(self) -> Dict[int, Dict]:
+        """
+        delivery counters and lag per subscription id (see SubscriberDelivery.stats)
+        """
+        return {sub.sub_id: sub.stats() for subs in self._subscribers.values() for sub in subs}
+
     def declare_publisher(self, key: Key) -> Optional[int]:
         try:
             pub_id = uuid.uuid4().int
-            with self._pub_sockets_lock:
-                if str(key) not in self._pub_sockets:
-                    self.logger.debug('adding new publisher %s: id %d', str(key), pub_id)
+            topic = str(key)
+            with self._pub_socket_lock:
+                if self._pub_socket is None:
+                    self.logger.debug('creating publisher socket')
                     pub_sock = create_connect(f'tcp://{self._router_hostname}:{self._ports.DB_ROUTER_SUB_PORT}', zmq,
                                               zmq.PUB)
-                    self._pub_sockets[str(key)] = PubSocket(threading.Lock(), pub_sock, [pub_id])
-                else:
-                    self.logger.debug('adding publisher id %d to existing topic %s', pub_id, str(key))
-                    self._pub_sockets[str(key)].declarations.append(pub_id)
+                    # the send buffer is shared by all topics (was one buffer of the default 1000 per topic)
+                    pub_sock.setsockopt(zmq.SNDHWM, 100000)
+                    self._pub_socket = PubSocket(threading.Lock(), pub_sock, {}, {})
+                self.logger.debug('adding publisher %s: id %d', topic, pub_id)
+                self._pub_socket.declarations[pub_id] = topic
+                self._pub_socket.topics[topic] = self._pub_socket.topics.get(topic, 0) + 1
         except Exception as e:
             self.logger.error(f'EX declare_publisher ({str(key)}) {type(e).__name__}: {e}\n{traceback.format_exc()}')
             return None
@@ -428,9 +580,8 @@ class RouterConnection(LoggerMixin):
 
     def undeclare_publisher(self, pub_id: int) -> bool:
         """
-        Undeclares a publisher identified by its `pub_id`. This method searches within the
-        publisher sockets, removes the specified `pub_id`, and if no identifiers are left
-        for a particular socket, closes and removes it.
+        Undeclares a publisher identified by its `pub_id`. The topic can not be published anymore when no
+        declarations are left for it. The shared publisher socket stays open until the connection is closed.
 
         :param pub_id: The unique id of the publisher to undeclare.
         :return: A boolean indicating whether the publisher was found and successfully undeclared.
@@ -439,28 +590,25 @@ class RouterConnection(LoggerMixin):
         try:
             if pub_id is None:
                 raise ValueError('pub_id must not be None')
-            with self._pub_sockets_lock:
-                remove_key = None
-                for key, pub_sock_info in self._pub_sockets.items():
-                    if pub_id in pub_sock_info.declarations:
-                        found = True
-                        pub_sock_info.declarations.remove(pub_id)
-                        if len(pub_sock_info.declarations) == 0:
-                            # remove publisher if noone needs it anymore
-                            remove_key = key
-                        break
-                if remove_key is not None:
-                    self.logger.debug('undeclaring publisher %s with id %d', remove_key, pub_id)
-                    pub_sock_info = self._pub_sockets.pop(remove_key)
-                    with pub_sock_info.lock:
-                        pub_sock_info.socket.close()
+            with self._pub_socket_lock:
+                if self._pub_socket is not None and pub_id in self._pub_socket.declarations:
+                    found = True
+                    topic = self._pub_socket.declarations.pop(pub_id)
+                    self._pub_socket.topics[topic] -= 1
+                    if self._pub_socket.topics[topic] == 0:
+                        # remove topic if noone needs it anymore
+                        self.logger.debug('undeclaring publisher %s with id %d', topic, pub_id)
+                        self._pub_socket.topics.pop(topic)
         except Exception as e:
             self.logger.error(f'EX undeclare_publisher ({pub_id}) {type(e).__name__}: {e}\n{traceback.format_exc()}')
         return found
 
     def publish(self, key: Key, data: bytes | str) -> None:
         try:
-            pub_sock_info = self._pub_sockets[str(key)]
+            pub_sock_info = self._pub_socket
+            if pub_sock_info is None or str(key) not in pub_sock_info.topics:
+                raise KeyError('publisher not declared')
+            # the socket is shared by all topics: sends of all threads are serialized by its lock
             with pub_sock_info.lock:
                 pub_sock_info.socket.send_multipart([key.encode(), data.encode() if isinstance(data, str) else data])
         except Exception as e:
@@ -470,14 +618,15 @@ class RouterConnection(LoggerMixin):
 class ConnectionManager(LoggerMixin):
     def __init__(self, *args, router_hostname: str, db_id: str, node_name: str = '',
                  shutdown_event: Optional[threading.Event] = None, max_parallel_req: int = 1,
-                 max_parallel_queryables: int = 1, **kwargs):
+                 max_parallel_queryables: int = 1, subscriber_pool_workers: int = 4, **kwargs):
         """
         :param router_hostname: hostname of router
         :param db_id: databeam ID
         :param node_name: identifier of process
         :param shutdown_event: shutdown event
-        :param max_parallel_req: maximum number of parallel requests
+        :param max_parallel_req: 0 disables requests (requests are multiplexed, the number in flight is not limited)
         :param max_parallel_queryables: maximum number of parallel queryable workers
+        :param subscriber_pool_workers: threads per router connection for subscriptions with delivery mode "pool"
         """
         super().__init__(*args, **kwargs)
 
@@ -491,6 +640,7 @@ class ConnectionManager(LoggerMixin):
         self._db_id = db_id
 
         self._node_name = node_name
+        self._subscriber_pool_workers = subscriber_pool_workers
 
         if shutdown_event is not None:
             self._shutdown_ev = shutdown_event
@@ -502,7 +652,8 @@ class ConnectionManager(LoggerMixin):
         self._router_connections: Dict[str, RouterConnection] = {
             self._db_id: RouterConnection(db_id=self._db_id, router_hostname=self._router_hostname,
                                           node_name=self._node_name, max_parallel_req=max_parallel_req,
-                                          max_parallel_queryables=max_parallel_queryables)
+                                          max_parallel_queryables=max_parallel_queryables,
+                                          subscriber_pool_workers=subscriber_pool_workers)
         }
 
         # list of databeam IDs and hostnames
@@ -542,7 +693,8 @@ class ConnectionManager(LoggerMixin):
             raise ValueError(f'no known hostname for DBID {db_id}')
         new_connection = RouterConnection(db_id=db_id, router_hostname=self._dbid_hostnames[db_id],
                                           node_name=f'{self._db_id}/{self._node_name}', max_parallel_req=1,
-                                          max_parallel_queryables=0)
+                                          max_parallel_queryables=0,
+                                          subscriber_pool_workers=self._subscriber_pool_workers)
         self._router_connections[db_id] = new_connection
 
     def declare_queryable(self, key: Key, cb: Callable[[bytes], str | bytes]) -> str:
@@ -574,13 +726,61 @@ class ConnectionManager(LoggerMixin):
             self.logger.error(f'EX CM request ({type(e).__name__}): {e}\n{traceback.format_exc()}')
             raise e
 
-    def subscribe(self, key: Key, cb: Callable[[str, bytes], None]) -> int:
+    def request_async(self, key: Key, data: bytes | str | None = None, timeout=1.0) -> Future:
+        """
+        request something from a queryable without blocking
+        :return: Future with the reply (bytes), raising TimeoutError or ConnectionException
+                 (in asyncio code: await asyncio.wrap_future(future))
+        """
+        assert self.initialized, 'connection manager not initialized'
+        with self._router_connections_lock:
+            if key.db_id not in self._router_connections:
+                self._add_external_router_connection(key.db_id)
+        return self._router_connections[key.db_id].request_async(key, data, timeout)
+
+    def scatter_gather(self, requests: Dict[T, Tuple[Key, bytes | str | None]],
+                       timeout=1.0) -> Iterator[Tuple[T, Optional[bytes]]]:
+        """
+        Send all requests at once and collect the replies as they arrive, with one deadline for all of them.
+        :param requests: request name -> (key, data)
+        :param timeout: float in seconds, deadline for all replies
+        :return: iterator of (name, reply) in the order of arrival, (name, None) for requests failed or without
+                 reply at the deadline
+        """
+        futures: Dict[Future, T] = {}
+        for name, (key, data) in requests.items():
+            try:
+                futures[self.request_async(key, data, timeout)] = name
+            except Exception as e:
+                self.logger.error(f'EX scatter_gather {key} ({type(e).__name__}): {e}')
+                yield name, None
+        # the request workers enforce the deadline, the margin only guards against a stuck worker
+        done = set()
+        try:
+            for future in as_completed(futures, timeout=timeout + 1.0):
+                done.add(future)
+                try:
+                    yield futures[future], future.result()
+                except Exception as e:
+                    self.logger.debug('scatter_gather %s: %s', futures[future], type(e).__name__)
+                    yield futures[future], None
+        except TimeoutError:
+            for future, name in futures.items():
+                if future not in done:
+                    future.cancel()
+                    yield name, None
+
+    def subscribe(self, key: Key, cb: Callable[[str, bytes], None], delivery: Optional[DeliveryPolicy] = None) -> int:
+        """
+        :param delivery: how the callback is invoked (None: inline on the receiving thread, see DeliveryPolicy)
+        :return: subscription id
+        """
         assert self.initialized, 'connection manager not initialized'
         self.logger.debug('registering subscriber %s', key)
         with self._router_connections_lock:
             if key.db_id not in self._router_connections:
                 self._add_external_router_connection(key.db_id)
-            return self._router_connections[key.db_id].subscribe(key, cb)
+            return self._router_connections[key.db_id].subscribe(key, cb, delivery)
 
     def unsubscribe(self, sub_id: int) -> None:
         assert self.initialized, 'connection manager not initialized'
@@ -589,6 +789,16 @@ class ConnectionManager(LoggerMixin):
             for nc in self._router_connections.values():
                 nc.unsubscribe(sub_id)
 
+    def get_subscriber_stats(self) -> Dict[int, Dict]:
+        """
+        delivery counters (delivered, dropped, conflated, errors, queued) and lag per subscription id
+        """
+        stats = {}
+        with self._router_connections_lock:
+            for nc in self._router_connections.values():
+                stats.update(nc.get_subscriber_stats())
+        return stats
+
     def declare_publisher(self, key: Key) -> int:
         assert self.initialized, 'connection manager not initialized'
         with self._router_connections_lock:
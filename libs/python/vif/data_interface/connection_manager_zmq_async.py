@@ -0,0 +1,376 @@
+"""
+asyncio variant of the ZMQ ConnectionManager (zmq.asyncio) for services running an event loop.
+
+Same routers, Key semantics and wire format as ConnectionManager, all sockets are used from the event loop only:
+    reply = await cm.request(Key(db_id, 'c', 'module_registry'), data)
+    async with cm.subscribe(Key(db_id, 'c', 'job_list')) as sub:
+        async for topic, payload in sub:
+            ...
+    await cm.publish(key, data)
+
+Create and use the manager inside one event loop (its reader tasks are started on first use) and call
+"await cm.close()" before the loop ends.
+"""
+
+import asyncio
+import collections
+import inspect
+import logging
+import random
+import traceback
+import uuid
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+import zmq
+import zmq.asyncio
+import environ
+
+from vif.logger.logger import LoggerMixin
+from vif.zmq.helpers import create_connect
+from vif.data_interface.connection_manager_zmq import BrokerEnv, ConnectionException, Key, QueryableEnvelope
+
+_CLOSED = object()
+
+
+class AsyncSubscription:
+    def __init__(self, key: Key, unsubscribe: Callable[['AsyncSubscription'], None], max_queued: int):
+        """
+        Async iterator of (topic, payload) for one subscription. Messages are queued until consumed, the oldest is
+        dropped when max_queued messages are waiting (see dropped).
+        """
+        self.key = key
+        self.sub_id = uuid.uuid4().int
+        self.dropped = 0
+        self._unsubscribe = unsubscribe
+        self._max_queued = max_queued
+        self._queue: Deque = collections.deque()
+        self._waiter: Optional[asyncio.Future] = None
+        self._closed = False
+
+    def _put(self, item) -> None:
+        if self._closed:
+            return
+        if len(self._queue) >= self._max_queued and item is not _CLOSED:
+            self._queue.popleft()
+            self.dropped += 1
+        self._queue.append(item)
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    def close(self) -> None:
+        """ unsubscribe, a running iteration ends after the queued messages """
+        if not self._closed:
+            self._unsubscribe(self)
+            self._put(_CLOSED)
+            self._closed = True
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Tuple[str, bytes]:
+        while len(self._queue) == 0:
+            self._waiter = asyncio.get_running_loop().create_future()
+            try:
+                await self._waiter
+            finally:
+                self._waiter = None
+        item = self._queue.popleft()
+        if item is _CLOSED:
+            raise StopAsyncIteration
+        return item
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AsyncRouterConnection(LoggerMixin):
+    def __init__(self, *args, db_id: str, router_hostname: str, node_name: str = '', **kwargs):
+        """
+        Handle connection to single ZMQ router (sockets are created on first use)
+        """
+        super().__init__(*args, logger_name=f'AsyncRouterConnection {db_id}', **kwargs)
+        self._db_id = db_id
+        self._router_hostname = router_hostname
+        self._node_name = node_name
+        self._ports = environ.to_config(BrokerEnv)
+
+        self._tasks: List[asyncio.Task] = []
+        # requests: one DEALER socket, replies are matched to the waiting futures by UUID
+        self._req_sock: Optional[zmq.asyncio.Socket] = None
+        self._pending: Dict[bytes, asyncio.Future] = {}
+        # subscriptions: one SUB socket, key (topic): subscriptions
+        self._sub_sock: Optional[zmq.asyncio.Socket] = None
+        self._subscribers: Dict[str, List[AsyncSubscription]] = {}
+        # publishing: one PUB socket (only used from the event loop: no lock)
+        self._pub_sock: Optional[zmq.asyncio.Socket] = None
+        # queryables: one DEALER socket to the router backend, topic -> callback
+        self._query_sock: Optional[zmq.asyncio.Socket] = None
+        self._queryables: Dict[str, Callable[[bytes], str | bytes | None | Awaitable[str | bytes | None]]] = {}
+        self._query_tasks = set()
+
+    def _uri(self, port: str) -> str:
+        return f'tcp://{self._router_hostname}:{port}'
+
+    def _start_reader(self, reader: Callable[[], Awaitable[None]], name: str) -> None:
+        self._tasks.append(asyncio.get_running_loop().create_task(reader(), name=name))
+
+    async def close(self) -> None:
+        self.logger.info('closing connection to %s', self._db_id)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._query_tasks, return_exceptions=True)
+        self._tasks.clear()
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_exception(ConnectionException('connection closed'))
+        self._pending.clear()
+        for sub in [sub for subs in self._subscribers.values() for sub in subs]:
+            sub.close()
+        for sock in (self._req_sock, self._sub_sock, self._pub_sock, self._query_sock):
+            if sock is not None:
+                sock.close()
+
+    # requests
+
+    async def _reply_reader(self) -> None:
+        while True:
+            try:
+                rx = QueryableEnvelope.from_multipart(await self._req_sock.recv_multipart())
+                fut = self._pending.pop(rx.uuid, None)
+                if fut is None:
+                    self.logger.warning(f'discarding late reply {rx.uuid.hex()} from {rx.ident}/{rx.topic}')
+                elif not fut.done():
+                    fut.set_result(rx.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f'EX reply reader ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+
+    async def request(self, key: Key, data: bytes | str | None = None, timeout=1.0) -> Optional[bytes]:
+        if len(self._node_name) == 0:
+            raise ConnectionException(f'requests not supported on connection {self._db_id}')
+        if self._req_sock is None:
+            ident = Key(self._db_id, self._node_name, topic='-').ident
+            # random identity suffix: does not collide with the sockets of a threaded ConnectionManager
+            self._req_sock = create_connect(self._uri(self._ports.DB_ROUTER_FRONTEND_PORT), zmq.asyncio,
+                                            zmq.DEALER, identity=f'{ident}a{uuid.uuid4().hex[:8]}'.encode())
+            self._start_reader(self._reply_reader, f'reply_reader {self._db_id}')
+
+        if isinstance(data, str):
+            data = data.encode()
+        elif data is None:
+            data = b''
+        req = QueryableEnvelope(ident=key.ident, uuid=random.randbytes(8), topic=key.topic, payload=data)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[req.uuid] = fut
+        try:
+            await self._req_sock.send_multipart(req.to_multipart())
+            return await asyncio.wait_for(fut, timeout)
+        except asyncio.TimeoutError:
+            self.logger.error(f'request {key} - timeout (limit: {timeout} s)')
+        except Exception as e:
+            self.logger.error(f'EX request ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+        finally:
+            self._pending.pop(req.uuid, None)
+        return None
+
+    # subscriptions
+
+    async def _sub_reader(self) -> None:
+        while True:
+            try:
+                topic_bytes, rx_msg = await self._sub_sock.recv_multipart()
+                topic = topic_bytes.decode()
+                for sub in self._subscribers.get(topic, ()):
+                    sub._put((topic, rx_msg))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f'EX subscription reader ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+
+    def subscribe(self, key: Key, max_queued: int = 1000) -> AsyncSubscription:
+        if self._sub_sock is None:
+            self._sub_sock = create_connect(self._uri(self._ports.DB_ROUTER_PUB_PORT), zmq.asyncio, zmq.SUB)
+            self._sub_sock.setsockopt(zmq.RCVHWM, 10000)
+            self._start_reader(self._sub_reader, f'sub_reader {self._db_id}')
+        topic = str(key)
+        sub = AsyncSubscription(key, self.unsubscribe, max_queued)
+        if topic not in self._subscribers:
+            self._subscribers[topic] = []
+            self._sub_sock.subscribe(topic)
+        self._subscribers[topic].append(sub)
+        return sub
+
+    def unsubscribe(self, sub: AsyncSubscription) -> None:
+        topic = str(sub.key)
+        subs = self._subscribers.get(topic, [])
+        if sub in subs:
+            subs.remove(sub)
+            if len(subs) == 0:
+                self._subscribers.pop(topic)
+                self._sub_sock.unsubscribe(topic)
+
+    # publishing
+
+    def declare_publisher(self) -> None:
+        if self._pub_sock is None:
+            self._pub_sock = create_connect(self._uri(self._ports.DB_ROUTER_SUB_PORT), zmq.asyncio, zmq.PUB)
+            self._pub_sock.setsockopt(zmq.SNDHWM, 100000)
+
+    async def publish(self, key: Key, data: bytes | str) -> None:
+        self.declare_publisher()
+        try:
+            await self._pub_sock.send_multipart([key.encode(), data.encode() if isinstance(data, str) else data])
+        except Exception as e:
+            self.logger.error(f'EX publish {key} ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+
+    # queryables
+
+    async def _answer_query(self, msg: QueryableEnvelope) -> None:
+        try:
+            cb = self._queryables.get(msg.topic)
+            if cb is None:
+                self.logger.warning(f'no callback registered for topic {msg.topic} in node {self._node_name}')
+                return
+            reply = cb(msg.payload)
+            if inspect.isawaitable(reply):
+                reply = await reply
+            msg.payload = reply.encode() if isinstance(reply, str) else (b'' if reply is None else reply)
+            await self._query_sock.send_multipart(msg.to_multipart())
+        except Exception as e:
+            self.logger.error(f'EX queryable {msg.topic} ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+
+    async def _query_reader(self) -> None:
+        while True:
+            try:
+                msg = QueryableEnvelope.from_multipart(await self._query_sock.recv_multipart())
+                # answer concurrently (callbacks may await)
+                task = asyncio.get_running_loop().create_task(self._answer_query(msg))
+                self._query_tasks.add(task)
+                task.add_done_callback(self._query_tasks.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f'EX query reader ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+
+    def declare_queryable(self, key: Key,
+                          cb: Callable[[bytes], str | bytes | None | Awaitable[str | bytes | None]]) -> str:
+        assert str(key).startswith(f'{self._db_id}/{self._node_name}'), 'queryable key must start with node name'
+        if self._query_sock is None:
+            ident = Key(self._db_id, self._node_name, topic='-').ident
+            self._query_sock = create_connect(self._uri(self._ports.DB_ROUTER_BACKEND_PORT), zmq.asyncio,
+                                              zmq.DEALER, identity=ident.encode())
+            self._start_reader(self._query_reader, f'query_reader {self._db_id}')
+        assert key.topic not in self._queryables, f'queryable {key.topic} already registered'
+        self._queryables[key.topic] = cb
+        return key.topic
+
+    def undeclare_queryable(self, topic: str) -> None:
+        self._queryables.pop(topic)
+
+
+class AsyncConnectionManager(LoggerMixin):
+    def __init__(self, *args, router_hostname: str, db_id: str, node_name: str = '', **kwargs):
+        """
+        :param router_hostname: hostname of router
+        :param db_id: databeam ID
+        :param node_name: identifier of process (requests and queryables need one)
+        """
+        super().__init__(*args, **kwargs)
+        assert len(router_hostname) > 0, 'CONNECTION_ROUTER environment variable not set'
+        assert len(db_id) > 0, 'db_id must not be empty'
+        self._router_hostname = router_hostname
+        self._db_id = db_id
+        self._node_name = node_name
+        self._router_connections: Dict[str, AsyncRouterConnection] = {
+            db_id: AsyncRouterConnection(db_id=db_id, router_hostname=router_hostname, node_name=node_name)
+        }
+        # list of databeam IDs and hostnames
+        self._dbid_hostnames: Dict[str, str] = {}
+        self.initialized = True
+
+    async def close(self) -> None:
+        self.initialized = False
+        for nc in self._router_connections.values():
+            await nc.close()
+        self._router_connections.clear()
+        self.logger.info('terminated')
+
+    def set_external_databeams(self, db_ids: List[str], hostnames: List[str]):
+        if len(db_ids) != len(hostnames):
+            raise ValueError('db_ids and hostnames must have the same length')
+        self.logger.info('adding %d external databeams: %s %s', len(db_ids), db_ids, hostnames)
+        self._dbid_hostnames = dict(zip(db_ids, hostnames))
+
+    def get_external_databeam_ids(self) -> List[str]:
+        return list(self._dbid_hostnames.keys())
+
+    def _connection(self, db_id: str) -> AsyncRouterConnection:
+        assert self.initialized, 'connection manager not initialized'
+        if db_id not in self._router_connections:
+            if db_id not in self._dbid_hostnames:
+                raise ValueError(f'no known hostname for DBID {db_id}')
+            self._router_connections[db_id] = AsyncRouterConnection(
+                db_id=db_id, router_hostname=self._dbid_hostnames[db_id], node_name=f'{self._db_id}/{self._node_name}')
+        return self._router_connections[db_id]
+
+    async def request(self, key: Key, data: bytes | str | None = None, timeout=1.0) -> Optional[bytes]:
+        """
+        request something from a queryable
+        :return: bytes, or None on error / timeout
+        """
+        return await self._connection(key.db_id).request(key, data, timeout)
+
+    def subscribe(self, key: Key, max_queued: int = 1000) -> AsyncSubscription:
+        """
+        :param max_queued: messages waiting for the consumer, the oldest are dropped
+        :return: async iterator of (topic, payload), close() or "async with" to unsubscribe
+        """
+        self.logger.debug('registering subscriber %s', key)
+        return self._connection(key.db_id).subscribe(key, max_queued)
+
+    def unsubscribe(self, sub: AsyncSubscription) -> None:
+        sub.close()
+
+    def declare_publisher(self, key: Key) -> None:
+        """
+        Optional: connects the publisher socket ahead of the first publish (messages published before the connection
+        to the router is established are lost). Publishing needs no declaration and no locks.
+        """
+        self._connection(key.db_id).declare_publisher()
+
+    async def publish(self, key: Key, data: bytes | str) -> None:
+        await self._connection(key.db_id).publish(key, data)
+
+    def declare_queryable(self, key: Key,
+                          cb: Callable[[bytes], str | bytes | None | Awaitable[str | bytes | None]]) -> str:
+        """
+        :param cb: plain function or coroutine function returning the reply
+        """
+        assert key.db_id == self._db_id, 'queryable must be declared on our own DBID'
+        return self._connection(self._db_id).declare_queryable(key, cb)
+
+    def undeclare_queryable(self, topic: str) -> None:
+        self._connection(self._db_id).undeclare_queryable(topic)
+
+
+if __name__ == '__main__':
+    async def main():
+        LoggerMixin.configure_logger(level='DEBUG')
+        cm = AsyncConnectionManager(router_hostname='localhost', db_id='dbid', node_name='async_test')
+        cm.declare_queryable(Key('dbid', 'async_test', 'echo'), lambda data: data)
+        cm.declare_publisher(Key('dbid', 'async_test', 'topic'))
+        async with cm.subscribe(Key('dbid', 'async_test', 'topic')) as sub:
+            await asyncio.sleep(0.2)  # publisher and subscription connect to the router
+            await cm.publish(Key('dbid', 'async_test', 'topic'), 'hello')
+            async for topic, payload in sub:
+                logging.info('received %s: %s', topic, payload)
+                break
+        replies = await asyncio.gather(*(cm.request(Key('dbid', 'async_test', 'echo'), f'{i}') for i in range(100)))
+        logging.info('%d replies', sum(reply is not None for reply in replies))
+        await cm.close()
+
+    asyncio.run(main())
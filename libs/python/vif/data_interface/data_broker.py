@@ -4,12 +4,18 @@ from dataclasses import dataclass
 from pathlib import Path
 import re
 from functools import lru_cache
-from typing import Optional, Dict, Tuple, List, Union
+from typing import TYPE_CHECKING, Optional, Dict, Tuple, List, Union, Sequence
+
+import orjson
 
 from vif.logger.logger import LoggerMixin
 from vif.data_interface.network_messages import ModuleDataConfig
 from vif.data_interface.data_capture_worker import DataCaptureWorker
 from vif.data_interface.data_live_forwarder import DataLiveForwarder
+from vif.data_interface.sample_block import SampleBlock
+
+if TYPE_CHECKING:
+    import numpy as np
 
 
 @dataclass
@@ -30,6 +36,11 @@ class DataBroker(LoggerMixin):
         # replace the following characters in channel names for mcap compatibility
         self._replace_name_chars_re = re.compile(r'[^a-zA-Z0-9_-]')
         self._latest_data_list: List[Tuple[int, Union[Dict, None]]] = []
+        # schema index -> channel names (sanitized once) for data_in_fast, see register_schema
+        self._registered_keys: Dict[int, Tuple[str, ...]] = {}
+        # serialize samples to JSON once in data_in and pass the bytes to capture and live processes
+        # (disable to pass dicts and let each child process serialize on its own)
+        self.serialize_in_producer: bool = True
 
         self._possible_schema_change_event = multiprocessing.Event()
 
@@ -58,9 +69,10 @@ class DataBroker(LoggerMixin):
     def get_module_data_dir(self, measurement_name: str) -> Path:
         return self.data_capture_worker.get_module_data_dir(measurement_name)
 
-    def prepare_capturing(self, measurement_name: str, data_schemas: List[Dict]):
+    def prepare_capturing(self, measurement_name: str, data_schemas: List[Dict],
+                          data_config: Optional[ModuleDataConfig] = None):
         if self.capabilities.capture_data:
-            self.data_capture_worker.prepare_capturing(measurement_name, data_schemas)
+            self.data_capture_worker.prepare_capturing(measurement_name, data_schemas, data_config)
 
     def start_capturing(self) -> bool:
         """
@@ -72,7 +84,19 @@ class DataBroker(LoggerMixin):
 
     def stop_capturing(self):
         if self.capabilities.capture_data:
-            self.data_capture_worker.stop_capturing()
+            live_stats = {'live': self.data_live_forwarder.get_queue_stats()} if self.capabilities.live_data else {}
+            self.data_capture_worker.stop_capturing(queue_stats=live_stats)
+
+    def get_queue_stats(self) -> Dict:
+        """
+        counters of the queues to the capture and live process (see OverloadQueue)
+        """
+        stats = {}
+        if self.capabilities.capture_data:
+            stats['capture'] = self.data_capture_worker.get_queue_stats()
+        if self.capabilities.live_data:
+            stats['live'] = self.data_live_forwarder.get_queue_stats()
+        return stats
 
     def notify_possible_schema_change(self):
         self.logger.debug('possible schema change detected')
@@ -82,26 +106,114 @@ class DataBroker(LoggerMixin):
     def replace_name_chars(self, name):
         return self._replace_name_chars_re.sub('_', name)
 
+    def register_schema(self, keys: Sequence[str], schema_index: int = 0) -> Tuple[str, ...]:
+        """
+        Declare the channel names of a schema with fixed keys for data_in_fast. Names are checked and replaced once.
+        :param keys: channel names in the order of the values passed to data_in_fast
+        :return: channel names as used in capture and live data
+        """
+        names = tuple(self.replace_name_chars(key) for key in keys)
+        if len(set(names)) != len(names):
+            raise ValueError(f'duplicate channel names in schema {schema_index}: {names}')
+        self._registered_keys[schema_index] = names
+        return names
+
+    def data_in_fast(self, time_ns: int, values: Sequence, schema_index: int = 0,
+                     mcap: bool = True, live: bool = True, latest: bool = True):
+        """
+        Same as data_in for a schema declared with register_schema: values only (tuple, list or numpy row) in the
+        registered order, channel names are not checked per sample.
+        """
+        try:
+            keys = self._registered_keys[schema_index]
+        except KeyError:
+            raise ValueError(f'schema {schema_index} not registered') from None
+        if hasattr(values, 'tolist'):
+            values = values.tolist()  # numpy row to python scalars (JSON, columnar capture)
+        if len(values) != len(keys):
+            raise ValueError(f'schema {schema_index}: expected {len(keys)} values, got {len(values)}')
+        self._data_in(time_ns, dict(zip(keys, values)), schema_index, mcap, live, latest)
+
     def data_in(self, time_ns: int, data: Dict, schema_index: int = 0,
                 mcap: bool = True, live: bool = True, latest: bool = True):
-        # check channel names and replace
-        # TODO timeit @lru_cache and use replace function
+        # check channel names and replace (use register_schema and data_in_fast for fixed keys)
         data = {self.replace_name_chars(key): value for key, value in data.items()}
+        self._data_in(time_ns, data, schema_index, mcap, live, latest)
+
+    def data_in_batch(self, times_ns: 'np.ndarray', values: Union['np.ndarray', Dict[str, 'np.ndarray']],
+                      schema_index: int = 0, mcap: bool = True, live: bool = True, latest: bool = True):
+        """
+        Pass a block of samples of one schema at once (e.g. from block-acquiring devices). The block is moved to the
+        capture and live process as one item and unpacked there, latest data is updated with the last sample.
+        :param times_ns: timestamps of the samples, shape (n,)
+        :param values: array of shape (n, channels) in the order given to register_schema,
+                       or dict of channel name -> array of shape (n,)
+        """
+        # imported on use: numpy is not a requirement of modules which do not use blocks
+        import numpy as np
+
+        times_ns = np.asarray(times_ns, dtype=np.int64)
+        if isinstance(values, dict):
+            keys = tuple(self.replace_name_chars(key) for key in values.keys())
+            columns = [np.asarray(column) for column in values.values()]
+        else:
+            try:
+                keys = self._registered_keys[schema_index]
+            except KeyError:
+                raise ValueError(f'schema {schema_index} not registered') from None
+            values = np.asarray(values)
+            if values.ndim != 2 or values.shape[1] != len(keys):
+                raise ValueError(f'schema {schema_index}: expected shape (n, {len(keys)}), got {values.shape}')
+            columns = list(values.T)
+        if any(column.shape != times_ns.shape for column in columns):
+            raise ValueError(f'schema {schema_index}: all columns need the shape of times_ns {times_ns.shape}')
+        if len(times_ns) == 0:
+            return
+
+        block = SampleBlock(schema_index=schema_index, times_ns=times_ns, keys=keys, columns=columns)
+        if latest:
+            self._set_latest(schema_index, *block.last())
 
+        if mcap and self.data_capture_worker.is_active():
+            self.data_capture_worker.capture_block(block)
+        if live and self.data_live_forwarder.is_active():
+            self.data_live_forwarder.forward_block(block)
+
+    def _set_latest(self, schema_index: int, time_ns: int, data: Dict):
+        while len(self._latest_data_list) <= min(schema_index, 20):
+            self._latest_data_list.append((0, None))
+
+        self._latest_data_list[schema_index] = (time_ns, data)
+
+    def _data_in(self, time_ns: int, data: Dict, schema_index: int, mcap: bool, live: bool, latest: bool):
         # store data as latest data if flag is set
         if latest:
-            while len(self._latest_data_list) <= min(schema_index, 20):
-                self._latest_data_list.append((0, None))
+            self._set_latest(schema_index, time_ns, data)
+
+        capture = mcap and self.data_capture_worker.is_active()
+        forward = live and self.data_live_forwarder.is_active()
+        if not capture and not forward:
+            return
+
+        # columnar capture packs the values itself and needs the dict, as does the live aggregation
+        columnar = capture and self.data_capture_worker.is_columnar(schema_index)
+        forward_dict = forward and self.data_live_forwarder.needs_dict()
 
-            self._latest_data_list[schema_index] = (time_ns, data)
+        payload: Union[Dict, bytes] = data
+        if self.serialize_in_producer and ((forward and not forward_dict) or (capture and not columnar)):
+            try:
+                payload = orjson.dumps(data)  # NaN is written as null
+            except orjson.JSONEncodeError as e:
+                self.logger.error(f'EX data_in JSON {type(e).__name__}: {e}')
+                return
 
         # pass data to worker processes for mcap-writing
-        if self.data_capture_worker.is_active() and mcap:
-            self.data_capture_worker.capture_data(time_ns, schema_index, data)
+        if capture:
+            self.data_capture_worker.capture_data(time_ns, schema_index, data if columnar else payload)
 
         # forward live-data only if needed
-        if self.data_live_forwarder.is_active() and live:
-            self.data_live_forwarder.forward_data(time_ns, schema_index, data)
+        if forward:
+            self.data_live_forwarder.forward_data(time_ns, schema_index, data if forward_dict else payload)
 
     def get_latest(self, schema_index: int = 0) -> Tuple[int, Optional[Dict]]:
         if schema_index < len(self._latest_data_list):
@@ -1,4 +1,5 @@
 import os
+import json
 import time
 import logging
 import threading
@@ -13,11 +14,18 @@ from dataclasses import dataclass
 from enum import Enum
 
 import orjson
-from mcap.writer import Writer as McapWriter, CompressionType
 
 from vif.logger.logger import LoggerMixin, log_reentrant
 from vif.file_helpers.creation import create_directory
 from vif.data_interface.helpers import empty_queue, check_leftover_threads
+from vif.data_interface.batch_queue import BatchQueue
+from vif.data_interface.overload_queue import OverloadQueue, OverloadPolicy, create_written_counter
+from vif.data_interface.mcap_writer import McapChunkWriter, COMPRESSION_TYPES
+from vif.data_interface.spill_wal import WalWriter, WalReader
+from vif.data_interface.sample_block import SampleBlock
+from vif.data_interface.network_messages import ModuleDataConfig
+from vif.data_interface.columnar import (ColumnarBatch, columnar_layout, columnar_channel_metadata,
+                                         COLUMNAR_MESSAGE_ENCODING, COLUMNAR_METADATA_NAME)
 
 
 @dataclass
@@ -27,9 +35,155 @@ class CaptureCommand:
         STOP = 1
 
     cmd: Command
+    # STOP: producer side queue counters, stored in module_meta.json together with the written count
+    queue_stats: Optional[Dict] = None
     measurement_name: str = ''
     measurement_dir: Path = Path()
     module_data_schemas: Optional[List] = None
+    # schema indices written as columnar binary channels (see columnar.py)
+    columnar_schemas: Optional[List[int]] = None
+    # start a new segment file when one of the limits is reached (0: disabled)
+    rotate_size_bytes: int = 0
+    rotate_duration_ns: int = 0
+    rotate_sample_count: int = 0
+    # MCAP writer settings
+    chunk_size: int = 1024 * 1024
+    compression: str = 'zstd'
+    compression_level: Optional[int] = None
+    compression_threads: int = 0
+
+    def rotation_enabled(self) -> bool:
+        return self.rotate_size_bytes > 0 or self.rotate_duration_ns > 0 or self.rotate_sample_count > 0
+
+
+class McapSegment:
+    # a columnar batch is written as one message when it reaches this size or time span
+    COLUMNAR_BATCH_SIZE = 1000
+    COLUMNAR_BATCH_SPAN_NS = 1_000_000_000
+
+    def __init__(self, logger: logging.Logger, measurement_dir: Path, module_name: str, module_type: str,
+                 cap_cmd: CaptureCommand, segment_index: Optional[int] = None):
+        """
+        One MCAP file of a capture. Written as ".partXXXX.mcap" and renamed when finished.
+        :param cap_cmd: START command with schemas and writer settings
+        :param segment_index: number of the segment if files are rotated (file name "<module>.<index>.mcap"),
+                              None for a single file "<module>.mcap"
+        """
+        self._logger = logger
+        self._measurement_dir = measurement_dir
+        self.stem = module_name if segment_index is None else f'{module_name}.{segment_index:04d}'
+        self.sample_count: int = 0
+        self.first_ts: Optional[int] = None
+
+        # save as ".partXXXX.mcap" file and move when done
+        self._temp_filename_ts = time.time_ns()
+        self._temp_filename = f'{self.stem}.part{self._temp_filename_ts}.mcap'
+        self._mcap_file = open(measurement_dir / self._temp_filename, 'wb')
+        self._channel_ids = []
+        # schema index -> ColumnarBatch for columnar channels
+        self._columnar_batches: Dict[int, ColumnarBatch] = {}
+        # topic -> number of samples written to columnar channels
+        self._columnar_counts: Dict[str, int] = {}
+
+        self._writer = McapChunkWriter(self._mcap_file, chunk_size=cap_cmd.chunk_size,
+                                       compression=cap_cmd.compression, compression_level=cap_cmd.compression_level,
+                                       compression_threads=cap_cmd.compression_threads)
+        self._writer.start()
+        # create a schema for each in list
+        columnar_schemas = cap_cmd.columnar_schemas or []
+        for idx, s in enumerate(cap_cmd.module_data_schemas):
+            new_schema = self._writer.register_schema(
+                name=f'{module_type}_{idx}' if 'dtype_name' not in s else s['dtype_name'],
+                encoding='jsonschema',
+                data=orjson.dumps(s))
+            self._logger.info(f'new schema: {new_schema} with topic: '
+                              f'{module_type if "topic" not in s else s["topic"]}')
+            topic = module_name if 'topic' not in s else s['topic']
+            layout = columnar_layout(s) if idx in columnar_schemas else None
+            if layout is not None:
+                self._columnar_batches[idx] = ColumnarBatch(s, topic)
+                self._columnar_counts[topic] = 0
+                self._channel_ids.append(self._writer.register_channel(
+                    schema_id=new_schema,
+                    topic=topic,
+                    message_encoding=COLUMNAR_MESSAGE_ENCODING,
+                    metadata=columnar_channel_metadata(layout),
+                ))
+            else:
+                self._channel_ids.append(self._writer.register_channel(
+                    schema_id=new_schema,
+                    topic=topic,
+                    message_encoding='json',
+                ))
+
+    def size(self) -> int:
+        """ bytes written to the file so far (the currently open chunk is not included) """
+        return self._mcap_file.tell()
+
+    def _write_columnar(self, schema_idx: int):
+        col_batch = self._columnar_batches[schema_idx]
+        if len(col_batch) == 0:
+            return
+        first_ts = col_batch.first_ts()
+        self._writer.add_message(channel_id=self._channel_ids[schema_idx], data=col_batch.to_bytes(),
+                                 log_time=first_ts, publish_time=first_ts)
+        self._columnar_counts[col_batch.topic] += len(col_batch)
+        col_batch.clear()
+
+    def write(self, time_ns: int, data: Dict | bytes, schema_idx: int):
+        try:
+            col_batch = self._columnar_batches.get(schema_idx)
+            if col_batch is not None:
+                if len(col_batch) > 0 and (len(col_batch) >= self.COLUMNAR_BATCH_SIZE or
+                                           time_ns - col_batch.first_ts() > self.COLUMNAR_BATCH_SPAN_NS):
+                    self._write_columnar(schema_idx)
+                col_batch.add(time_ns, data)
+            else:
+                # data is already serialized if DataBroker.serialize_in_producer is set
+                data_json = data if isinstance(data, bytes) else orjson.dumps(data)
+                self._writer.add_message(
+                    channel_id=self._channel_ids[schema_idx],
+                    data=data_json,  # NaN not supported, null is OK
+                    log_time=time_ns, publish_time=time_ns
+                )
+            if self.first_ts is None:
+                self.first_ts = time_ns
+            self.sample_count += 1
+        except ValueError as _e:
+            self._logger.error(f'EX JSON writer {type(_e).__name__}: NaN in {data}')
+        except (TypeError, OverflowError) as _e:
+            self._logger.error(f'EX writer {type(_e).__name__}: {_e} in {data}')
+
+    def finish(self) -> Optional[Path]:
+        """
+        Write summary and index, close and rename the file.
+        :return: path of the finished file, None if writing failed (the partial file is kept for crash recovery)
+        """
+        try:
+            for schema_idx in self._columnar_batches:
+                self._write_columnar(schema_idx)
+            if len(self._columnar_counts) > 0:
+                # number of samples per columnar topic, lets readers size their buffers without a full scan
+                self._writer.add_metadata(COLUMNAR_METADATA_NAME,
+                                          {topic: str(n) for topic, n in self._columnar_counts.items()})
+        except Exception as _e:
+            self._logger.error(f'EX columnar flush {type(_e).__name__}: {_e}\n{traceback.format_exc()}')
+        try:
+            # re-raises errors of the chunk compression pipeline
+            self._writer.finish()
+        except Exception as _e:
+            self._logger.error(f'EX finish {self._temp_filename} {type(_e).__name__}: {_e}\n{traceback.format_exc()}')
+            return None
+        finally:
+            self._mcap_file.close()
+        # rename partial file to .mcap when done (atomic on the same filesystem)
+        # check if file already exists (previous crash and/or relaunch)
+        final_path = self._measurement_dir / f'{self.stem}.mcap'
+        if final_path.exists():
+            self._logger.warning('finished MCAP file already exists: %s.mcap', self.stem)
+            final_path = self._measurement_dir / f'{self.stem}.{self._temp_filename_ts}.mcap'
+        os.rename(self._measurement_dir / self._temp_filename, final_path)
+        return final_path
 
 
 class CaptureProcess(LoggerMixin, multiprocessing.Process):
@@ -38,6 +192,9 @@ class CaptureProcess(LoggerMixin, multiprocessing.Process):
                  process_ready_event: multiprocessing.synchronize.Event,
                  data_capture_queue: multiprocessing.Queue,
                  config_capture_queue: multiprocessing.Queue,
+                 written_counter,
+                 spill_records_written,
+                 spill_records_read,
                  module_name: str,
                  module_type: str,
                  **kwargs):
@@ -47,8 +204,15 @@ class CaptureProcess(LoggerMixin, multiprocessing.Process):
         self.process_ready_event = process_ready_event
         self.data_capture_queue = data_capture_queue
         self.config_capture_queue = config_capture_queue
+        # number of written samples, shared with OverloadQueue in the parent process
+        self.written_counter = written_counter
+        # record counters of the spill write-ahead log (see spill_wal.py)
+        self.spill_records_written = spill_records_written
+        self.spill_records_read = spill_records_read
         self.module_name = module_name
         self.module_type = module_type
+        # queue counters received with STOP
+        self._stop_queue_stats: Optional[Dict] = None
 
     def run(self):
         self.logger.info('started capturing process for %s', self.module_name)
@@ -76,6 +240,7 @@ class CaptureProcess(LoggerMixin, multiprocessing.Process):
 
                 if cap_cmd.cmd == CaptureCommand.Command.STOP:
                     self.logger.info('processing STOP')
+                    self._stop_queue_stats = cap_cmd.queue_stats
                     thread_capture_kill_ev.set()
                     if thread_capture is not None:
                         thread_capture.join()
@@ -83,11 +248,9 @@ class CaptureProcess(LoggerMixin, multiprocessing.Process):
                 elif cap_cmd.cmd == CaptureCommand.Command.START:
                     self.logger.info('processing START')
                     assert thread_capture is None
+                    self._stop_queue_stats = None
                     thread_capture = threading.Thread(target=self._capture_thread, name='capture_thread',
-                                                      args=[thread_capture_kill_ev,
-                                                            cap_cmd.measurement_name,
-                                                            cap_cmd.measurement_dir,
-                                                            cap_cmd.module_data_schemas])
+                                                      args=[thread_capture_kill_ev, cap_cmd])
                     thread_capture_kill_ev.clear()
                     thread_capture.start()
                 else:
@@ -110,34 +273,21 @@ class CaptureProcess(LoggerMixin, multiprocessing.Process):
         self.logger.info('finished capturing process for %s', self.module_name)
         self.logger.debug(check_leftover_threads())
 
-    def _capture_thread(self, thread_capture_kill_ev: threading.Event, measurement_name: str, measurement_dir: Path,
-                        module_data_schemas: List):
+    def _capture_thread(self, thread_capture_kill_ev: threading.Event, cap_cmd: CaptureCommand):
         cap_logger = logging.getLogger('DataBroker.capture_thread')
-        cap_logger.info('starting thread for %s', measurement_name)
+        cap_logger.info('starting thread for %s', cap_cmd.measurement_name)
+        measurement_dir = Path(cap_cmd.measurement_dir)
+        rotate = cap_cmd.rotation_enabled()
+        segment_index = 0
+
+        def new_segment() -> McapSegment:
+            return McapSegment(cap_logger, measurement_dir, self.module_name, self.module_type, cap_cmd,
+                               segment_index=segment_index if rotate else None)
+
         try:
             # make sure directory exists
-            create_directory(Path(measurement_dir))
-            # save as ".partXXXX.mcap" file and move when done
-            temp_filename_ts = time.time_ns()
-            temp_filename = f'{self.module_name}.part{temp_filename_ts}.mcap'
-            mcap_file = open(measurement_dir / temp_filename, 'wb')
-            json_channel_ids = []
-
-            writer = McapWriter(mcap_file, compression=CompressionType.ZSTD, use_chunking=True)
-            writer.start()
-            # create a schema for each in list
-            for idx, s in enumerate(module_data_schemas):
-                new_schema = writer.register_schema(
-                    name=f'{self.module_type}_{idx}' if 'dtype_name' not in s else s['dtype_name'],
-                    encoding='jsonschema',
-                    data=orjson.dumps(s))
-                cap_logger.info(f'new schema: {new_schema} with topic: '
-                                f'{self.module_type if "topic" not in s else s["topic"]}')
-                json_channel_ids.append(writer.register_channel(
-                    schema_id=new_schema,
-                    topic=self.module_name if 'topic' not in s else s['topic'],
-                    message_encoding='json',
-                ))
+            create_directory(measurement_dir)
+            segment = new_segment()
         except Exception as _e:
             cap_logger.error(f'EX thread setup {type(_e).__name__}: {_e}\n{traceback.format_exc()}')
             return
@@ -145,48 +295,102 @@ class CaptureProcess(LoggerMixin, multiprocessing.Process):
         # signal parent, that we are ready
         self.process_ready_event.set()
 
+        def rotation_due(time_ns: int) -> bool:
+            return ((0 < cap_cmd.rotate_sample_count <= segment.sample_count) or
+                    (0 < cap_cmd.rotate_size_bytes <= segment.size()) or
+                    (cap_cmd.rotate_duration_ns > 0 and segment.first_ts is not None and
+                     time_ns - segment.first_ts >= cap_cmd.rotate_duration_ns))
+
+        def write_batch(batch: List[Tuple[int, Dict | bytes, int]] | SampleBlock):
+            nonlocal segment, segment_index
+            for time_ns, data, schema_idx in batch:
+                if rotate and rotation_due(time_ns):
+                    # finalize the current segment: crash recovery only has to deal with the open one
+                    finished = segment.finish()
+                    if finished is not None:
+                        cap_logger.info('finished segment %s (%d samples)', finished.name, segment.sample_count)
+                    segment_index += 1
+                    segment = new_segment()
+                segment.write(time_ns, data, schema_idx)
+            self.written_counter.value += len(batch)
+
+        # batches spilled by the producer (OverloadPolicy.SPILL) are merged in the order they were produced
+        wal = WalReader(directory=measurement_dir, module_name=self.module_name,
+                        records_written=self.spill_records_written, records_read=self.spill_records_read)
+        queue_items = 0
+
+        def next_batch(timeout: float) -> List[Tuple[int, Dict | bytes, int]] | SampleBlock:
+            """ next batch from the queue or the spill log, raises queue.Empty (timeout 0: do not wait) """
+            nonlocal queue_items
+            queued_before = wal.next_queued_before()
+            if queued_before is not None and queued_before <= queue_items:
+                return wal.read()
+            try:
+                batch = self.data_capture_queue.get(timeout=timeout) if timeout > 0 \
+                    else self.data_capture_queue.get_nowait()
+            except queue.Empty:
+                if queued_before is None:
+                    raise
+                # queue items the record waits for were lost (e.g. queue emptied on start): do not stall the log
+                return wal.read()
+            queue_items += 1
+            return batch
+
         while not thread_capture_kill_ev.is_set():
             try:
                 try:
-                    raw = self.data_capture_queue.get(timeout=0.2)
+                    raw = next_batch(timeout=0.2)
                 except queue.Empty:
                     continue  # no data - check event and try again
                 if raw is None:
                     cap_logger.error('received None')
                     continue
 
-                time_ns, data, schema_idx = raw
-
-                assert isinstance(data, dict)
-                try:
-                    data_json = orjson.dumps(data)
-                    writer.add_message(
-                        channel_id=json_channel_ids[schema_idx],
-                        data=data_json,  # NaN not supported, null is OK
-                        log_time=time_ns, publish_time=time_ns
-                    )
-                except ValueError as _e:
-                    cap_logger.error(f'EX JSON writer {type(_e).__name__}: NaN in {data}')
-
-                # TODO file rotation
+                assert isinstance(raw, (list, SampleBlock))
+                write_batch(raw)
 
             except Exception as _e:
                 cap_logger.error(f'EX {type(_e).__name__}: {_e}\n{traceback.format_exc()}')
 
+        # write batches which were already queued or spilled before stop
+        while True:
+            try:
+                write_batch(next_batch(timeout=1 if wal.pending() else 0))
+            except queue.Empty:
+                break
+            except Exception as _e:
+                cap_logger.error(f'EX drain {type(_e).__name__}: {_e}\n{traceback.format_exc()}')
+                break
+        try:
+            wal.close()
+        except Exception as _e:
+            cap_logger.error(f'EX spill close {type(_e).__name__}: {_e}')
+
         if thread_capture_kill_ev.is_set():
             cap_logger.debug('thread capture kill event was set')
 
         # close file etc.
-        writer.finish()
-        mcap_file.close()
-        # rename partial file to .mcap when done
-        # check if file already exists (previous crash and/or relaunch)
-        if Path(measurement_dir / f'{self.module_name}.mcap').exists():
-            cap_logger.warning('finished MCAP file already exists: %s.mcap', self.module_name)
-            os.rename(measurement_dir / temp_filename, measurement_dir / f'{self.module_name}.{temp_filename_ts}.mcap')
-        else:
-            os.rename(measurement_dir / temp_filename, measurement_dir / f'{self.module_name}.mcap')
-        cap_logger.info('finished capturing thread for %s', measurement_name)
+        segment.finish()
+        self._write_queue_stats(cap_logger, measurement_dir)
+        cap_logger.info('finished capturing thread for %s', cap_cmd.measurement_name)
+
+    def _write_queue_stats(self, cap_logger: logging.Logger, measurement_dir: Path):
+        # add final queue counters to module_meta.json (written by the module interface at capture start)
+        if self._stop_queue_stats is None:
+            return
+        queue_stats = dict(self._stop_queue_stats)
+        queue_stats['capture'] = {**queue_stats.get('capture', {}), 'written': self.written_counter.value}
+        try:
+            meta_path = measurement_dir / 'module_meta.json'
+            meta = {}
+            if meta_path.exists():
+                with open(meta_path, 'r') as f:
+                    meta = json.load(f)
+            meta['queue_stats'] = queue_stats
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f, indent=2, ensure_ascii=False)
+        except Exception as _e:
+            cap_logger.error(f'EX write queue stats {type(_e).__name__}: {_e}\n{traceback.format_exc()}')
 
 
 class DataCaptureWorker(LoggerMixin):
@@ -201,13 +405,28 @@ class DataCaptureWorker(LoggerMixin):
 
         # create capturing process
         self._capturing_active = False
-        self._capture_queue: multiprocessing.Queue[Tuple[int, Dict, int]] = multiprocessing.Queue(maxsize=100000)
+        # samples are moved in batches: maxsize * batch_size limits the number of buffered samples
+        self._capture_queue: multiprocessing.Queue[List[Tuple[int, Dict | bytes, int]] | SampleBlock] = \
+            multiprocessing.Queue(maxsize=200)
+        self._capture_written = create_written_counter()
+        self._capture_overload = OverloadQueue(mp_queue=self._capture_queue, written_counter=self._capture_written,
+                                               name='capture')
+        self._capture_batch_queue = BatchQueue(sink=self._capture_overload, batch_size=500, flush_interval_s=0.01)
+        # write-ahead log for OverloadPolicy.SPILL, created per measurement in prepare_capturing
+        self._spill_records_written = create_written_counter()
+        self._spill_records_read = create_written_counter()
+        self._spill: Optional[WalWriter] = None
         self._capture_config_queue: multiprocessing.Queue[CaptureCommand] = multiprocessing.Queue(maxsize=4)
+        # schema indices captured in columnar format (set in prepare_capturing)
+        self._columnar_schemas: frozenset = frozenset()
         self._capture_process_ready_event = multiprocessing.Event()
         self._capture_proc = CaptureProcess(shutdown_ev=child_shutdown_ev,
                                             process_ready_event=self._capture_process_ready_event,
                                             data_capture_queue=self._capture_queue,
                                             config_capture_queue=self._capture_config_queue,
+                                            written_counter=self._capture_written,
+                                            spill_records_written=self._spill_records_written,
+                                            spill_records_read=self._spill_records_read,
                                             module_name=self.module_name,
                                             module_type=self.module_type)
 
@@ -217,6 +436,7 @@ class DataCaptureWorker(LoggerMixin):
     def start_process(self):
         self.logger.info('starting capture process')
         self._capture_proc.start()
+        self._capture_batch_queue.start()
         # wait for process to start
         self._capture_process_ready_event.wait(timeout=10)  # this should take about 0.5 seconds max.
         if self._capture_process_ready_event.is_set():
@@ -225,18 +445,52 @@ class DataCaptureWorker(LoggerMixin):
             raise RuntimeError('starting capture process failed (timeout)')
         self._capture_process_ready_event.clear()
 
-    def prepare_capturing(self, measurement_name: str, data_schemas: List[Dict]):
+    def prepare_capturing(self, measurement_name: str, data_schemas: List[Dict],
+                          data_config: Optional[ModuleDataConfig] = None):
         if len(measurement_name) == 0:
             raise ValueError('empty measurement name')
         self.logger.info('prepare capturing: %s', measurement_name)
 
+        # only numeric schemas can be stored columnar, all others fall back to JSON
+        data_config = data_config or ModuleDataConfig()
+        capture_format = data_config.capture_format
+        self._columnar_schemas = frozenset()
+        if capture_format == 'columnar':
+            self._columnar_schemas = frozenset(idx for idx, s in enumerate(data_schemas)
+                                               if columnar_layout(s) is not None)
+            self.logger.info('columnar schemas: %s', sorted(self._columnar_schemas))
+        elif capture_format != 'json':
+            self.logger.warning('unknown capture format "%s" - using json', capture_format)
+        policy = OverloadPolicy.from_str(data_config.capture_overload_policy, OverloadPolicy.DROP_NEWEST)
+        self._capture_overload.configure(policy, data_config.overload_block_timeout_s)
+        self._close_spill()
+        self._spill_records_written.value = 0
+        self._spill_records_read.value = 0
+        if policy == OverloadPolicy.SPILL:
+            # segment files are created on the first overflow and removed by the capture process when drained
+            self._spill = WalWriter(directory=self.get_module_data_dir(measurement_name),
+                                    module_name=self.module_name, records_written=self._spill_records_written)
+            self._capture_overload.set_spill(self._spill, self._spill_records_read)
+        compression = data_config.mcap_compression
+        if compression not in COMPRESSION_TYPES:
+            self.logger.warning('unknown MCAP compression "%s" - using zstd', compression)
+            compression = 'zstd'
+
         # send command to start thread to capture process:
         self._capture_process_ready_event.clear()
         self._capture_config_queue.put(
             CaptureCommand(cmd=CaptureCommand.Command.START,
                            measurement_name=measurement_name,
                            measurement_dir=self.get_module_data_dir(measurement_name),
-                           module_data_schemas=data_schemas))
+                           module_data_schemas=data_schemas,
+                           columnar_schemas=list(self._columnar_schemas),
+                           rotate_size_bytes=int(data_config.rotate_size_mb * 1024 * 1024),
+                           rotate_duration_ns=int(data_config.rotate_duration_s * 1e9),
+                           rotate_sample_count=data_config.rotate_sample_count,
+                           chunk_size=max(1, data_config.mcap_chunk_size_kb) * 1024,
+                           compression=compression,
+                           compression_level=data_config.mcap_compression_level,
+                           compression_threads=max(0, data_config.mcap_compression_threads)))
 
         # wait for thread to start
         self._capture_process_ready_event.wait(timeout=1)
@@ -247,7 +501,9 @@ class DataCaptureWorker(LoggerMixin):
 
     def start_capturing(self) -> bool:
         self.logger.debug('start capturing')
+        self._capture_batch_queue.clear()
         empty_queue(self._capture_queue)
+        self._capture_overload.reset_counters()
         self._capturing_active = True
         if self._capture_process_ready_event.is_set():
             return False
@@ -255,11 +511,29 @@ class DataCaptureWorker(LoggerMixin):
             self.logger.error('start_capturing failed: prepare was never called or failed')
             return True
 
-    def stop_capturing(self):
+    def stop_capturing(self, queue_stats: Optional[Dict] = None):
+        """
+        :param queue_stats: additional counters to store in module_meta.json (e.g. of the live queue)
+        """
         self.logger.debug('stop capturing')
         self._capturing_active = False
-        # send command to stop capture thread
-        self._capture_config_queue.put(CaptureCommand(cmd=CaptureCommand.Command.STOP))
+        # hand over remaining samples before the capture thread is stopped
+        self._capture_batch_queue.flush()
+        # no more records: the capture process drains the spill log before it finishes the file
+        self._close_spill()
+        # send command to stop capture thread, written count is added by the capture process
+        self._capture_config_queue.put(
+            CaptureCommand(cmd=CaptureCommand.Command.STOP,
+                           queue_stats={**(queue_stats or {}), 'capture': self.get_queue_stats()}))
+
+    def get_queue_stats(self) -> Dict:
+        return self._capture_overload.get_counters()
+
+    def _close_spill(self):
+        self._capture_overload.set_spill(None)
+        if self._spill is not None:
+            self._spill.close()
+            self._spill = None
 
     def toggle_active(self, active: bool):
         self._capturing_active = active
@@ -267,14 +541,25 @@ class DataCaptureWorker(LoggerMixin):
     def is_active(self) -> bool:
         return self._capturing_active
 
-    def capture_data(self, time_ns: int, schema_index: int, data: Dict):
+    def is_columnar(self, schema_index: int) -> bool:
+        return schema_index in self._columnar_schemas
+
+    def capture_data(self, time_ns: int, schema_index: int, data: Dict | bytes):
         try:
-            self._capture_queue.put_nowait((time_ns, data, schema_index))
+            self._capture_batch_queue.put((time_ns, data, schema_index))
         except Exception as e:
             self.logger.error(f'EX data_in capture {type(e).__name__}: {e}')
 
+    def capture_block(self, block: SampleBlock):
+        try:
+            self._capture_batch_queue.put_block(block, count=len(block))
+        except Exception as e:
+            self.logger.error(f'EX data_in_batch capture {type(e).__name__}: {e}')
+
     def close(self):
         # clear multiprocessing queues (or a thread will remain after exit)
+        self._capture_batch_queue.close()
+        self._close_spill()
         self.logger.debug('emptying queues')
         for q in [self._capture_queue, self._capture_config_queue]:
             # _empty_queue(q) # ?? do not empty from this side
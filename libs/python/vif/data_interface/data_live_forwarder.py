@@ -1,21 +1,25 @@
 import os
 import time
+import heapq
 import threading
 import multiprocessing
 import multiprocessing.synchronize
 import queue
 import signal
 import traceback
-from typing import Optional, Dict, List
+from typing import Optional, Dict, List, Tuple, Callable
 from dataclasses import dataclass
 
 import orjson
 
 from vif.logger.logger import LoggerMixin, log_reentrant
 from vif.data_interface.connection_manager import ConnectionManager, Key
-from vif.asyncio_helpers.asyncio_helpers import tick_generator
 from vif.data_interface.network_messages import ModuleDataConfig, GetSchemasReply
-from vif.data_interface.helpers import empty_queue, check_leftover_threads
+from vif.data_interface.helpers import empty_queue, check_leftover_threads, json_add_ts
+from vif.data_interface.overload_queue import OverloadQueue, OverloadPolicy, create_written_counter
+from vif.data_interface.sample_block import SampleBlock
+from vif.data_interface.live_aggregate import (LiveAggregator, create_live_aggregator, numpy_available,
+                                               LIVE_AGGREGATE_MODES)
 
 
 class LiveProcess(LoggerMixin, multiprocessing.Process):
@@ -25,6 +29,7 @@ class LiveProcess(LoggerMixin, multiprocessing.Process):
                  possible_schema_change_event: multiprocessing.synchronize.Event,
                  data_live_queue: multiprocessing.Queue,
                  config_live_queue: multiprocessing.Queue,
+                 written_counter,
                  db_id: str,
                  db_router: str,
                  module_name: str,
@@ -37,6 +42,8 @@ class LiveProcess(LoggerMixin, multiprocessing.Process):
         self.possible_schema_change_event: multiprocessing.synchronize.Event = possible_schema_change_event
         self.data_live_queue: multiprocessing.Queue = data_live_queue
         self.config_live_queue: multiprocessing.Queue = config_live_queue
+        # number of received samples, shared with OverloadQueue in the parent process
+        self.written_counter = written_counter
         self.db_id: str = db_id
         self.db_router: str = db_router
         self.module_name: str = module_name
@@ -44,13 +51,20 @@ class LiveProcess(LoggerMixin, multiprocessing.Process):
         # initialized in run(), in new process:
         self.cm = None
         self.live_frequency_hz = None
+        self.live_topic_rates_hz = None
+        self.live_aggregate_mode = None
+        self.live_lttb_points = None
+        self.schema_aggregators = None
         self.data_updated_dec_available = None
         self.thread_live_dec_kill = None
         self.enable_live_all = None
+        self.live_all_batch_s = None
+        self.live_all_batch_size = None
         self.enable_fixed_rate = None
-        self.thread_live_dec_list = None
+        self.thread_live_dec = None
         self.available_schema_topics = None
         self.schema_data = None
+        self.schema_data_lock = None
 
     def run(self):
         self.logger.info('starting live-data process for %s/%s', self.db_id, self.module_name)
@@ -65,13 +79,25 @@ class LiveProcess(LoggerMixin, multiprocessing.Process):
                                     max_parallel_queryables=0, max_parallel_req=1)
 
         self.live_frequency_hz = 1.0
+        self.live_topic_rates_hz: Dict[str, float] = {}
+        # aggregates per fixed-rate interval (see live_aggregate.py), empty list in mode 'latest'
+        self.live_aggregate_mode = 'latest'
+        self.live_lttb_points = 200
+        self.schema_aggregators: List[Optional[LiveAggregator]] = []
         self.data_updated_dec_available: List[bool] = []
         self.thread_live_dec_kill = threading.Event()
         self.enable_live_all = False
+        # live-all samples collected within this time (or up to batch size) are published as one JSON array on
+        # "livebatch" instead of "liveall"
+        self.live_all_batch_s = 0.0
+        self.live_all_batch_size = 100
         self.enable_fixed_rate = False
         self.available_schema_topics: List[str] = []
         self.schema_data: list = []
-        self.thread_live_dec_list: List[threading.Thread] = []
+        # latest sample per schema is written by the receiver and read by the decimation scheduler
+        self.schema_data_lock = threading.Lock()
+        # one scheduler thread publishes decimated data of all schemas
+        self.thread_live_dec: Optional[threading.Thread] = None
 
         thread_receiver: Optional[threading.Thread] = None
         thread_receiver_kill = threading.Event()
@@ -117,11 +143,28 @@ class LiveProcess(LoggerMixin, multiprocessing.Process):
                     self.logger.debug('got config: %s', cfg.serialize())
 
                     self.enable_live_all = cfg.enable_live_all_samples
+                    self.live_all_batch_s = max(0.0, cfg.live_all_batch_ms / 1000)
+                    self.live_all_batch_size = max(1, cfg.live_all_batch_size)
                     self.enable_fixed_rate = cfg.enable_live_fixed_rate
 
-                    if abs(self.live_frequency_hz - cfg.live_rate_hz) > 1e-3:
+                    if abs(self.live_frequency_hz - cfg.live_rate_hz) > 1e-3 or \
+                            self.live_topic_rates_hz != cfg.live_topic_rates_hz:
                         # update rate changed - restart thread!
                         self.live_frequency_hz = cfg.live_rate_hz
+                        self.live_topic_rates_hz = dict(cfg.live_topic_rates_hz)
+                        self._stop_live_dec_threads()
+
+                    aggregate_mode = cfg.live_aggregate_mode
+                    if aggregate_mode not in LIVE_AGGREGATE_MODES:
+                        self.logger.warning('unknown live aggregate mode "%s" - using latest', aggregate_mode)
+                        aggregate_mode = 'latest'
+                    if aggregate_mode == 'lttb' and not numpy_available():
+                        self.logger.warning('live aggregate mode "lttb" needs numpy - using envelope')
+                        aggregate_mode = 'envelope'
+                    if aggregate_mode != self.live_aggregate_mode or cfg.live_lttb_points != self.live_lttb_points:
+                        # aggregators are created with the scheduler
+                        self.live_aggregate_mode = aggregate_mode
+                        self.live_lttb_points = cfg.live_lttb_points
                         self._stop_live_dec_threads()
 
                 # If the "receiver" thread, which polls from the live data in queue is closed for any reason, start it
@@ -131,16 +174,16 @@ class LiveProcess(LoggerMixin, multiprocessing.Process):
                     thread_receiver_kill.clear()
                     thread_receiver.start()
 
-                # Start or close the live dec threads
-                if self.enable_fixed_rate and len(self.thread_live_dec_list) == 0:
+                # Start or close the live dec scheduler
+                if self.enable_fixed_rate and self.thread_live_dec is None:
                     self.thread_live_dec_kill.clear()
-                    for schema_id in range(len(self.available_schema_topics)):
-                        thread_live_dec = threading.Thread(target=self._thread_live_decimated,
-                                                           name=f'live_dec_{schema_id}',
-                                                           args=[schema_id])
-                        self.thread_live_dec_list.append(thread_live_dec)
-                        thread_live_dec.start()
-                elif not self.enable_fixed_rate and len(self.thread_live_dec_list) > 0:
+                    if self.live_aggregate_mode != 'latest':
+                        self.schema_aggregators = [create_live_aggregator(self.live_aggregate_mode,
+                                                                          self.live_lttb_points)
+                                                   for _ in self.available_schema_topics]
+                    self.thread_live_dec = threading.Thread(target=self._thread_live_decimated, name='live_dec')
+                    self.thread_live_dec.start()
+                elif not self.enable_fixed_rate and self.thread_live_dec is not None:
                     self._stop_live_dec_threads()
 
             except Exception as e:
@@ -175,89 +218,205 @@ class LiveProcess(LoggerMixin, multiprocessing.Process):
         self.logger.info('_thread_receiver start')
 
         schema_network_topic_keys_liveall: List[Key] = []
-        schema_network_topic_ids_liveall: List[int] = []
+        schema_network_topic_keys_livebatch: List[Key] = []
+        schema_network_topic_ids: List[int] = []
 
         for schema_name in self.available_schema_topics:
             key = Key(self.db_id, f"m/{self.module_name}/{schema_name}", "liveall")
             schema_network_topic_keys_liveall.append(key)
-
-            pub_id: int = self.cm.declare_publisher(key)
-            schema_network_topic_ids_liveall.append(pub_id)
+            schema_network_topic_ids.append(self.cm.declare_publisher(key))
+
+            # batches go to a separate topic: "liveall" subscribers (e.g. C++ modules) expect one object per message
+            key = Key(self.db_id, f"m/{self.module_name}/{schema_name}", "livebatch")
+            schema_network_topic_keys_livebatch.append(key)
+            schema_network_topic_ids.append(self.cm.declare_publisher(key))
+
+        # batched "live all": pending samples per schema, published when the batch is full or the window expired
+        live_all_pending: List[List[bytes]] = [[] for _ in self.available_schema_topics]
+        live_all_deadline: Optional[float] = None
+
+        def publish_live_all(schema_id: int, sample: bytes):
+            nonlocal live_all_deadline
+            if self.live_all_batch_s <= 0:
+                with self.time_it(f'live all publish schema {schema_id}', limit_ms=1):
+                    self.cm.publish(schema_network_topic_keys_liveall[schema_id], sample)
+                return
+            pending = live_all_pending[schema_id]
+            pending.append(sample)
+            if live_all_deadline is None:
+                live_all_deadline = time.monotonic() + self.live_all_batch_s
+            if len(pending) >= self.live_all_batch_size:
+                flush_live_all(schema_id)
+
+        def flush_live_all(schema_id: int):
+            pending = live_all_pending[schema_id]
+            if len(pending) == 0:
+                return
+            # samples are JSON objects: the batch is a JSON array (see LiveDataReceiver)
+            with self.time_it(f'live all publish batch schema {schema_id}', limit_ms=1):
+                self.cm.publish(schema_network_topic_keys_livebatch[schema_id], b'[' + b','.join(pending) + b']')
+            pending.clear()
 
         while not self.shutdown_ev.is_set() and not thread_receiver_kill.is_set():
             try:
+                timeout = 0.2
+                if live_all_deadline is not None:
+                    timeout = live_all_deadline - time.monotonic()
+                    if timeout <= 0:
+                        live_all_deadline = None
+                        for schema_id in range(len(live_all_pending)):
+                            flush_live_all(schema_id)
+                        continue
                 try:
-                    raw: LiveDataContainer = self.data_live_queue.get(timeout=0.2)
+                    raw: LiveDataContainer | SampleBlock = self.data_live_queue.get(timeout=timeout)
                 except queue.Empty:
                     continue  # no data - check event and try again
                 if raw is None:
                     self.logger.info('stopping process')
                     break
+                self.written_counter.value += len(raw) if isinstance(raw, SampleBlock) else 1
 
                 # TODO maybe change to s/t else to split up sync of threads to sync with parent process?
                 if self.possible_schema_change_event.is_set():
                     continue
 
+                if isinstance(raw, SampleBlock):
+                    self._receive_block(raw, publish_live_all)
+                    continue
+
                 curr_schema_id: int = raw.schema_id
                 time_ns: int = raw.time_ns
-                data: Dict = raw.data
-                data['ts'] = time_ns
-
-                self.schema_data[curr_schema_id] = orjson.dumps(data)
-                self.data_updated_dec_available[curr_schema_id] = True
+                if isinstance(raw.data, bytes):
+                    # already serialized by DataBroker: splice timestamp into JSON bytes
+                    sample = json_add_ts(raw.data, time_ns)
+                else:
+                    data: Dict = raw.data
+                    data['ts'] = time_ns
+                    sample = orjson.dumps(data)
+                self._set_schema_data(curr_schema_id, sample)
+
+                # samples are forwarded unserialized while aggregating (see DataLiveForwarder.needs_dict), serialized
+                # ones (queued before the mode changed) are not parsed again
+                aggregators = self.schema_aggregators
+                if aggregators and isinstance(raw.data, dict):
+                    aggregators[curr_schema_id].add(time_ns, raw.data)
 
                 # publish "live all" data
                 if self.enable_live_all:
-                    with self.time_it(f'live all publish schema {curr_schema_id}', limit_ms=1):
-                        self.cm.publish(schema_network_topic_keys_liveall[curr_schema_id],
-                                        self.schema_data[curr_schema_id])
+                    publish_live_all(curr_schema_id, sample)
             except Exception as _e:
                 self.logger.error(f'EX receiver {type(_e).__name__}: {_e}\n{traceback.format_exc()}')
 
-        for pub_id in schema_network_topic_ids_liveall:
+        try:
+            for schema_id in range(len(live_all_pending)):
+                flush_live_all(schema_id)
+        except Exception as _e:
+            self.logger.error(f'EX receiver flush {type(_e).__name__}: {_e}')
+        for pub_id in schema_network_topic_ids:
             self.cm.undeclare_publisher(pub_id)
 
-    def _thread_live_decimated(self, responsible_schema_id: int):
-        self.logger.info(f'live forwarding decimated for schema {responsible_schema_id}')
-
-        schema_name = self.available_schema_topics[responsible_schema_id]
-        schema_network_topic_key_livedec = Key(self.db_id, f"m/{self.module_name}/{schema_name}", "livedec")
-        schema_network_topic_id_livedec = self.cm.declare_publisher(schema_network_topic_key_livedec)
-
-        g = tick_generator(1.0 / self.live_frequency_hz, drop_missed=True, time_source=time.time)
-        while not self.thread_live_dec_kill.is_set():
+    def _receive_block(self, block: SampleBlock, publish_live_all: Callable[[int, bytes], None]):
+        schema_id = block.schema_index
+        sample = None
+        if self.enable_live_all:
+            with self.time_it(f'live all publish block schema {schema_id}', limit_ms=10):
+                for time_ns, data, _ in block:
+                    data['ts'] = time_ns
+                    sample = orjson.dumps(data)
+                    publish_live_all(schema_id, sample)
+        else:
+            # decimated live data only needs the latest sample
+            time_ns, data = block.last()
+            data['ts'] = time_ns
+            sample = orjson.dumps(data)
+        self._set_schema_data(schema_id, sample)
+
+        aggregators = self.schema_aggregators
+        if aggregators:
+            aggregators[schema_id].add_block(block.times_ns, block.keys, block.columns)
+
+    def _set_schema_data(self, schema_id: int, sample: bytes):
+        with self.schema_data_lock:
+            self.schema_data[schema_id] = sample
+            self.data_updated_dec_available[schema_id] = True
+
+    def _take_schema_data(self, schema_id: int) -> Optional[bytes]:
+        """ latest sample of a schema if it was updated since the last call, else None """
+        with self.schema_data_lock:
+            if not self.data_updated_dec_available[schema_id]:
+                return None
+            self.data_updated_dec_available[schema_id] = False
+            return self.schema_data[schema_id]
+
+    def _schema_rate_hz(self, schema_name: str) -> float:
+        return self.live_topic_rates_hz.get(schema_name, self.live_frequency_hz)
+
+    def _thread_live_decimated(self):
+        """
+        Publish the latest sample of every schema at its fixed rate (live_topic_rates_hz or live_rate_hz).
+        One heap of due times serves all schemas: the thread only wakes when the next schema is due.
+        With an aggregate mode, the aggregate of each interval is published on "liveagg" as well.
+        """
+        aggregators = self.schema_aggregators
+        keys_livedec: List[Key] = []
+        keys_liveagg: List[Key] = []
+        pub_ids_livedec: List[int] = []
+        # (due time, schema id, period)
+        schedule: List[Tuple[float, int, float]] = []
+        t_now = time.monotonic()
+        for schema_id, schema_name in enumerate(self.available_schema_topics):
+            key = Key(self.db_id, f"m/{self.module_name}/{schema_name}", "livedec")
+            keys_livedec.append(key)
+            pub_ids_livedec.append(self.cm.declare_publisher(key))
+            if aggregators:
+                key = Key(self.db_id, f"m/{self.module_name}/{schema_name}", "liveagg")
+                keys_liveagg.append(key)
+                pub_ids_livedec.append(self.cm.declare_publisher(key))
+            rate_hz = self._schema_rate_hz(schema_name)
+            if rate_hz > 0:
+                schedule.append((t_now + 1.0 / rate_hz, schema_id, 1.0 / rate_hz))
+        heapq.heapify(schedule)
+        self.logger.info('live forwarding decimated for %d of %d schemas', len(schedule), len(keys_livedec))
+
+        while schedule and not self.thread_live_dec_kill.is_set():
+            due, schema_id, period = schedule[0]
+            t_now = time.monotonic()
+            if due > t_now:
+                self.thread_live_dec_kill.wait(timeout=due - t_now)
+                continue
+            # next tick on the original grid, drop missed ticks
+            heapq.heapreplace(schedule, (due + (int((t_now - due) / period) + 1) * period, schema_id, period))
             try:
-                self.thread_live_dec_kill.wait(timeout=next(g))
                 if self.possible_schema_change_event.is_set():
                     continue
-                if not self.data_updated_dec_available[responsible_schema_id]:
-                    continue
-                if self.schema_data[responsible_schema_id] is None:
-                    continue
-                # current_data is not changed but recreated - holding reference as copy is ok
-                self.data_updated_dec_available[responsible_schema_id] = False
-                # logger.debug('send decimated: %s', current_data)
-                with self.time_it(f'live dec publish schema {responsible_schema_id}', limit_ms=1):
-                    self.cm.publish(schema_network_topic_key_livedec, self.schema_data[responsible_schema_id])
+                sample = self._take_schema_data(schema_id)
+                if sample is not None:
+                    with self.time_it(f'live dec publish schema {schema_id}', limit_ms=1):
+                        self.cm.publish(keys_livedec[schema_id], sample)
+                if aggregators:
+                    aggregate = aggregators[schema_id].take()
+                    if aggregate is not None:
+                        self.cm.publish(keys_liveagg[schema_id], orjson.dumps(aggregate))
             except Exception as _e:
-                self.logger.error(f'EX live_decimated ({responsible_schema_id}) {type(_e).__name__}: {_e}\n'
+                self.logger.error(f'EX live_decimated ({schema_id}) {type(_e).__name__}: {_e}\n'
                                   f'{traceback.format_exc()}')
-        g.close()
-        self.cm.undeclare_publisher(schema_network_topic_id_livedec)
+
+        for pub_id in pub_ids_livedec:
+            self.cm.undeclare_publisher(pub_id)
 
     def _stop_live_dec_threads(self):
-        if len(self.thread_live_dec_list) > 0:
+        if self.thread_live_dec is not None:
             self.thread_live_dec_kill.set()
-            for dec_thread in self.thread_live_dec_list:
-                dec_thread.join()
-            self.thread_live_dec_list.clear()
+            self.thread_live_dec.join()
+            self.thread_live_dec = None
+        self.schema_aggregators = []
 
 
 @dataclass
 class LiveDataContainer:
     schema_id: int
     time_ns: int
-    data: Dict
+    data: Dict | bytes
 
 
 class DataLiveForwarder(LoggerMixin):
@@ -270,7 +429,13 @@ class DataLiveForwarder(LoggerMixin):
 
         # create live data process
         self._live_active = False
-        self._live_queue: multiprocessing.Queue[LiveDataContainer] = multiprocessing.Queue(maxsize=1000)
+        # the live process aggregates the samples (live_aggregate_mode): forward dicts instead of JSON
+        self._needs_dict = False
+        self._live_queue: multiprocessing.Queue[LiveDataContainer | SampleBlock] = multiprocessing.Queue(maxsize=1000)
+        self._live_written = create_written_counter()
+        # live data is only useful while recent: drop the oldest samples by default
+        self._live_overload = OverloadQueue(mp_queue=self._live_queue, written_counter=self._live_written,
+                                            name='live', policy=OverloadPolicy.DROP_OLDEST)
         self._live_config_queue: multiprocessing.Queue[ModuleDataConfig] = multiprocessing.Queue(maxsize=4)
         self._live_process_ready_event = multiprocessing.Event()
         self._live_proc = LiveProcess(shutdown_ev=self._child_shutdown_ev,
@@ -278,6 +443,7 @@ class DataLiveForwarder(LoggerMixin):
                                       possible_schema_change_event=schema_change_ev,
                                       data_live_queue=self._live_queue,
                                       config_live_queue=self._live_config_queue,
+                                      written_counter=self._live_written,
                                       db_id=db_id,
                                       db_router=db_router,
                                       module_name=self.module_name)
@@ -298,21 +464,38 @@ class DataLiveForwarder(LoggerMixin):
     def is_active(self) -> bool:
         return self._live_active
 
+    def needs_dict(self) -> bool:
+        """ samples are aggregated in the live process: pass the dict to forward_data, not serialized JSON """
+        return self._needs_dict
+
     def configure_live(self, data_config: ModuleDataConfig):
         self.logger.debug('configure_live: %s', data_config.serialize())
         self._live_config_queue.put(data_config)
+        self._live_overload.configure(
+            OverloadPolicy.from_str(data_config.live_overload_policy, OverloadPolicy.DROP_OLDEST),
+            data_config.overload_block_timeout_s)
+        self._needs_dict = (data_config.enable_live_fixed_rate and data_config.live_aggregate_mode != 'latest' and
+                            data_config.live_aggregate_mode in LIVE_AGGREGATE_MODES)
         if data_config.enable_live_all_samples or data_config.enable_live_fixed_rate:
             self.toggle_active(True)
         else:
             self.toggle_active(False)
 
-    def forward_data(self, time_ns: int, schema_index: int, data: Dict):
+    def forward_data(self, time_ns: int, schema_index: int, data: Dict | bytes):
         try:
-            live_data: LiveDataContainer = LiveDataContainer(schema_index, time_ns, data)
-            self._live_queue.put_nowait(live_data)
+            self._live_overload.put(LiveDataContainer(schema_index, time_ns, data))
         except Exception as e:
             self.logger.error(f'EX data_in live {type(e).__name__}: {e}')
 
+    def forward_block(self, block: SampleBlock):
+        try:
+            self._live_overload.put(block, count=len(block))
+        except Exception as e:
+            self.logger.error(f'EX data_in_batch live {type(e).__name__}: {e}')
+
+    def get_queue_stats(self) -> Dict:
+        return self._live_overload.get_counters()
+
     def close(self):
         self.logger.debug('emptying live data queues')
 
@@ -46,6 +46,16 @@ def empty_queue(q):
             q.get_nowait()
 
 
+def json_add_ts(data_json: bytes, time_ns: int) -> bytes:
+    """
+    Add the "ts" field to a serialized JSON object without re-encoding it.
+    The field is appended last, so it overrides an existing "ts" key for JSON parsers.
+    """
+    if data_json == b'{}':
+        return b'{"ts":%d}' % time_ns
+    return b'%s,"ts":%d}' % (data_json[:-1], time_ns)
+
+
 def check_leftover_threads() -> str:
     num_threads_left = threading.active_count() - 1
     ret_str = f'done - threads left: {num_threads_left}'
@@ -0,0 +1,250 @@
+"""
+Per-interval aggregation of live data for the fixed-rate stream (see LiveProcess._thread_live_decimated).
+
+Samples are added by the live receiver as they arrive, the scheduler takes one aggregate per interval and publishes
+it on the "liveagg" key of the schema topic. Only numeric channels (int / float, no bool) are aggregated.
+
+Modes:
+    envelope: min / max / mean / count per channel
+        {"mode": "envelope", "ts": last ts, "ts_start": first ts, "count": n,
+         "channels": {name: {"min": .., "max": .., "mean": .., "count": ..}}}
+    lttb: point set per channel reduced with Largest-Triangle-Three-Buckets
+        {"mode": "lttb", "ts": last ts, "ts_start": first ts, "count": n, "channels": {name: {"ts": [..], "v": [..]}}}
+
+numpy is not installed in all module images: it is imported on use (mode "lttb" and blocks of samples only).
+"""
+
+import importlib.util
+import math
+import threading
+from abc import ABC, abstractmethod
+from array import array
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+LIVE_AGGREGATE_MODES = ('latest', 'envelope', 'lttb')
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def numpy_available() -> bool:
+    """ mode "lttb" needs numpy """
+    return importlib.util.find_spec('numpy') is not None
+
+
+def lttb_indices(x: 'np.ndarray', y: 'np.ndarray', num_out: int) -> 'np.ndarray':
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+    :param x: increasing x values (float)
+    :param y: y values (finite)
+    :param num_out: number of points to keep (first and last are always kept)
+    :return: indices of the selected points
+    """
+    import numpy as np
+
+    n = len(x)
+    if num_out >= n or num_out < 3:
+        return np.arange(n)
+    # num_out - 2 buckets between the first and the last point
+    edges = np.linspace(1, n - 1, num_out - 1).astype(np.int64)
+    indices = np.empty(num_out, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(num_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # the third triangle point is the average of the next bucket (the last point for the last bucket)
+        next_start, next_end = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+class LiveAggregator(ABC):
+    def __init__(self):
+        """
+        Collects the samples of one schema between two publish ticks. add / add_block are called by the receiver
+        thread, take by the scheduler thread.
+        """
+        self._lock = threading.Lock()
+        self._ts_start: Optional[int] = None
+        self._ts_last: int = 0
+        self._count: int = 0
+
+    @abstractmethod
+    def add(self, time_ns: int, data: Dict):
+        ...
+
+    @abstractmethod
+    def add_block(self, times_ns: 'np.ndarray', keys: Tuple[str, ...], columns: List['np.ndarray']):
+        ...
+
+    @abstractmethod
+    def take(self) -> Optional[Dict]:
+        """ aggregate of the samples since the last call, None if there were none """
+        ...
+
+    def _add_times(self, first_ns: int, last_ns: int, count: int):
+        if self._ts_start is None:
+            self._ts_start = first_ns
+        self._ts_last = last_ns
+        self._count += count
+
+    def _take_times(self) -> Dict:
+        header = {'ts': self._ts_last, 'ts_start': self._ts_start, 'count': self._count}
+        self._ts_start = None
+        self._count = 0
+        return header
+
+
+class EnvelopeAggregator(LiveAggregator):
+    def __init__(self):
+        super().__init__()
+        # channel name -> [min, max, sum, count]
+        self._channels: Dict[str, List] = {}
+
+    def add(self, time_ns: int, data: Dict):
+        with self._lock:
+            self._add_times(time_ns, time_ns, 1)
+            channels = self._channels
+            for name, value in data.items():
+                if name == 'ts' or not _is_number(value) or value != value:  # skip NaN
+                    continue
+                state = channels.get(name)
+                if state is None:
+                    channels[name] = [value, value, value, 1]
+                else:
+                    if value < state[0]:
+                        state[0] = value
+                    if value > state[1]:
+                        state[1] = value
+                    state[2] += value
+                    state[3] += 1
+
+    def add_block(self, times_ns: 'np.ndarray', keys: Tuple[str, ...], columns: List['np.ndarray']):
+        import numpy as np
+
+        with self._lock:
+            self._add_times(int(times_ns[0]), int(times_ns[-1]), len(times_ns))
+            for name, column in zip(keys, columns):
+                if column.dtype.kind not in 'iuf':
+                    continue
+                valid = column[~np.isnan(column)] if column.dtype.kind == 'f' else column
+                if len(valid) == 0:
+                    continue
+                v_min, v_max, v_sum = valid.min().item(), valid.max().item(), valid.sum().item()
+                state = self._channels.get(name)
+                if state is None:
+                    self._channels[name] = [v_min, v_max, v_sum, len(valid)]
+                else:
+                    state[0] = min(state[0], v_min)
+                    state[1] = max(state[1], v_max)
+                    state[2] += v_sum
+                    state[3] += len(valid)
+
+    def take(self) -> Optional[Dict]:
+        with self._lock:
+            if self._count == 0:
+                return None
+            channels, self._channels = self._channels, {}
+            result = self._take_times()
+        result['mode'] = 'envelope'
+        result['channels'] = {name: {'min': s[0], 'max': s[1], 'mean': s[2] / s[3], 'count': s[3]}
+                              for name, s in channels.items()}
+        return result
+
+
+class LttbAggregator(LiveAggregator):
+    def __init__(self, num_points: int):
+        """
+        :param num_points: points per channel and interval
+        """
+        super().__init__()
+        self._num_points = max(3, num_points)
+        # buffered points are reduced when a channel exceeds this size (bounds memory at high rates)
+        self._max_buffer = max(10000, 20 * self._num_points)
+        # channel name -> (timestamps, values)
+        self._channels: Dict[str, Tuple[array, array]] = {}
+
+    def _buffer(self, name: str) -> Tuple[array, array]:
+        buffer = self._channels.get(name)
+        if buffer is None:
+            buffer = self._channels[name] = (array('q'), array('d'))
+        return buffer
+
+    def _reduce_if_full(self, name: str):
+        import numpy as np
+
+        ts, values = self._channels[name]
+        if len(ts) <= self._max_buffer:
+            return
+        x = np.frombuffer(ts, dtype=np.int64)
+        y = np.frombuffer(values, dtype=np.float64)
+        keep = lttb_indices((x - x[0]).astype(np.float64), y, self._max_buffer // 2)
+        self._channels[name] = (array('q', x[keep].tobytes()), array('d', y[keep].tobytes()))
+
+    def add(self, time_ns: int, data: Dict):
+        with self._lock:
+            self._add_times(time_ns, time_ns, 1)
+            for name, value in data.items():
+                if name == 'ts' or not _is_number(value) or not math.isfinite(value):
+                    continue
+                ts, values = self._buffer(name)
+                ts.append(time_ns)
+                values.append(value)
+                if len(ts) > self._max_buffer:
+                    self._reduce_if_full(name)
+
+    def add_block(self, times_ns: 'np.ndarray', keys: Tuple[str, ...], columns: List['np.ndarray']):
+        import numpy as np
+
+        with self._lock:
+            self._add_times(int(times_ns[0]), int(times_ns[-1]), len(times_ns))
+            for name, column in zip(keys, columns):
+                if column.dtype.kind not in 'iuf':
+                    continue
+                column = column.astype(np.float64)
+                valid = np.isfinite(column)
+                ts, values = self._buffer(name)
+                ts.frombytes(times_ns[valid].astype(np.int64).tobytes())
+                values.frombytes(column[valid].tobytes())
+                self._reduce_if_full(name)
+
+    def take(self) -> Optional[Dict]:
+        with self._lock:
+            if self._count == 0:
+                return None
+            channels, self._channels = self._channels, {}
+            result = self._take_times()
+        import numpy as np
+
+        # reduce outside the lock: the receiver is not blocked
+        result['mode'] = 'lttb'
+        result['channels'] = {}
+        for name, (ts, values) in channels.items():
+            x = np.frombuffer(ts, dtype=np.int64)
+            y = np.frombuffer(values, dtype=np.float64)
+            keep = lttb_indices((x - x[0]).astype(np.float64), y, self._num_points)
+            result['channels'][name] = {'ts': x[keep].tolist(), 'v': y[keep].tolist()}
+        return result
+
+
+def create_live_aggregator(mode: str, lttb_points: int = 200) -> Optional[LiveAggregator]:
+    """
+    :param mode: one of LIVE_AGGREGATE_MODES
+    :return: aggregator, None for mode "latest" (only the latest sample is published)
+    """
+    if mode == 'envelope':
+        return EnvelopeAggregator()
+    if mode == 'lttb':
+        return LttbAggregator(lttb_points)
+    if mode == 'latest':
+        return None
+    raise ValueError(f'unknown live aggregate mode: {mode}')
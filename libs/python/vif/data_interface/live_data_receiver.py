@@ -5,6 +5,7 @@ from functools import partial
 
 from vif.logger.logger import LoggerMixin
 from vif.data_interface.connection_manager import ConnectionManager, Key
+from vif.data_interface.subscription_delivery import DeliveryPolicy
 
 
 @dataclass
@@ -12,6 +13,9 @@ class Subscription:
     sub_id: int
     sub_all: bool
     topic: Key
+    delivery: Optional[DeliveryPolicy]
+    # batched "live all" messages are published on a separate topic (only subscribed with sub_all)
+    batch_sub_id: Optional[int] = None
 
 
 class LiveDataReceiver(LoggerMixin):
@@ -23,6 +27,7 @@ class LiveDataReceiver(LoggerMixin):
         self._subs: Dict[str, Subscription] = {}
         self._db_id = databeam_id
         self._data_callback: Optional[Callable[[str, str, Dict | str], None]] = None
+        self._batch_callback: Optional[Callable[[str, str, List[Dict] | str], None]] = None
         self._raw_json_string = False
 
     def receive_raw_json_string(self, enabled: bool):
@@ -30,15 +35,25 @@ class LiveDataReceiver(LoggerMixin):
 
     def request_live_data(self, modules: List[str], sub_all: Optional[List[bool]] = None,
                           data_callback: Optional[Callable[[str, str, Dict | str], None]] = None,
-                          db_ids: Optional[List[str]] = None) -> None:
+                          db_ids: Optional[List[str]] = None,
+                          batch_callback: Optional[Callable[[str, str, List[Dict] | str], None]] = None,
+                          delivery: Optional[DeliveryPolicy] = None) -> None:
         """
         Register callback for live data.
 
+        Batched "live all" messages (topic "livebatch", see ModuleDataConfig.live_all_batch_ms) are unpacked and passed
+        to data_callback sample by sample, or to batch_callback as a whole if set.
+
         :param modules: list of module names
         :param sub_all: list of boolean for each module:
                         True -> subscribe for all data, False -> subscribe for fixed-rate data
         :param data_callback: callback function: def data_callback(module_name: str, data: Dict) -> None
         :param db_ids: optional list of databeam ids (used to receive remote data)
+        :param batch_callback: callback function for batched messages:
+                               def batch_callback(db_id: str, module_name: str, samples: List[Dict]) -> None
+                               (also receives single samples as list if data_callback is None)
+        :param delivery: how callbacks are invoked (None: inline on the receiving thread of the connection manager,
+                         use a dedicated thread or the shared pool for slow callbacks)
         """
         sub_all = [False] * len(modules) if sub_all is None else sub_all
         db_ids = [self._db_id] * len(modules) if db_ids is None else db_ids
@@ -51,22 +66,25 @@ class LiveDataReceiver(LoggerMixin):
         # create dict to check for changed sub-modes: {id/module: bool} (True = subscribe all, False = fixed rate)
         modules_topic = {new_subs[x]: sub_all[x] for x in range(len(new_subs))}
 
-        # list of keys of self._subs: IF key not in modules_topic OR sub bool does not match
+        # list of keys of self._subs: IF key not in modules_topic OR sub bool or delivery does not match
         remove_list = [k for k, v in self._subs.items() if
-                       k not in modules_topic.keys() or v.sub_all != modules_topic[k]]
+                       k not in modules_topic.keys() or v.sub_all != modules_topic[k] or v.delivery != delivery]
 
         # remove unused subscriptions
         for t in remove_list:
-            self._cm.unsubscribe(self._subs[t].sub_id)
-            del self._subs[t]
+            self._unsubscribe(self._subs.pop(t))
 
         # subscribe for new modules
         for m, s_all, db_id in zip(modules, sub_all, db_ids):
             sub_key = f'{db_id}/{m}'
             if sub_key not in self._subs.keys():
                 topic = Key(db_id, f'm/{m}', 'liveall' if s_all else 'livedec')
-                sub_id = self._cm.subscribe(topic, partial(self._data_received, db_id, m))
-                self._subs[sub_key] = Subscription(sub_id, s_all, topic)
+                sub_id = self._cm.subscribe(topic, partial(self._data_received, db_id, m), delivery)
+                batch_sub_id = None
+                if s_all:
+                    batch_sub_id = self._cm.subscribe(Key(db_id, f'm/{m}', 'livebatch'),
+                                                      partial(self._data_received, db_id, m), delivery)
+                self._subs[sub_key] = Subscription(sub_id, s_all, topic, delivery, batch_sub_id)
 
         # log subscriptions
         log_data = [[k, "all" if v.sub_all else "fixed"] for k, v in self._subs.items()]
@@ -74,19 +92,27 @@ class LiveDataReceiver(LoggerMixin):
 
         # register callback
         self._data_callback = data_callback
+        self._batch_callback = batch_callback
 
     def shutdown(self):
         self.logger.debug('shutting down')
         for sub in self._subs.values():
-            self._cm.unsubscribe(sub.sub_id)
+            self._unsubscribe(sub)
         self._subs.clear()
 
+    def _unsubscribe(self, sub: Subscription):
+        self._cm.unsubscribe(sub.sub_id)
+        if sub.batch_sub_id is not None:
+            self._cm.unsubscribe(sub.batch_sub_id)
+
     def _data_received(self, db_id: str, module_name: str, key: str, data: bytes) -> None:
         live_json = data.decode()
         # self.logger.debug('%s/%s data: %s', db_id, module_name, live_json)
+        # single samples are JSON objects, batched samples ("livebatch") a JSON array of objects
+        batched = key.endswith('/livebatch')
 
         # parse json
-        if self._raw_json_string:
+        if self._raw_json_string and (not batched or self._batch_callback is not None):
             data_out = live_json
         else:
             try:
@@ -95,6 +121,16 @@ class LiveDataReceiver(LoggerMixin):
                 self.logger.error(f'EX data_received (json.loads {live_json}) - {type(e).__name__}: {e}')
                 return
 
+        if batched:
+            if self._batch_callback is not None:
+                self._batch_callback(db_id, module_name, data_out)
+            elif self._data_callback is not None:
+                for sample in data_out:
+                    self._data_callback(db_id, module_name, json.dumps(sample) if self._raw_json_string else sample)
+            return
+
         # invoke data callback
         if self._data_callback is not None:
             self._data_callback(db_id, module_name, data_out)
+        elif self._batch_callback is not None:
+            self._batch_callback(db_id, module_name, f'[{data_out}]' if self._raw_json_string else [data_out])
@@ -0,0 +1,294 @@
+"""
+Chunked MCAP writer with selectable compression codec, compression level and chunk size.
+
+Writes the same file layout as mcap.writer.Writer (chunks with message indexes, summary with schemas, channels,
+statistics, chunk- and metadata indexes, summary offsets), but exposes the compression level which the library
+writer does not.
+
+With compression_threads > 0 the writer is pipelined: the calling thread only builds chunks, a thread pool compresses
+them (zstd and lz4 release the GIL) and a writer thread writes them to the file in the order they were built.
+"""
+
+import queue
+import struct
+import threading
+import zlib
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Any, Callable, Dict, List, Optional, OrderedDict, Tuple
+
+from mcap.data_stream import RecordBuilder
+from mcap.opcode import Opcode
+from mcap.records import (Channel, Chunk, ChunkIndex, DataEnd, Footer, Header, Message, MessageIndex, Metadata,
+                          MetadataIndex, Schema, Statistics, SummaryOffset)
+from mcap.writer import MCAP0_MAGIC, LIBRARY_IDENTIFIER
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION_TYPES = ('none', 'lz4', 'zstd')
+
+
+def make_compressor(compression: str, level: Optional[int] = None) -> Tuple[str, Callable[[bytes], bytes]]:
+    """
+    :param compression: 'none', 'lz4' or 'zstd'
+    :param level: codec specific compression level (None: library default)
+    :return: (compression name as stored in the chunk record, compress function)
+    """
+    if compression == 'zstd':
+        if zstandard is None:
+            raise RuntimeError('zstandard not installed')
+        zstd_level = 3 if level is None else level
+        # a ZstdCompressor must not be used by multiple threads at once: one per thread
+        local = threading.local()
+
+        def zstd_compress(data: bytes) -> bytes:
+            compressor = getattr(local, 'compressor', None)
+            if compressor is None:
+                compressor = local.compressor = zstandard.ZstdCompressor(level=zstd_level)
+            return compressor.compress(data)
+        return 'zstd', zstd_compress
+    if compression == 'lz4':
+        if lz4 is None:
+            raise RuntimeError('lz4 not installed')
+        lz4_level = 0 if level is None else level
+        return 'lz4', lambda data: lz4.frame.compress(data, compression_level=lz4_level)
+    if compression == 'none':
+        return '', lambda data: data
+    raise ValueError(f'unknown compression: {compression}')
+
+
+class McapChunkWriter:
+    def __init__(self, output: IO[Any], chunk_size: int = 1024 * 1024, compression: str = 'zstd',
+                 compression_level: Optional[int] = None, compression_threads: int = 0):
+        """
+        :param output: binary stream to write to (not closed by finish)
+        :param chunk_size: uncompressed size which closes a chunk
+        :param compression: 'none', 'lz4' or 'zstd'
+        :param compression_level: codec specific level (None: library default)
+        :param compression_threads: size of the compression thread pool (0: compress and write inline)
+        """
+        self._stream = output
+        self._chunk_size = chunk_size
+        self._compression, self._compress = make_compressor(compression, compression_level)
+
+        # pipeline: chunks are compressed by the pool and written in order by the writer thread
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._write_queue: Optional[queue.Queue] = None
+        self._write_thread: Optional[threading.Thread] = None
+        self._write_error: Optional[BaseException] = None
+        if compression_threads > 0 and compression != 'none':
+            self._pool = ThreadPoolExecutor(max_workers=compression_threads, thread_name_prefix='mcap_compress')
+            # limits the chunks in flight: the building thread blocks if compression can not keep up
+            self._write_queue = queue.Queue(maxsize=2 * compression_threads)
+            self._write_thread = threading.Thread(target=self._write_worker, name='mcap_write')
+            self._write_thread.start()
+
+        self._record_builder = RecordBuilder()
+        self._chunk_builder = RecordBuilder()
+        self._chunk_message_indices: Dict[int, MessageIndex] = {}
+        self._chunk_num_messages = 0
+        self._chunk_start_time = 0
+        self._chunk_end_time = 0
+
+        self._schemas: OrderedDict[int, Schema] = OrderedDict()
+        self._channels: OrderedDict[int, Channel] = OrderedDict()
+        self._chunk_indices: List[ChunkIndex] = []
+        self._metadata_indices: List[MetadataIndex] = []
+        self._statistics = Statistics(attachment_count=0, channel_count=0, channel_message_counts=defaultdict(int),
+                                      chunk_count=0, message_count=0, metadata_count=0, message_start_time=0,
+                                      message_end_time=0, schema_count=0)
+
+    def start(self, profile: str = '', library: str = LIBRARY_IDENTIFIER):
+        self._stream.write(MCAP0_MAGIC)
+        Header(profile, library).write(self._record_builder)
+        self._flush()
+
+    def register_schema(self, name: str, encoding: str, data: bytes) -> int:
+        schema_id = len(self._schemas) + 1
+        schema = Schema(id=schema_id, data=data, encoding=encoding, name=name)
+        self._schemas[schema_id] = schema
+        self._statistics.schema_count += 1
+        schema.write(self._chunk_builder)
+        return schema_id
+
+    def register_channel(self, topic: str, message_encoding: str, schema_id: int,
+                         metadata: Optional[Dict[str, str]] = None) -> int:
+        channel_id = len(self._channels) + 1
+        channel = Channel(id=channel_id, topic=topic, message_encoding=message_encoding, schema_id=schema_id,
+                          metadata=metadata or {})
+        self._channels[channel_id] = channel
+        self._statistics.channel_count += 1
+        channel.write(self._chunk_builder)
+        return channel_id
+
+    def add_message(self, channel_id: int, log_time: int, data: bytes, publish_time: int, sequence: int = 0):
+        stats = self._statistics
+        if stats.message_count == 0:
+            stats.message_start_time = log_time
+        else:
+            stats.message_start_time = min(log_time, stats.message_start_time)
+        stats.message_end_time = max(log_time, stats.message_end_time)
+        stats.channel_message_counts[channel_id] += 1
+        stats.message_count += 1
+
+        if self._chunk_num_messages == 0:
+            self._chunk_start_time = log_time
+        else:
+            self._chunk_start_time = min(self._chunk_start_time, log_time)
+        self._chunk_end_time = max(self._chunk_end_time, log_time)
+        index = self._chunk_message_indices.get(channel_id)
+        if index is None:
+            index = self._chunk_message_indices[channel_id] = MessageIndex(channel_id=channel_id, records=[])
+        index.records.append((log_time, self._chunk_builder.count))
+        self._chunk_num_messages += 1
+
+        Message(channel_id=channel_id, log_time=log_time, data=data, publish_time=publish_time,
+                sequence=sequence).write(self._chunk_builder)
+        if self._chunk_builder.count > self._chunk_size:
+            self._finalize_chunk()
+
+    def add_metadata(self, name: str, data: Dict[str, str]):
+        self._enqueue_write(lambda: self._write_metadata(name, data))
+
+    def _write_metadata(self, name: str, data: Dict[str, str]):
+        offset = self._stream.tell()
+        self._statistics.metadata_count += 1
+        Metadata(name=name, metadata=data).write(self._record_builder)
+        self._metadata_indices.append(MetadataIndex(offset=offset, length=self._record_builder.count, name=name))
+        self._flush()
+
+    def finish(self):
+        """
+        Write the last chunk, summary and footer. The output stream is not closed.
+        """
+        try:
+            self._finalize_chunk()
+        finally:
+            self._stop_pipeline()
+        DataEnd(0).write(self._record_builder)
+        self._flush()
+
+        summary_start = self._stream.tell()
+        summary_builder = RecordBuilder()
+        summary_offsets: List[SummaryOffset] = []
+
+        def write_group(opcode: Opcode, records):
+            group_start = summary_builder.count
+            for record in records:
+                record.write(summary_builder)
+            summary_offsets.append(SummaryOffset(group_opcode=opcode, group_start=summary_start + group_start,
+                                                 group_length=summary_builder.count - group_start))
+
+        write_group(Opcode.SCHEMA, self._schemas.values())
+        write_group(Opcode.CHANNEL, self._channels.values())
+        write_group(Opcode.STATISTICS, [self._statistics])
+        write_group(Opcode.CHUNK_INDEX, self._chunk_indices)
+        write_group(Opcode.ATTACHMENT_INDEX, [])
+        write_group(Opcode.METADATA_INDEX, self._metadata_indices)
+
+        summary_offset_start = summary_start + summary_builder.count
+        for offset in summary_offsets:
+            offset.write(summary_builder)
+
+        summary_data = summary_builder.end()
+        summary_crc = zlib.crc32(summary_data)
+        summary_crc = zlib.crc32(struct.pack('<BQQQ', Opcode.FOOTER, 8 + 8 + 4,
+                                             0 if len(summary_data) == 0 else summary_start, summary_offset_start),
+                                 summary_crc)
+        self._stream.write(summary_data)
+        Footer(summary_start=0 if len(summary_data) == 0 else summary_start,
+               summary_offset_start=summary_offset_start,
+               summary_crc=summary_crc).write(self._record_builder)
+        self._flush()
+        self._stream.write(MCAP0_MAGIC)
+
+    def _flush(self):
+        self._stream.write(self._record_builder.end())
+
+    def _enqueue_write(self, write_fn: Callable[[], None]):
+        """ run write_fn in file order: inline or in the writer thread """
+        if self._write_queue is None:
+            write_fn()
+            return
+        if self._write_error is not None:
+            raise RuntimeError('MCAP write failed') from self._write_error
+        self._write_queue.put(write_fn)
+
+    def _write_worker(self):
+        while True:
+            write_fn = self._write_queue.get()
+            if write_fn is None:
+                return
+            if self._write_error is not None:
+                continue  # keep draining to not block the building thread
+            try:
+                write_fn()
+            except BaseException as e:
+                self._write_error = e
+
+    def _stop_pipeline(self):
+        if self._write_thread is None:
+            return
+        self._write_queue.put(None)
+        self._write_thread.join()
+        self._pool.shutdown()
+        self._write_thread = None
+        self._write_queue = None
+        if self._write_error is not None:
+            raise RuntimeError('MCAP write failed') from self._write_error
+
+    def _compress_chunk(self, chunk_data: bytes, start_time: int, end_time: int) -> Chunk:
+        return Chunk(compression=self._compression,
+                     data=self._compress(chunk_data),
+                     message_start_time=start_time,
+                     message_end_time=end_time,
+                     uncompressed_crc=zlib.crc32(chunk_data),
+                     uncompressed_size=len(chunk_data))
+
+    def _finalize_chunk(self):
+        if self._chunk_num_messages == 0:
+            return
+        chunk_data = self._chunk_builder.end()
+        message_indices = self._chunk_message_indices
+        if self._pool is None:
+            self._write_chunk(self._compress_chunk(chunk_data, self._chunk_start_time, self._chunk_end_time),
+                              message_indices)
+        else:
+            future: Future = self._pool.submit(self._compress_chunk, chunk_data, self._chunk_start_time,
+                                               self._chunk_end_time)
+            self._enqueue_write(lambda: self._write_chunk(future.result(), message_indices))
+        self._chunk_message_indices = {}
+        self._chunk_num_messages = 0
+        self._chunk_start_time = 0
+        self._chunk_end_time = 0
+
+    def _write_chunk(self, chunk: Chunk, message_indices: Dict[int, MessageIndex]):
+        self._statistics.chunk_count += 1
+        chunk_start_offset = self._stream.tell()
+        chunk.write(self._record_builder)
+        chunk_index = ChunkIndex(message_start_time=chunk.message_start_time,
+                                 message_end_time=chunk.message_end_time,
+                                 chunk_start_offset=chunk_start_offset,
+                                 chunk_length=self._record_builder.count,
+                                 message_index_offsets={},
+                                 message_index_length=0,
+                                 compression=chunk.compression,
+                                 compressed_size=len(chunk.data),
+                                 uncompressed_size=chunk.uncompressed_size)
+        self._flush()
+
+        message_index_start_offset = self._stream.tell()
+        for channel_id, index in message_indices.items():
+            chunk_index.message_index_offsets[channel_id] = message_index_start_offset + self._record_builder.count
+            index.write(self._record_builder)
+        chunk_index.message_index_length = self._record_builder.count
+        self._flush()
+        self._chunk_indices.append(chunk_index)
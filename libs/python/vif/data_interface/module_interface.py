@@ -203,6 +203,7 @@ class ModuleInterface(LoggerMixin):
                             (Key(self.db_id, f'm/{self.name}', 'stop_capture'), self.__cb_stop_capture),
                             (Key(self.db_id, f'm/{self.name}', 'get_latest'), self.__cb_get_latest),
                             (Key(self.db_id, f'm/{self.name}', 'get_metadata'), self.__cb_get_metadata),
+                            (Key(self.db_id, f'm/{self.name}', 'get_queue_stats'), self.__cb_get_queue_stats),
                             (Key(self.db_id, f'm/{self.name}', 'get_schemas'), self.__cb_get_schemas)
                             ]:
             self.cm.declare_queryable(q_key, q_cb)
@@ -249,17 +250,23 @@ class ModuleInterface(LoggerMixin):
     def controller_watchdog(self):
         self.__logger.info('controller watchdog started')
 
+        # heartbeat: the registration message is published (no reply), the controller registers unknown modules on
+        # first sight (e.g. after a restart of the controller) and only refreshes the last-seen time of known ones
+        key = Key(self.db_id, 'c', 'presence')
+        pub_id = self.cm.declare_publisher(key)
+        message = ModuleRegistryQuery(cmd=ModuleRegistryQueryCmd.REGISTER,
+                                      module=Module(name=self.name, module_type=self.config_handler.type)).serialize()
+
         while not self.shutdown_ev.is_set():
             try:
-                # repeated registration is used as heartbeat
-                self.register()
-            except ConnectionException as e:
-                self.logger.warning(f'watchdog {type(e).__name__}: {e}')
+                self.cm.publish(key, message)
             except Exception as e:
-                self.__logger.error(f'watchdog register {type(e).__name__}: {e}\n{traceback.format_exc()}')
+                self.__logger.error(f'watchdog heartbeat {type(e).__name__}: {e}\n{traceback.format_exc()}')
 
             self.shutdown_ev.wait(timeout=1)
 
+        if pub_id is not None:
+            self.cm.undeclare_publisher(pub_id)
         self.__logger.info('controller watchdog stopped')
 
     def teardown(self):
@@ -533,7 +540,8 @@ class ModuleInterface(LoggerMixin):
 
             if self.data_config.enable_capturing:
                 self.module.command_prepare_capturing()
-                self.data_broker.prepare_capturing(message.name, data_schemas=self.module.command_get_schemas())
+                self.data_broker.prepare_capturing(message.name, data_schemas=self.module.command_get_schemas(),
+                                                   data_config=self.data_config)
                 self.state.state = MeasurementStateType.PREPARE_CAPTURING
             return Status(error=False).serialize()
 
@@ -654,6 +662,13 @@ class ModuleInterface(LoggerMixin):
             self.__logger.error(f'__cb_get_metadata ({type(e).__name__}): {e}\n{traceback.format_exc()}')
             return "{}".encode('utf-8')
 
+    def __cb_get_queue_stats(self, data: bytes) -> str | bytes:
+        try:
+            return orjson.dumps(self.data_broker.get_queue_stats())
+        except Exception as e:
+            self.__logger.error(f'__cb_get_queue_stats ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+            return "{}".encode('utf-8')
+
     def __cb_get_schemas(self, data: bytes) -> str | bytes:
         try:
             schemas = self.module.command_get_schemas()
@@ -1,5 +1,5 @@
 import json
-from typing import List, Union, Self, Optional
+from typing import List, Union, Self, Optional, Dict
 from enum import IntEnum
 from abc import ABC, abstractmethod
 
@@ -240,7 +240,14 @@ class ModuleDataConfigCmd(IntEnum):
 class ModuleDataConfig:
     def __init__(self, capturing_available: bool = True, live_available: bool = True,
                  enable_capturing: bool = False, enable_live_all_samples: bool = False,
-                 enable_live_fixed_rate: bool = False, live_rate_hz: float = 1.0):
+                 enable_live_fixed_rate: bool = False, live_rate_hz: float = 1.0, capture_format: str = 'json',
+                 rotate_size_mb: float = 0.0, rotate_duration_s: float = 0.0, rotate_sample_count: int = 0,
+                 mcap_chunk_size_kb: int = 1024, mcap_compression: str = 'zstd',
+                 mcap_compression_level: Optional[int] = None,
+                 mcap_compression_threads: int = 2, capture_overload_policy: str = 'drop_newest',
+                 live_overload_policy: str = 'drop_oldest', overload_block_timeout_s: float = 0.1,
+                 live_topic_rates_hz: Optional[Dict[str, float]] = None, live_aggregate_mode: str = 'latest',
+                 live_lttb_points: int = 200, live_all_batch_ms: float = 0.0, live_all_batch_size: int = 100):
         self.capturing_available: bool = capturing_available
         self.live_available: bool = live_available
 
@@ -248,6 +255,35 @@ class ModuleDataConfig:
         self.enable_live_all_samples: bool = enable_live_all_samples
         self.enable_live_fixed_rate: bool = enable_live_fixed_rate
         self.live_rate_hz: float = live_rate_hz
+        # fixed rate per schema topic, overrides live_rate_hz (0: no fixed rate data for this topic)
+        self.live_topic_rates_hz: Dict[str, float] = live_topic_rates_hz or {}
+        # fixed rate data: 'latest' sample only, or additionally per-interval 'envelope' (min/max/mean/count)
+        # or 'lttb' (live_lttb_points per channel) aggregates on the "liveagg" key (see live_aggregate.py)
+        self.live_aggregate_mode: str = live_aggregate_mode
+        self.live_lttb_points: int = live_lttb_points
+        # live-all samples within live_all_batch_ms (max. live_all_batch_size) are sent as one JSON array message on
+        # topic "livebatch" instead of "liveall" (0: one message per sample), unpacked by LiveDataReceiver;
+        # subscribers of "liveall" only (e.g. C++ modules) receive no live-all data while batching is enabled
+        self.live_all_batch_ms: float = live_all_batch_ms
+        self.live_all_batch_size: int = live_all_batch_size
+        # 'json': one JSON message per sample, 'columnar': binary batches for numeric-only schemas
+        self.capture_format: str = capture_format
+        # start a new MCAP segment when one of the limits is reached (0: disabled)
+        self.rotate_size_mb: float = rotate_size_mb
+        self.rotate_duration_s: float = rotate_duration_s
+        self.rotate_sample_count: int = rotate_sample_count
+        # MCAP writer: uncompressed chunk size, codec ('none', 'lz4', 'zstd') and codec specific level (None: codec
+        # default, zstd 3 / lz4 fast mode)
+        self.mcap_chunk_size_kb: int = mcap_chunk_size_kb
+        self.mcap_compression: str = mcap_compression
+        self.mcap_compression_level: Optional[int] = mcap_compression_level
+        # chunks are compressed by a thread pool of this size (0: compress inline in the capture thread)
+        self.mcap_compression_threads: int = mcap_compression_threads
+        # behaviour on full queues to the capture / live process: 'block', 'drop_oldest' or 'drop_newest'
+        # capture only: 'spill' (buffer in a write-ahead log next to the measurement until the capture caught up)
+        self.capture_overload_policy: str = capture_overload_policy
+        self.live_overload_policy: str = live_overload_policy
+        self.overload_block_timeout_s: float = overload_block_timeout_s
 
     def get_dict(self) -> dict:
         return self.__dict__
@@ -262,7 +298,23 @@ class ModuleDataConfig:
                    data['enable_capturing'],
                    data['enable_live_all_samples'],
                    data['enable_live_fixed_rate'],
-                   data['live_rate_hz'])
+                   data['live_rate_hz'],
+                   capture_format=data.get('capture_format', 'json'),
+                   rotate_size_mb=data.get('rotate_size_mb', 0.0),
+                   rotate_duration_s=data.get('rotate_duration_s', 0.0),
+                   rotate_sample_count=data.get('rotate_sample_count', 0),
+                   mcap_chunk_size_kb=data.get('mcap_chunk_size_kb', 1024),
+                   mcap_compression=data.get('mcap_compression', 'zstd'),
+                   mcap_compression_level=data.get('mcap_compression_level'),
+                   mcap_compression_threads=data.get('mcap_compression_threads', 2),
+                   capture_overload_policy=data.get('capture_overload_policy', 'drop_newest'),
+                   live_overload_policy=data.get('live_overload_policy', 'drop_oldest'),
+                   overload_block_timeout_s=data.get('overload_block_timeout_s', 0.1),
+                   live_topic_rates_hz=data.get('live_topic_rates_hz', {}),
+                   live_aggregate_mode=data.get('live_aggregate_mode', 'latest'),
+                   live_lttb_points=data.get('live_lttb_points', 200),
+                   live_all_batch_ms=data.get('live_all_batch_ms', 0.0),
+                   live_all_batch_size=data.get('live_all_batch_size', 100))
 
     @classmethod
     def deserialize(cls, json_str: Union[str, bytes]) -> Self:
@@ -0,0 +1,193 @@
+import multiprocessing
+import multiprocessing.sharedctypes
+import queue
+import threading
+import time
+from collections.abc import Sized
+from enum import Enum
+from typing import Any, Dict, Optional
+
+from vif.logger.logger import LoggerMixin
+from vif.data_interface.spill_wal import WalWriter
+
+
+class OverloadPolicy(Enum):
+    # wait up to block_timeout_s for free space, then drop the new item
+    BLOCK = 'block'
+    # remove the oldest queued item to make room for the new one
+    DROP_OLDEST = 'drop_oldest'
+    # drop the new item
+    DROP_NEWEST = 'drop_newest'
+    # append items to a write-ahead log on disk until the consumer caught up (see spill_wal.py)
+    SPILL = 'spill'
+
+    @classmethod
+    def from_str(cls, value: str, default: 'OverloadPolicy') -> 'OverloadPolicy':
+        try:
+            return cls(value)
+        except ValueError:
+            return default
+
+
+def create_written_counter() -> multiprocessing.sharedctypes.Synchronized:
+    """ shared counter of processed samples, incremented by the consumer process only """
+    return multiprocessing.Value('Q', 0, lock=False)
+
+
+class OverloadQueue(LoggerMixin):
+    def __init__(self, *args, mp_queue: multiprocessing.Queue, written_counter, name: str,
+                 policy: OverloadPolicy = OverloadPolicy.DROP_NEWEST, block_timeout_s: float = 0.1, **kwargs):
+        """
+        Producer side of a multiprocessing queue with an explicit overload policy and sample accounting.
+
+        Counters (in samples, an item may hold multiple samples):
+        enqueued: offered by the producer, dropped: lost due to overload, written: processed by the consumer
+        (written_counter is shared with the consumer process), high_water_mark: max. backlog between producer and
+        consumer (enqueued - dropped - written).
+        put may be called by multiple producer threads (e.g. live data), the counters are guarded by a lock.
+
+        :param mp_queue: queue shared with the consumer process
+        :param written_counter: shared counter (see create_written_counter), incremented by the consumer
+        :param name: used in log messages
+        """
+        super().__init__(*args, **kwargs)
+        self._queue = mp_queue
+        self._written = written_counter
+        self._name = name
+        self.policy: OverloadPolicy = policy
+        self.block_timeout_s: float = block_timeout_s
+
+        self._counter_lock = threading.Lock()
+        self.enqueued: int = 0
+        self.dropped: int = 0
+        self.spilled: int = 0
+        self.high_water_mark: int = 0
+
+        # OverloadPolicy.SPILL: set with set_spill, records_read is incremented by the consumer (WalReader)
+        self._spill: Optional[WalWriter] = None
+        self._spill_records_read = None
+        self._spill_records_written: int = 0
+        # number of items put into the queue, orders queue items and spilled items for the consumer
+        self._queued_items: int = 0
+
+        # drops are logged at most once per second
+        self._dropped_logged: int = 0
+        self._last_drop_log: float = 0
+
+    def configure(self, policy: OverloadPolicy, block_timeout_s: float):
+        self.policy = policy
+        self.block_timeout_s = block_timeout_s
+
+    def set_spill(self, spill: Optional[WalWriter], records_read=None):
+        """
+        :param spill: write-ahead log used with OverloadPolicy.SPILL (None: disable spilling)
+        :param records_read: shared counter of records consumed from the log
+        """
+        self._spill = spill
+        self._spill_records_read = records_read
+        self._spill_records_written = 0
+
+    def reset_counters(self):
+        # only call while the consumer is idle
+        with self._counter_lock:
+            self.enqueued = 0
+            self.dropped = 0
+            self.spilled = 0
+            self.high_water_mark = 0
+            self._dropped_logged = 0
+            self._queued_items = 0
+            self._written.value = 0
+
+    def get_counters(self) -> Dict[str, Any]:
+        with self._counter_lock:
+            return {'policy': self.policy.value,
+                    'enqueued': self.enqueued,
+                    'written': self._written.value,
+                    'dropped': self.dropped,
+                    'spilled': self.spilled,
+                    'high_water_mark': self.high_water_mark}
+
+    def put(self, item: Any, count: int = 1) -> bool:
+        """
+        :param item: object to send to the consumer
+        :param count: number of samples contained in item
+        :return: False if item was dropped
+        """
+        with self._counter_lock:
+            self.enqueued += count
+        accepted = True
+        if self.policy == OverloadPolicy.BLOCK:
+            try:
+                self._queue.put(item, timeout=self.block_timeout_s)
+            except queue.Full:
+                self._drop(count)
+                accepted = False
+        elif self.policy == OverloadPolicy.DROP_OLDEST:
+            accepted = self._put_drop_oldest(item, count)
+        elif self.policy == OverloadPolicy.SPILL and self._spill is not None:
+            accepted = self._put_spill(self._spill, item, count)
+        else:
+            try:
+                self._queue.put_nowait(item)
+                self._count_queued()
+            except queue.Full:
+                self._drop(count)
+                accepted = False
+
+        with self._counter_lock:
+            backlog = self.enqueued - self.dropped - self._written.value
+            if backlog > self.high_water_mark:
+                self.high_water_mark = backlog
+        return accepted
+
+    def _count_queued(self):
+        with self._counter_lock:
+            self._queued_items += 1
+
+    def _put_spill(self, spill: WalWriter, item: Any, count: int) -> bool:
+        # once spilling started, items go to the log until the consumer drained it (keeps the order)
+        if self._spill_records_written == self._spill_records_read.value:
+            try:
+                self._queue.put_nowait(item)
+                self._count_queued()
+                return True
+            except queue.Full:
+                pass
+        try:
+            spill.append(item, queued_before=self._queued_items)
+        except Exception as e:
+            self.logger.error(f'EX spill {type(e).__name__}: {e}')
+            self._drop(count)
+            return False
+        self._spill_records_written += 1
+        with self._counter_lock:
+            self.spilled += count
+        return True
+
+    def _put_drop_oldest(self, item: Any, count: int) -> bool:
+        # queue may be full while its items are still buffered in the feeder thread (get fails): limit retries
+        for _ in range(3):
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                pass
+            try:
+                oldest = self._queue.get_nowait()
+                self._drop(len(oldest) if isinstance(oldest, Sized) else 1)
+            except queue.Empty:
+                time.sleep(0.001)
+        self._drop(count)
+        return False
+
+    def _drop(self, count: int):
+        with self._counter_lock:
+            self.dropped += count
+            now = time.monotonic()
+            if now - self._last_drop_log < 1:
+                return
+            dropped_since_log = self.dropped - self._dropped_logged
+            total = self._dropped_logged = self.dropped
+            self._last_drop_log = now
+        self.logger.warning('%s queue full (%s): dropped %d samples (total %d)', self._name, self.policy.value,
+                            dropped_since_log, total)
@@ -0,0 +1,35 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Iterator, List, Tuple
+
+if TYPE_CHECKING:
+    # numpy is only needed by modules using DataBroker.data_in_batch (not installed in all module images)
+    import numpy as np
+
+
+@dataclass
+class SampleBlock:
+    """
+    Block of samples of one schema (see DataBroker.data_in_batch). Moved to the capture and live process as one
+    queue item, samples are unpacked there.
+    """
+    schema_index: int
+    # int64 timestamps, one per sample
+    times_ns: 'np.ndarray'
+    # channel names, one column per name (columns keep their own dtype)
+    keys: Tuple[str, ...]
+    columns: List['np.ndarray']
+
+    def __len__(self) -> int:
+        return len(self.times_ns)
+
+    def __iter__(self) -> Iterator[Tuple[int, Dict, int]]:
+        """ samples as (time_ns, data, schema_index), like the items of a capture batch """
+        schema_index = self.schema_index
+        keys = self.keys
+        # tolist: python scalars for JSON and columnar packing, one conversion per column instead of per value
+        for time_ns, values in zip(self.times_ns.tolist(), zip(*(c.tolist() for c in self.columns))):
+            yield time_ns, dict(zip(keys, values)), schema_index
+
+    def last(self) -> Tuple[int, Dict]:
+        """ (time_ns, data) of the last sample """
+        return int(self.times_ns[-1]), dict(zip(self.keys, (c[-1].item() for c in self.columns)))
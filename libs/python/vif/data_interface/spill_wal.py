@@ -0,0 +1,161 @@
+"""
+Write-ahead log used to spill capture batches to disk when the queue to the capture process is full.
+
+The producer (WalWriter, module process) appends records to memory-mapped, preallocated segment files next to the
+measurement. The capture process (WalReader) merges them back in producer order: every record stores the number of
+batches which were put into the queue before it, the reader only takes a record after it consumed that many batches
+from the queue. Consumed segments are deleted.
+
+Segment file: records of  uint32 length | uint64 queued_before | pickled batch
+A length of END_OF_SEGMENT marks that the writer continued in the next segment.
+"""
+
+import mmap
+import os
+import pickle
+import re
+import struct
+from pathlib import Path
+from typing import Any, List, Optional
+
+from vif.logger.logger import LoggerMixin
+
+WAL_SEGMENT_SIZE = 64 * 1024 * 1024
+END_OF_SEGMENT = 0xFFFFFFFF
+_HEADER = struct.Struct('<IQ')
+
+
+def wal_segment_path(directory: Path, module_name: str, index: int) -> Path:
+    return Path(directory) / f'{module_name}.spill.{index:04d}.wal'
+
+
+def wal_segment_paths(directory: Path, module_name: str) -> List[Path]:
+    """ all segment files of a module in the directory, in order """
+    pattern = re.compile(re.escape(module_name) + r'\.spill\.[0-9]{4,}\.wal')
+    return sorted(p for p in Path(directory).iterdir() if pattern.fullmatch(p.name))
+
+
+class WalWriter(LoggerMixin):
+    def __init__(self, *args, directory: Path, module_name: str, records_written, **kwargs):
+        """
+        :param records_written: shared counter of appended records, read by WalReader
+        """
+        super().__init__(*args, **kwargs)
+        self._directory = Path(directory)
+        self._module_name = module_name
+        self._records_written = records_written
+        self._segment_index = -1
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._offset = 0
+
+    def _next_segment(self, min_size: int):
+        if self._mmap is not None:
+            # tell the reader to continue in the next segment
+            _HEADER.pack_into(self._mmap, self._offset, END_OF_SEGMENT, 0)
+            self._close_segment()
+        self._segment_index += 1
+        size = max(WAL_SEGMENT_SIZE, min_size + 2 * _HEADER.size)
+        path = wal_segment_path(self._directory, self._module_name, self._segment_index)
+        self._file = open(path, 'w+b')
+        # preallocate: writes to the mapping do not extend the file
+        os.ftruncate(self._file.fileno(), size)
+        self._mmap = mmap.mmap(self._file.fileno(), size)
+        self._offset = 0
+        self.logger.info('spilling to %s', path.name)
+
+    def _close_segment(self):
+        if self._mmap is not None:
+            self._mmap.flush()
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def append(self, item: Any, queued_before: int):
+        """
+        :param item: object to spill (pickled)
+        :param queued_before: number of items put into the queue before this one
+        """
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        # keep room for the end-of-segment marker
+        if self._mmap is None or self._offset + 2 * _HEADER.size + len(data) > len(self._mmap):
+            self._next_segment(len(data))
+        _HEADER.pack_into(self._mmap, self._offset, len(data), queued_before)
+        self._mmap[self._offset + _HEADER.size:self._offset + _HEADER.size + len(data)] = data
+        self._offset += _HEADER.size + len(data)
+        # publish the record after its bytes are in the shared mapping
+        self._records_written.value += 1
+
+    def close(self):
+        self._close_segment()
+
+
+class WalReader(LoggerMixin):
+    def __init__(self, *args, directory: Path, module_name: str, records_written, records_read, **kwargs):
+        """
+        :param records_written: shared counter incremented by WalWriter
+        :param records_read: shared counter of consumed records, lets the writer detect a drained log
+        """
+        super().__init__(*args, **kwargs)
+        self._directory = Path(directory)
+        self._module_name = module_name
+        self._records_written = records_written
+        self._records_read = records_read
+        self._segment_index = 0
+        self._file = None
+        self._mmap: Optional[mmap.mmap] = None
+        self._offset = 0
+
+    def pending(self) -> bool:
+        return self._records_written.value > self._records_read.value
+
+    def _open_segment(self):
+        path = wal_segment_path(self._directory, self._module_name, self._segment_index)
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._offset = 0
+
+    def _remove_segment(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        wal_segment_path(self._directory, self._module_name, self._segment_index).unlink(missing_ok=True)
+
+    def _head(self):
+        """ header of the next record (length, queued_before), skipping finished segments """
+        while True:
+            if self._mmap is None:
+                self._open_segment()
+            length, queued_before = _HEADER.unpack_from(self._mmap, self._offset)
+            if length != END_OF_SEGMENT:
+                return length, queued_before
+            self._remove_segment()
+            self._segment_index += 1
+
+    def next_queued_before(self) -> Optional[int]:
+        """ number of queue items which have to be consumed before the next record, None if nothing is pending """
+        if not self.pending():
+            return None
+        return self._head()[1]
+
+    def read(self) -> Any:
+        length, _ = self._head()
+        start = self._offset + _HEADER.size
+        item = pickle.loads(self._mmap[start:start + length])
+        self._offset = start + length
+        self._records_read.value += 1
+        return item
+
+    def close(self):
+        """ remove all segments of the module, records not read until now are lost """
+        self._remove_segment()
+        unread = self._records_written.value - self._records_read.value
+        if unread > 0:
+            self.logger.warning('%d spilled records not written, removing spill files', unread)
+        for path in wal_segment_paths(self._directory, self._module_name):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,199 @@
+"""
+Delivery of received messages to subscription callbacks (see RouterConnection.subscribe).
+
+The SUB worker thread of a router connection hands each message to the delivery of every subscriber of the topic.
+Modes:
+    inline: callback runs on the SUB worker thread (default, a slow callback delays all topics of the connection)
+    thread: dedicated thread per subscription with a bounded queue
+    pool:   bounded queue per subscription, drained by a thread pool shared by all "pool" subscriptions of the
+            connection (messages of one subscription stay in order)
+
+Queued modes never block the SUB worker: when the queue is full the oldest message is dropped. With conflate only the
+latest message is kept ("latest value only", e.g. state updates or fixed-rate live data).
+"""
+
+import collections
+import logging
+import threading
+import time
+import traceback
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Deque, Dict, Optional, Tuple
+
+DELIVERY_MODES = ('inline', 'thread', 'pool')
+
+
+@dataclass(frozen=True)
+class DeliveryPolicy:
+    mode: str = 'inline'
+    # maximum number of queued messages (thread / pool), the oldest is dropped when full
+    queue_size: int = 1000
+    # keep only the latest message (thread / pool)
+    conflate: bool = False
+
+    def __post_init__(self):
+        if self.mode not in DELIVERY_MODES:
+            raise ValueError(f'unknown delivery mode: {self.mode}')
+        if self.queue_size < 1:
+            raise ValueError('queue_size must be at least 1')
+
+
+class SubscriberDelivery:
+    def __init__(self, sub_id: int, topic: str, callback: Callable[[str, bytes], None], policy: DeliveryPolicy):
+        """
+        Inline delivery and base class. put is called by the SUB worker thread only.
+        """
+        self.sub_id = sub_id
+        self.topic = topic
+        self.callback = callback
+        self.policy = policy
+        self._logger = logging.getLogger(f'SubscriberDelivery {topic}')
+        # counters are only written by the thread running the callback (dropped / conflated by the SUB worker)
+        self._delivered = 0
+        self._dropped = 0
+        self._conflated = 0
+        self._errors = 0
+        self._last_lag_s = 0.
+        self._max_lag_s = 0.
+
+    def put(self, topic: str, msg: bytes, received: float) -> None:
+        """
+        :param received: time.monotonic() when the SUB worker received the message
+        """
+        self._invoke(topic, msg, received)
+
+    def queued(self) -> int:
+        return 0
+
+    def close(self) -> None:
+        pass
+
+    def stats(self) -> Dict:
+        """ lag: time from reception on the SUB socket to the start of the callback """
+        return {'topic': self.topic, 'mode': self.policy.mode, 'conflate': self.policy.conflate,
+                'delivered': self._delivered, 'dropped': self._dropped, 'conflated': self._conflated,
+                'errors': self._errors, 'queued': self.queued(),
+                'lag_last_s': self._last_lag_s, 'lag_max_s': self._max_lag_s}
+
+    def _invoke(self, topic: str, msg: bytes, received: float) -> None:
+        lag = time.monotonic() - received
+        self._last_lag_s = lag
+        if lag > self._max_lag_s:
+            self._max_lag_s = lag
+        try:
+            self.callback(topic, msg)
+        except Exception as e:
+            self._errors += 1
+            self._logger.error(f'EX callback ({type(e).__name__}): {e}\n{traceback.format_exc()}')
+        self._delivered += 1
+
+
+class QueuedDelivery(SubscriberDelivery, ABC):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._max_queued = 1 if self.policy.conflate else self.policy.queue_size
+        self._cond = threading.Condition()
+        self._queue: Deque[Tuple[str, bytes, float]] = collections.deque()
+        self._closed = False
+
+    def put(self, topic: str, msg: bytes, received: float) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            if len(self._queue) >= self._max_queued:
+                self._queue.popleft()
+                if self.policy.conflate:
+                    self._conflated += 1
+                else:
+                    self._dropped += 1
+            self._queue.append((topic, msg, received))
+            self._notify()
+
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._queue.clear()
+            self._cond.notify()
+
+    @abstractmethod
+    def _notify(self) -> None:
+        """ called with _cond held after a message was queued """
+        ...
+
+
+class ThreadDelivery(QueuedDelivery):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._thread = threading.Thread(target=self._worker, name=f'sub_delivery {self.topic}', daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        super().close()
+        if self._thread is not threading.current_thread():  # unsubscribe from within the callback
+            self._thread.join()
+
+    def _notify(self) -> None:
+        self._cond.notify()
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                while len(self._queue) == 0 and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                item = self._queue.popleft()
+            self._invoke(*item)
+
+
+class PoolDelivery(QueuedDelivery):
+    # messages delivered per pool task before the subscription is rescheduled (fairness between subscriptions)
+    BATCH = 100
+
+    def __init__(self, *args, executor: ThreadPoolExecutor, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._executor = executor
+        # a drain task is submitted or running (at most one per subscription: keeps the order)
+        self._scheduled = False
+
+    def _notify(self) -> None:
+        if not self._scheduled:
+            self._scheduled = True
+            self._executor.submit(self._drain)
+
+    def _drain(self) -> None:
+        for _ in range(self.BATCH):
+            with self._cond:
+                if len(self._queue) == 0 or self._closed:
+                    self._scheduled = False
+                    return
+                item = self._queue.popleft()
+            self._invoke(*item)
+        with self._cond:
+            if len(self._queue) == 0 or self._closed:
+                self._scheduled = False
+            else:
+                try:
+                    self._executor.submit(self._drain)
+                except RuntimeError:  # executor shut down
+                    self._scheduled = False
+
+
+def create_subscriber_delivery(sub_id: int, topic: str, callback: Callable[[str, bytes], None],
+                               policy: Optional[DeliveryPolicy],
+                               get_executor: Callable[[], ThreadPoolExecutor]) -> SubscriberDelivery:
+    """
+    :param policy: None for inline delivery
+    :param get_executor: returns the shared pool of the connection (only called for mode "pool")
+    """
+    policy = DeliveryPolicy() if policy is None else policy
+    if policy.mode == 'thread':
+        return ThreadDelivery(sub_id, topic, callback, policy)
+    if policy.mode == 'pool':
+        return PoolDelivery(sub_id, topic, callback, policy, executor=get_executor())
+    return SubscriberDelivery(sub_id, topic, callback, policy)
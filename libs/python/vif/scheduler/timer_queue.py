@@ -0,0 +1,133 @@
+"""
+Deadline scheduler: callbacks are executed by one worker thread in the order of their deadlines.
+
+Pending timers are kept in a heap (O(log n) per timer), the worker sleeps on a condition variable until the earliest
+deadline or until an earlier timer is added (no polling while idle).
+Cancelled timers stay in the heap until they reach the top or the heap is compacted.
+
+    timers = TimerQueue(name='my_timers')
+    timers.start()
+    handle = timers.call_later(0.5, partial(print, 'done'))
+    handle.cancel()
+    timers.stop()
+"""
+
+import heapq
+import itertools
+import threading
+import time
+import traceback
+from typing import Callable, List, Optional, Tuple
+
+from vif.logger.logger import LoggerMixin
+
+
+class TimerHandle:
+    __slots__ = ('deadline', 'callback', 'cancelled', '_queue')
+
+    def __init__(self, deadline: float, callback: Callable[[], None], timer_queue: 'TimerQueue'):
+        self.deadline = deadline
+        self.callback: Optional[Callable[[], None]] = callback
+        self.cancelled = False
+        self._queue = timer_queue
+
+    def cancel(self) -> bool:
+        """
+        :return: True if the timer was pending (it will not be executed), False if already executed or cancelled
+        """
+        return self._queue._cancel(self)
+
+
+class TimerQueue(LoggerMixin):
+    # compact the heap when more than half of the (at least this many) entries are cancelled
+    COMPACT_MIN_SIZE = 64
+
+    def __init__(self, *args, name: str = 'timer_queue', **kwargs):
+        """
+        :param name: name of the worker thread
+        """
+        super().__init__(*args, **kwargs)
+        self._cond = threading.Condition()
+        # (deadline, sequence number, handle): the sequence keeps the insertion order of equal deadlines
+        self._heap: List[Tuple[float, int, TimerHandle]] = []
+        self._seq = itertools.count()
+        self._cancelled = 0
+        self._stopped = False
+        self._thread = threading.Thread(target=self._worker, name=name)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops the worker thread (after a running callback returned), pending timers are dropped.
+        """
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def call_at(self, deadline: float, callback: Callable[[], None]) -> TimerHandle:
+        """
+        :param deadline: time.monotonic() when the callback is due
+        """
+        handle = TimerHandle(deadline, callback, self)
+        with self._cond:
+            heapq.heappush(self._heap, (deadline, next(self._seq), handle))
+            # wake the worker only if the new timer is the earliest
+            if self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def call_later(self, delay_s: float, callback: Callable[[], None]) -> TimerHandle:
+        return self.call_at(time.monotonic() + delay_s, callback)
+
+    def pending(self) -> int:
+        """ number of pending (not cancelled) timers """
+        with self._cond:
+            return len(self._heap) - self._cancelled
+
+    def _cancel(self, handle: TimerHandle) -> bool:
+        with self._cond:
+            if handle.cancelled or handle.callback is None:
+                return False
+            handle.cancelled = True
+            handle.callback = None
+            self._cancelled += 1
+            if len(self._heap) >= self.COMPACT_MIN_SIZE and self._cancelled * 2 > len(self._heap):
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+            # no notify: the worker skips the cancelled timer when it is due
+            return True
+
+    def _worker(self) -> None:
+        self.logger.debug('thread started')
+        while True:
+            with self._cond:
+                while True:
+                    if self._stopped:
+                        self.logger.debug('thread stopped')
+                        return
+                    if len(self._heap) == 0:
+                        self._cond.wait()
+                        continue
+                    deadline, _, handle = self._heap[0]
+                    if handle.cancelled:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                        continue
+                    wait_time = deadline - time.monotonic()
+                    if wait_time > 0:
+                        self._cond.wait(timeout=wait_time)
+                        continue
+                    heapq.heappop(self._heap)
+                    callback, handle.callback = handle.callback, None
+                    break
+
+            # run outside the lock: the callback may add or cancel timers
+            try:
+                callback()
+            except Exception as e:
+                self.logger.error(f'EX callback ({type(e).__name__}): {e}\n{traceback.format_exc()}')
@@ -1,7 +1,7 @@
 import threading
 import json
 import logging
-from typing import Optional, List
+from typing import Optional, List, Callable
 
 import websockets.exceptions
 import websockets.sync.server as ws_server
@@ -27,6 +27,7 @@ class WebSocketAPI(LoggerMixin):
 
         self._clients: List[WSClient] = []
         self._clients_lock = threading.Lock()
+        self._connect_callbacks: List[Callable[[int], None]] = []
 
         # suppress websocket library logging
         logging.getLogger("websockets").setLevel(logging.WARNING)
@@ -46,6 +47,12 @@ class WebSocketAPI(LoggerMixin):
             self._server_thread.join()
         self.logger.info("Server Closed.")
 
+    def add_connect_callback(self, callback: Callable[[int], None]):
+        """
+        Register a callback invoked with the client id after a new client connected (e.g. to send an initial state).
+        """
+        self._connect_callbacks.append(callback)
+
     def get_client_ids(self) -> List[int]:
         with self._clients_lock:
             ids = [x.client_id for x in self._clients]
@@ -71,15 +78,22 @@ class WebSocketAPI(LoggerMixin):
         # add new client
         with self._clients_lock:
             self._client_id_counter += 1
-            self._clients.append(WSClient(self._client_id_counter, websocket))
+            client_id = self._client_id_counter
+            self._clients.append(WSClient(client_id, websocket))
             try:
-                websocket.send(json.dumps({'type': 'id', 'id': self._client_id_counter}))
+                websocket.send(json.dumps({'type': 'id', 'id': client_id}))
             except Exception as e:
-                self.logger.error(f"_ws_handler EX client {self._client_id_counter} send id failed: "
+                self.logger.error(f"_ws_handler EX client {client_id} send id failed: "
                                   f"{type(e).__name__}: {e}")
             else:
                 self.logger.info("Client %d connected (total: %d)",
-                                 self._client_id_counter, len(self._clients))
+                                 client_id, len(self._clients))
+
+        for callback in self._connect_callbacks:
+            try:
+                callback(client_id)
+            except Exception as e:
+                self.logger.error(f"_ws_handler EX connect callback client {client_id}: {type(e).__name__}: {e}")
 
         # wait
         try:
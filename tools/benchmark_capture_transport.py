@@ -0,0 +1,76 @@
+"""
+Benchmark the sample transport between DataBroker.data_in and the capture process.
+
+Compares the former per-sample multiprocessing.Queue transport with the micro-batching BatchQueue.
+Reports the producer-side cost per sample and the end-to-end throughput (samples/s received by the consumer).
+
+run with: PYTHONPATH=libs/python python3 tools/benchmark_capture_transport.py [num_samples]
+"""
+
+import multiprocessing
+import queue
+import sys
+import time
+
+from vif.data_interface.batch_queue import BatchQueue
+from vif.data_interface.overload_queue import OverloadQueue, create_written_counter
+
+
+def consumer(q: multiprocessing.Queue, num_samples: int, batched: bool, result_q: multiprocessing.Queue):
+    received = 0
+    t_first = None
+    while received < num_samples:
+        try:
+            item = q.get(timeout=5)
+        except queue.Empty:
+            break
+        if t_first is None:
+            t_first = time.perf_counter()
+        received += len(item) if batched else 1
+    result_q.put((received, time.perf_counter() - t_first if t_first is not None else 0))
+
+
+def run(num_samples: int, batched: bool):
+    sample = {f'channel_{i}': float(i) for i in range(8)}
+    if batched:
+        q = multiprocessing.Queue(maxsize=200)
+        sink = OverloadQueue(mp_queue=q, written_counter=create_written_counter(), name='benchmark')
+        producer = BatchQueue(sink=sink, batch_size=500, flush_interval_s=0.01)
+        producer.start()
+        put = producer.put
+    else:
+        q = multiprocessing.Queue(maxsize=100000)
+        producer = None
+        put = q.put_nowait
+    result_q = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=consumer, args=(q, num_samples, batched, result_q))
+    proc.start()
+    time.sleep(0.5)
+
+    dropped = 0
+    t_start = time.perf_counter()
+    for i in range(num_samples):
+        try:
+            if put((time.time_ns(), sample, 0)) is False:
+                dropped += 1
+        except queue.Full:
+            dropped += 1
+    t_producer = time.perf_counter() - t_start
+    if producer is not None:
+        producer.flush()
+
+    received, t_consumer = result_q.get()
+    proc.join()
+    if producer is not None:
+        producer.close()
+
+    name = 'BatchQueue' if batched else 'per-sample Queue'
+    print(f'{name:18s}: producer {t_producer / num_samples * 1e6:7.2f} us/sample | '
+          f'end-to-end {received / max(t_consumer, t_producer, 1e-9):12,.0f} samples/s | '
+          f'received {received}/{num_samples} (dropped calls: {dropped})')
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    run(n, batched=False)
+    run(n, batched=True)
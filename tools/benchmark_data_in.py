@@ -0,0 +1,58 @@
+"""
+Benchmark the per-sample cost of DataBroker.data_in (dict, channel names checked per sample) against
+DataBroker.data_in_fast (values only, channel names checked once by register_schema) and DataBroker.data_in_batch
+(blocks of 1000 samples).
+
+Capture and live forwarding are inactive: the measured time is the producer side preparation of a sample (name
+handling, dict creation, latest data). The cost of JSON serialization is listed for comparison.
+
+run with: PYTHONPATH=libs/python python3 tools/benchmark_data_in.py [num_samples]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import orjson
+
+from vif.data_interface.data_broker import DataBroker
+
+
+def per_sample_us(fn, samples) -> float:
+    t = time.perf_counter()
+    for time_ns, values in samples:
+        fn(time_ns, values)
+    return (time.perf_counter() - t) / len(samples) * 1e6
+
+
+def run(broker: DataBroker, num_samples: int, num_channels: int):
+    keys = [f'channel {i}/value' for i in range(num_channels)]
+    broker.register_schema(keys)
+    rows = np.random.default_rng(0).random((num_samples, num_channels))
+    tuples = [(i, tuple(row.tolist())) for i, row in enumerate(rows)]
+    dicts = [(i, dict(zip(keys, values))) for i, values in tuples]
+    numpy_rows = list(enumerate(rows))
+    block_size = 1000
+    blocks = [(np.arange(i, i + block_size), rows[i:i + block_size]) for i in range(0, num_samples, block_size)]
+
+    results = {
+        'data_in (dict)': per_sample_us(broker.data_in, dicts),
+        'data_in_fast (tuple)': per_sample_us(broker.data_in_fast, tuples),
+        'data_in_fast (numpy row)': per_sample_us(broker.data_in_fast, numpy_rows),
+        'data_in_batch (block)': per_sample_us(broker.data_in_batch, blocks) / block_size,
+        'reference: orjson.dumps': per_sample_us(lambda _t, d: orjson.dumps(d), dicts),
+    }
+    print(f'{num_channels} channels:')
+    for name, us in results.items():
+        print(f'  {name:26s} {us:6.3f} us/sample')
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_broker = DataBroker(db_id='benchmark', db_router='localhost', data_dir=Path(tmp_dir),
+                                 module_name='benchmark', module_type='benchmark')
+        for channels in (4, 16, 64):
+            run(data_broker, n, channels)
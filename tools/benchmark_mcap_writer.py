@@ -0,0 +1,85 @@
+"""
+Benchmark the MCAP writer used by the capture process with different chunk sizes, codecs, compression levels and
+compression thread pool sizes.
+
+Writes synthetic JSON samples (like DataBroker.data_in would produce) to a temporary file for each setting and reports
+the input throughput (MB/s of uncompressed message data), the CPU usage of the writing process (> 100 % with
+compression threads) and the compression ratio (message data / file size).
+
+run with: PYTHONPATH=libs/python python3 tools/benchmark_mcap_writer.py [num_samples]
+"""
+
+import math
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import orjson
+
+from vif.data_interface.mcap_writer import McapChunkWriter
+
+# (codec, level, chunk size in kB, compression threads)
+SETTINGS = [
+    ('none', None, 1024, 0),
+    ('lz4', 0, 1024, 0),
+    ('lz4', 9, 1024, 0),
+    ('lz4', 9, 1024, 2),
+    ('zstd', 1, 1024, 0),
+    ('zstd', 3, 256, 0),
+    ('zstd', 3, 1024, 0),
+    ('zstd', 3, 1024, 2),
+    ('zstd', 3, 4096, 0),
+    ('zstd', 9, 1024, 0),
+    ('zstd', 9, 1024, 2),
+    ('zstd', 9, 1024, 4),
+    ('zstd', 19, 1024, 0),
+    ('zstd', 19, 1024, 4),
+]
+
+
+def synthetic_samples(num_samples: int):
+    # slowly changing signals compress similar to real sensor data, the counter defeats trivial repetition
+    t0 = time.time_ns()
+    return [(t0 + i * 1_000_000,
+             orjson.dumps({'counter': i,
+                           'sine': math.sin(i / 100),
+                           'cosine': math.cos(i / 100),
+                           'ramp': (i % 1000) / 10,
+                           'noise': (i * 7919 % 1013) / 1013,
+                           'status': i % 3 == 0}))
+            for i in range(num_samples)]
+
+
+def run(samples, compression: str, level, chunk_size_kb: int, threads: int, out_dir: Path):
+    path = out_dir / f'bench_{compression}_{level}_{chunk_size_kb}_{threads}.mcap'
+    input_bytes = sum(len(data) for _, data in samples)
+
+    t_wall = time.perf_counter()
+    t_cpu = time.process_time()
+    with open(path, 'wb') as f:
+        writer = McapChunkWriter(f, chunk_size=chunk_size_kb * 1024, compression=compression,
+                                 compression_level=level, compression_threads=threads)
+        writer.start()
+        schema_id = writer.register_schema(name='bench', encoding='jsonschema', data=b'{}')
+        channel_id = writer.register_channel(topic='bench', message_encoding='json', schema_id=schema_id)
+        for time_ns, data in samples:
+            writer.add_message(channel_id=channel_id, log_time=time_ns, data=data, publish_time=time_ns)
+        writer.finish()
+    t_wall = time.perf_counter() - t_wall
+    t_cpu = time.process_time() - t_cpu
+
+    file_size = path.stat().st_size
+    path.unlink()
+    print(f'{compression:5s} level {str(level):4s} chunk {chunk_size_kb:5d} kB threads {threads}: '
+          f'{input_bytes / t_wall / 1e6:8.2f} MB/s | CPU {t_cpu / t_wall * 100:6.1f} % | '
+          f'ratio {input_bytes / file_size:6.2f} | file {file_size / 1e6:8.2f} MB')
+
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    data_samples = synthetic_samples(n)
+    print(f'{n} samples, {sum(len(d) for _, d in data_samples) / 1e6:.2f} MB message data')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for setting in SETTINGS:
+            run(data_samples, *setting, out_dir=Path(tmp_dir))
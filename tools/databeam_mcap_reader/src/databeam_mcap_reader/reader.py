@@ -41,6 +41,11 @@ logger.setLevel(logging.DEBUG)
 
 backup_dir_name = 'bak_recovery'
 
+# binary batches of numeric samples written by DataBroker (see vif/data_interface/columnar.py):
+# uint32 count | int64 ts[count] | column_0[count] | ... with the column layout stored in the channel metadata
+COLUMNAR_MESSAGE_ENCODING = 'databeam-columnar'
+COLUMNAR_METADATA_NAME = 'databeam_columnar'
+
 
 def get_mcap_binary(check_version: bool = False) -> Path:
     if platform.system() == "Windows":
@@ -82,13 +87,19 @@ class McapTopic:
     def __init__(self, reader: mcap.reader.McapReader, mcap_path: Path, topic_key: int, str_limit: int = 80):
         self.summary = reader.get_summary()
         message_encoding = self.summary.channels[topic_key].message_encoding
-        if message_encoding != 'json':
+        self._columnar_layout: Optional[List] = None
+        if message_encoding == COLUMNAR_MESSAGE_ENCODING:
+            self._columnar_layout = json.loads(self.summary.channels[topic_key].metadata['layout'])
+        elif message_encoding != 'json':
             raise Exception("Unsupported message encoding: " + message_encoding)
         self._reader = reader
         self._mcap_path = mcap_path
         self._topic_keys = [topic_key]
         self.topic = self.summary.channels[topic_key].topic
-        if topic_key in self.summary.statistics.channel_message_counts:
+        if self._columnar_layout is not None:
+            # one message holds many samples
+            self._message_count = self._columnar_sample_count()
+        elif topic_key in self.summary.statistics.channel_message_counts:
             self._message_count = self.summary.statistics.channel_message_counts[topic_key]
         else:
             self._message_count = 0
@@ -160,6 +171,11 @@ class McapTopic:
             logger.error(f'Tried adding topic key {topic_key} to topic {self.topic} with different topic name '
                          f'{self.summary.channels[topic_key].topic}')
             return
+        if self._columnar_layout is not None or \
+                self.summary.channels[topic_key].message_encoding == COLUMNAR_MESSAGE_ENCODING:
+            logger.error(f'Multiple channels are not supported for columnar topic {self.topic} - '
+                         f'skipping topic key {topic_key}')
+            return
 
         # update message count
         if topic_key in self.summary.statistics.channel_message_counts:
@@ -278,6 +294,48 @@ class McapTopic:
 
         self._np_struct_format = np.dtype(np_dtypes)
 
+    def _columnar_sample_count(self) -> int:
+        # sample counts are written as metadata record when the file is finished
+        for metadata in self._reader.iter_metadata():
+            if metadata.name == COLUMNAR_METADATA_NAME and self.topic in metadata.metadata:
+                return int(metadata.metadata[self.topic])
+        # unfinished or recovered file: sum up the message headers
+        logger.debug(f'No sample count for columnar topic "{self.topic}", scanning messages')
+        count = 0
+        for _, _, message in self._reader.iter_messages(topics=[self.topic]):
+            count += int.from_bytes(message.data[:4], 'little')
+        return count
+
+    def _get_columnar_data(self, data: np.ndarray, start_time_ns: int, num_messages: int) -> int:
+        """
+        Decode columnar messages into data, skipping samples before start_time_ns.
+        :return: number of samples written to data
+        """
+        cnt = 0
+        # layout names are channel names (characters replaced like DataBroker.replace_name_chars), fields are schema
+        # names with "." replaced: compare both with all characters replaced
+        fields = {re.sub(r'[^a-zA-Z0-9_-]', '_', f): f for f in data.dtype.names if f != 'ts'}
+        columns = [(fields.get(re.sub(r'[^a-zA-Z0-9_-]', '_', field)), dtype) for field, dtype in self._columnar_layout]
+        # log time of a message is the timestamp of its first sample, later samples may be >= start_time_ns
+        for _, _, message in self._reader.iter_messages(topics=[self.topic]):
+            count = int.from_bytes(message.data[:4], 'little')
+            ts = np.frombuffer(message.data, dtype='<i8', count=count, offset=4)
+            if count == 0 or ts[-1] < start_time_ns:
+                continue
+            first = int(np.searchsorted(ts, start_time_ns)) if ts[0] < start_time_ns else 0
+            n = min(count - first, num_messages - cnt)
+            data['ts'][cnt:cnt + n] = ts[first:first + n]
+            offset = 4 + count * 8
+            for field, dtype in columns:
+                column = np.frombuffer(message.data, dtype=dtype, count=count, offset=offset)
+                offset += count * column.itemsize
+                if field is not None:
+                    data[field][cnt:cnt + n] = column[first:first + n]
+            cnt += n
+            if self._print_progress(cnt, num_messages):
+                break
+        return cnt
+
     def get_numpy_dtypes(self) -> List:
         return [self._np_dtype[d] for d in self._dtypes]
 
@@ -330,13 +388,19 @@ class McapTopic:
             if self._np_struct_format[k] == np.float64:
                 data[k] = np.nan
 
-        try:
-            ret_message, count_read = parse_mcap(data, str(self._mcap_path), self.topic, start_time_ns=start_time_ns,
-                                                 quiet=False if logger.level == logging.DEBUG else True)
-        except Exception as e:
-            logger.error(f'ERROR: EX parse_mcap {type(e).__name__}: {e}')
-            ret_message = None
-            count_read = 0
+        if self._columnar_layout is not None:
+            # binary columns are copied directly, no JSON parsing needed
+            ret_message = ''
+            count_read = self._get_columnar_data(data, start_time_ns, num_messages)
+        else:
+            try:
+                ret_message, count_read = parse_mcap(data, str(self._mcap_path), self.topic,
+                                                     start_time_ns=start_time_ns,
+                                                     quiet=False if logger.level == logging.DEBUG else True)
+            except Exception as e:
+                logger.error(f'ERROR: EX parse_mcap {type(e).__name__}: {e}')
+                ret_message = None
+                count_read = 0
 
         if ret_message is None or len(ret_message):
             logger.warning(f'parse_mcap returned: "{ret_message}" with count {count_read}')